@@ -0,0 +1,264 @@
+import os
+import math
+import time
+import asyncio
+import itertools
+import threading
+import logging
+from typing import Dict, Any
+
+from metrics import ADMISSION_WAIT_SECONDS, ADMISSION_REJECTED, ADMISSION_QUEUE_DEPTH, ADMISSION_ACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class Priority:
+    """Priority classes, lower runs first when slots free up."""
+    CHAT = 0
+    BATCH = 1
+    INGEST = 2
+
+    NAMES = {CHAT: 'chat', BATCH: 'batch', INGEST: 'ingest'}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; mapped to HTTP 429."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lease:
+    """A granted slot. Release is idempotent and safe from any thread."""
+
+    def __init__(self, controller: 'AdmissionController', tenant_id: str, priority: int):
+        self.controller = controller
+        self.tenant_id = tenant_id
+        self.priority = priority
+        self.started_at = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        self.controller._release(self)
+
+
+class _Ticket:
+    def __init__(self, tenant_id: str, priority: int, seq: int, loop, future):
+        self.tenant_id = tenant_id
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.lease = None
+
+
+def _resolve(future, value) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+class AdmissionController:
+    """
+    Global and per-tenant concurrency caps in front of the LLM service.
+
+    Requests over the caps wait in a bounded queue ordered by priority class
+    and arrival. When the queue (or a tenant's share of it) is full, or a
+    request waits longer than the queue timeout, the request is rejected with
+    a Retry-After hint instead of piling up behind a noisy tenant.
+
+    Slots are released from request handlers and from streaming generators
+    running in the threadpool, so state is guarded by a thread lock and
+    waiters are woken on their own event loop.
+    """
+
+    WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, max_concurrent: int, max_per_tenant: int, max_queue: int, max_queue_per_tenant: int,
+                 queue_timeout: float, max_concurrent_by_priority: Dict[int, int] = None):
+        self.max_concurrent = max_concurrent
+        self.max_per_tenant = max_per_tenant
+        self.max_queue = max_queue
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.queue_timeout = queue_timeout
+        self.max_concurrent_by_priority = max_concurrent_by_priority or {}
+
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self.waiters = []
+        self.active = 0
+        self.active_by_tenant = {}
+        self.active_by_priority = {}
+        self.queued_by_tenant = {}
+        self.avg_service_time = 1.0
+
+        self.admitted = {name: 0 for name in Priority.NAMES.values()}
+        self.rejected = {'queue_full': 0, 'tenant_queue_full': 0, 'queue_timeout': 0}
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(self.WAIT_BUCKETS) + 1)
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        return cls(
+            max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', '16')),
+            max_per_tenant=int(os.getenv('ADMISSION_MAX_PER_TENANT', '4')),
+            max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '64')),
+            max_queue_per_tenant=int(os.getenv('ADMISSION_MAX_QUEUE_PER_TENANT', '16')),
+            queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10')),
+            # Ingestion never takes every slot, so chat always has headroom
+            max_concurrent_by_priority={
+                Priority.INGEST: int(os.getenv('ADMISSION_MAX_INGEST', '4')),
+            },
+        )
+
+    def _has_capacity(self, tenant_id: str, priority: int) -> bool:
+        if self.active >= self.max_concurrent:
+            return False
+        if self.active_by_tenant.get(tenant_id, 0) >= self.max_per_tenant:
+            return False
+        priority_cap = self.max_concurrent_by_priority.get(priority)
+        if priority_cap is not None and self.active_by_priority.get(priority, 0) >= priority_cap:
+            return False
+        return True
+
+    def _grant(self, tenant_id: str, priority: int, waited: float) -> Lease:
+        self.active += 1
+        self.active_by_tenant[tenant_id] = self.active_by_tenant.get(tenant_id, 0) + 1
+        self.active_by_priority[priority] = self.active_by_priority.get(priority, 0) + 1
+        self.admitted[Priority.NAMES[priority]] += 1
+        self.wait_count += 1
+        self.wait_sum += waited
+        self.wait_max = max(self.wait_max, waited)
+        bucket = 0
+        while bucket < len(self.WAIT_BUCKETS) and waited > self.WAIT_BUCKETS[bucket]:
+            bucket += 1
+        self.wait_buckets[bucket] += 1
+        ADMISSION_ACTIVE.inc()
+        ADMISSION_WAIT_SECONDS.labels(priority=Priority.NAMES[priority]).observe(waited)
+        return Lease(self, tenant_id, priority)
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        self.waiters.remove(ticket)
+        remaining = self.queued_by_tenant.get(ticket.tenant_id, 1) - 1
+        if remaining:
+            self.queued_by_tenant[ticket.tenant_id] = remaining
+        else:
+            self.queued_by_tenant.pop(ticket.tenant_id, None)
+        ADMISSION_QUEUE_DEPTH.labels(priority=Priority.NAMES[ticket.priority]).dec()
+
+    def _dispatch(self) -> None:
+        """Hand freed slots to the best eligible waiters. Caller holds the lock."""
+        while self.waiters and self.active < self.max_concurrent:
+            eligible = [ticket for ticket in self.waiters
+                        if self._has_capacity(ticket.tenant_id, ticket.priority)]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda t: (t.priority, t.seq))
+            self._dequeue(ticket)
+            ticket.lease = self._grant(ticket.tenant_id, ticket.priority, time.monotonic() - ticket.enqueued_at)
+            ticket.loop.call_soon_threadsafe(_resolve, ticket.future, ticket.lease)
+
+    def _retry_after(self) -> int:
+        backlog = len(self.waiters) + self.active
+        return max(1, math.ceil(backlog * self.avg_service_time / max(self.max_concurrent, 1)))
+
+    async def acquire(self, tenant_id: str, priority: int = Priority.CHAT) -> Lease:
+        """
+        Wait for a slot for the tenant.
+
+        Args:
+            tenant_id (str): Tenant identifier
+            priority (int): One of the Priority classes
+
+        Returns:
+            Lease: The granted slot; call release() when the work is done
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._has_capacity(tenant_id, priority):
+                return self._grant(tenant_id, priority, 0.0)
+            if len(self.waiters) >= self.max_queue:
+                self.rejected['queue_full'] += 1
+                ADMISSION_REJECTED.labels(reason='queue_full').inc()
+                raise AdmissionRejected('Server is busy, please retry later', self._retry_after())
+            if self.queued_by_tenant.get(tenant_id, 0) >= self.max_queue_per_tenant:
+                self.rejected['tenant_queue_full'] += 1
+                ADMISSION_REJECTED.labels(reason='tenant_queue_full').inc()
+                raise AdmissionRejected('Too many concurrent requests for this tenant', self._retry_after())
+            ticket = _Ticket(tenant_id, priority, next(self._seq), loop, loop.create_future())
+            self.waiters.append(ticket)
+            self.queued_by_tenant[tenant_id] = self.queued_by_tenant.get(tenant_id, 0) + 1
+            ADMISSION_QUEUE_DEPTH.labels(priority=Priority.NAMES[priority]).inc()
+
+        try:
+            return await asyncio.wait_for(ticket.future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if ticket.lease is None:
+                    self._dequeue(ticket)
+                granted = ticket.lease
+            # The slot may have been granted just as we gave up
+            if granted is not None:
+                granted.release()
+            if isinstance(e, asyncio.TimeoutError):
+                with self._lock:
+                    self.rejected['queue_timeout'] += 1
+                    ADMISSION_REJECTED.labels(reason='queue_timeout').inc()
+                    retry_after = self._retry_after()
+                raise AdmissionRejected('Timed out waiting for capacity', retry_after)
+            raise
+
+    def _release(self, lease: Lease) -> None:
+        with self._lock:
+            if lease.released:
+                return
+            lease.released = True
+            self.active -= 1
+            ADMISSION_ACTIVE.dec()
+            for counts, key in ((self.active_by_tenant, lease.tenant_id), (self.active_by_priority, lease.priority)):
+                remaining = counts.get(key, 1) - 1
+                if remaining:
+                    counts[key] = remaining
+                else:
+                    counts.pop(key, None)
+            service_time = time.monotonic() - lease.started_at
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * service_time
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued_by_priority = {name: 0 for name in Priority.NAMES.values()}
+            for ticket in self.waiters:
+                queued_by_priority[Priority.NAMES[ticket.priority]] += 1
+            cumulative = list(itertools.accumulate(self.wait_buckets))
+            return {
+                'active': self.active,
+                'queue_depth': len(self.waiters),
+                'queue_depth_by_priority': queued_by_priority,
+                'admitted': dict(self.admitted),
+                'rejected': dict(self.rejected),
+                'wait_seconds': {
+                    'count': self.wait_count,
+                    'sum': round(self.wait_sum, 6),
+                    'max': round(self.wait_max, 6),
+                    'buckets': {
+                        **{str(le): count for le, count in zip(self.WAIT_BUCKETS, cumulative)},
+                        '+Inf': cumulative[-1],
+                    },
+                },
+                'avg_service_seconds': round(self.avg_service_time, 3),
+                'limits': {
+                    'max_concurrent': self.max_concurrent,
+                    'max_per_tenant': self.max_per_tenant,
+                    'max_queue': self.max_queue,
+                    'max_queue_per_tenant': self.max_queue_per_tenant,
+                    'queue_timeout': self.queue_timeout,
+                },
+            }
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Compare the HTML extraction backends over a corpus of saved pages.
+
+Reports pages per second, extracted characters and the number of chunks the
+ingestion splitter would embed for each backend, relative to the original
+BeautifulSoup extraction:
+
+    python bench_html_extract.py --pages ./saved_pages --repeat 3
+
+Save pages with e.g. `curl -o saved_pages/page1.html https://docs.example.com/`.
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from html_extractor import EXTRACTORS
+
+
+def load_pages(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*.htm*'), recursive=True)):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            pages.append(f.read())
+    return pages
+
+
+def run_backend(name, pages, repeat, splitter):
+    extract = EXTRACTORS[name]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        texts = [extract(page) for page in pages]
+    elapsed = time.perf_counter() - started
+    return {
+        'backend': name,
+        'pages_per_sec': round(len(pages) * repeat / elapsed, 1) if elapsed > 0 else None,
+        'chars': sum(len(text) for text in texts),
+        'chunks': sum(len(splitter.split_text(text)) for text in texts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', required=True, help='Directory of saved .html pages')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backends', default=','.join(EXTRACTORS))
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        parser.error(f"No .html pages found in {args.pages}")
+    print(json.dumps({'pages': len(pages), 'bytes': sum(len(page) for page in pages)}))
+
+    # Same chunking as load_url
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    results = [run_backend(name, pages, args.repeat, splitter) for name in args.backends.split(',')]
+    baseline = next((result for result in results if result['backend'] == 'bs4'), None)
+    for result in results:
+        if baseline and baseline['chunks']:
+            result['chunk_reduction'] = round(1 - result['chunks'] / baseline['chunks'], 3)
+            result['speedup'] = round(result['pages_per_sec'] / baseline['pages_per_sec'], 2)
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Measure streaming behaviour of /ask_question_stream end to end.
+
+Reports time-to-first-byte, time-to-first-token, frames per second and
+frame sizes. Point it at nginx to check that the proxy does not buffer:
+
+    python bench_sse.py --url http://localhost/api/llm/ask_question_stream \\
+        --tenant-id <tenant> --question "What is in my documents?" --runs 5
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import requests
+
+
+def run_once(url, tenant_id, question):
+    started = time.perf_counter()
+    first_byte = None
+    first_token = None
+    frames = 0
+    frame_bytes = 0
+    pending = b''
+
+    with requests.post(url, json={'tenant_id': tenant_id, 'question': question},
+                       headers={'X-Tenant-ID': tenant_id}, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for data in response.iter_content(chunk_size=None):
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now
+            pending += data
+            while b'\n\n' in pending:
+                frame, pending = pending.split(b'\n\n', 1)
+                for line in frame.split(b'\n'):
+                    if not line.startswith(b'data: '):
+                        continue
+                    payload = json.loads(line[6:])
+                    if payload.get('type') == 'token':
+                        frames += 1
+                        frame_bytes += len(frame)
+                        if first_token is None:
+                            first_token = now
+    finished = time.perf_counter()
+
+    streaming_time = finished - (first_token or finished)
+    return {
+        'ttfb_ms': (first_byte - started) * 1000 if first_byte else None,
+        'ttft_ms': (first_token - started) * 1000 if first_token else None,
+        'total_ms': (finished - started) * 1000,
+        'frames': frames,
+        'frames_per_sec': frames / streaming_time if streaming_time > 0 else float(frames),
+        'avg_frame_bytes': frame_bytes / frames if frames else 0,
+        'content_type': response.headers.get('content-type'),
+        'upstream': response.headers.get('x-chatminds-upstream'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost/api/llm/ask_question_stream')
+    parser.add_argument('--tenant-id', required=True)
+    parser.add_argument('--question', default='Summarize my documents')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for i in range(args.runs):
+        # Vary the question so runs are not coalesced with each other
+        result = run_once(args.url, args.tenant_id, f"{args.question} ({i + 1})")
+        results.append(result)
+        print(json.dumps(result))
+
+    def p50(field):
+        values = [r[field] for r in results if r[field] is not None]
+        return round(statistics.median(values), 1) if values else None
+
+    print(json.dumps({
+        'runs': len(results),
+        'p50_ttfb_ms': p50('ttfb_ms'),
+        'p50_ttft_ms': p50('ttft_ms'),
+        'p50_total_ms': p50('total_ms'),
+        'p50_frames_per_sec': p50('frames_per_sec'),
+        'p50_avg_frame_bytes': p50('avg_frame_bytes'),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Compare the flat index with Chroma across tenant sizes.
+
+Builds one synthetic tenant per size and backend from random unit vectors,
+then measures each in a fresh process: open time (including the first query,
+which is when Chroma loads its HNSW index), p50/p99 query latency and the
+resident memory the open index adds:
+
+    python bench_vector_store.py --sizes 1000,5000,20000,50000 --queries 200
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from flat_index import FlatIndex
+
+COLLECTION = 'langchain'  # the collection name the LangChain wrapper uses
+BUILD_BATCH = 5000
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build(root, size, dimensions, backends):
+    rng = np.random.default_rng(size)
+    paths = {backend: os.path.join(root, f'{backend}-{size}') for backend in backends}
+    flat = FlatIndex(paths['flat']) if 'flat' in paths else None
+    collection = None
+    if 'chroma' in paths:
+        import chromadb
+        collection = chromadb.PersistentClient(path=paths['chroma']).get_or_create_collection(COLLECTION)
+    for start in range(0, size, BUILD_BATCH):
+        rows = range(start, min(size, start + BUILD_BATCH))
+        vectors = rng.normal(size=(len(rows), dimensions)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f'chunk-{row}' for row in rows]
+        texts = [f'chunk {row} '.ljust(500, '.') for row in rows]
+        metadatas = [{'document_id': f'doc-{row // 50}', 'chunk_id': row} for row in rows]
+        if flat is not None:
+            flat.append(vectors, texts, metadatas, ids)
+        if collection is not None:
+            collection.add(ids=ids, embeddings=vectors.tolist(), documents=texts, metadatas=metadatas)
+    return paths
+
+
+def measure(backend, path, queries, dimensions, k):
+    """Runs in a child process so open time and memory are not shared between runs."""
+    rng = np.random.default_rng(0)
+    query_vectors = rng.normal(size=(queries + 1, dimensions)).astype(np.float32)
+    baseline = rss_mb()
+
+    started = time.perf_counter()
+    if backend == 'flat':
+        index = FlatIndex(path)
+        search = lambda vector: index.search(vector, k)
+    else:
+        import chromadb
+        collection = chromadb.PersistentClient(path=path).get_collection(COLLECTION)
+        search = lambda vector: collection.query(query_embeddings=[vector.tolist()], n_results=k)
+    search(query_vectors[0])
+    open_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    for vector in query_vectors[1:]:
+        started = time.perf_counter()
+        search(vector)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'open_ms': round(open_ms, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+        'rss_mb': round(rss_mb() - baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,5000,20000,50000')
+    parser.add_argument('--dimensions', type=int, default=1536)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--backends', default='flat,chroma')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.path, args.queries, args.dimensions, args.k)))
+        return
+
+    backends = args.backends.split(',')
+    root = tempfile.mkdtemp(prefix='bench-vector-store-')
+    try:
+        for size in (int(size) for size in args.sizes.split(',')):
+            paths = build(root, size, args.dimensions, backends)
+            for backend, path in paths.items():
+                output = subprocess.run(
+                    [sys.executable, __file__, '--measure', backend, '--path', path, '--queries', str(args.queries),
+                     '--dimensions', str(args.dimensions), '--k', str(args.k)],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                disk_mb = sum(os.path.getsize(os.path.join(directory, name))
+                              for directory, _, names in os.walk(path) for name in names) / 1024 / 1024
+                print(json.dumps({'backend': backend, 'chunks': size, 'disk_mb': round(disk_mb, 1), **result}))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import time
+import logging
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+import tracing
+from usage import count_tokens, DEFAULT_ANSWER_MODEL
+from metrics import (
+    RETRIEVAL_SECONDS, CONDENSE_SECONDS, TIME_TO_FIRST_TOKEN_SECONDS, GENERATION_SECONDS,
+    GENERATION_TOKENS_PER_SECOND, ERRORS
+)
+
+if TYPE_CHECKING:
+    from usage import UsageTracker
+
+# LangChain callback handlers. This module imports langchain, so it is only
+# loaded together with the rest of the model stack.
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a chain run to stop an answer nobody is reading."""
+
+
+class CancellationCallbackHandler(BaseCallbackHandler):
+    """
+    Stops a chain run once cancelled is set. Passed in the invoke config, it
+    sees every step of the run: it raises at the next chain, condense,
+    retriever or LLM start, when retrieval returns, and on every streamed
+    token, which aborts the provider stream.
+    """
+
+    # Errors of this handler abort the run instead of being logged
+    raise_error = True
+
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def _check(self, *args, **kwargs) -> None:
+        if self.cancelled.is_set():
+            raise GenerationCancelled()
+
+    on_chain_start = _check
+    on_retriever_start = _check
+    on_retriever_end = _check
+    on_llm_start = _check
+    on_chat_model_start = _check
+    on_llm_new_token = _check
+
+
+class StreamingCallbackHandler(BaseCallbackHandler):
+    def __init__(self, token_queue=None):
+        self.tokens = []
+        self.token_queue = token_queue
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.tokens.append(token)
+        if self.token_queue is not None and token:
+            self.token_queue.put(token)
+    
+    def get_tokens(self):
+        return self.tokens
+
+
+class SourcesCallbackHandler(BaseCallbackHandler):
+    """
+    Hands the documents of each outermost retriever run to on_sources as
+    soon as retrieval returns, long before the answer is generated. Nested
+    retrievers (the base of a compression retriever) are skipped, so the
+    documents are the ones the answer prompt is built from.
+    """
+
+    def __init__(self, on_sources):
+        self.on_sources = on_sources
+        self.parents = {}
+
+    @property
+    def ignore_llm(self) -> bool:
+        return True
+
+    @property
+    def ignore_chain(self) -> bool:
+        return True
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs) -> None:
+        self.parents[run_id] = parent_run_id
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs) -> None:
+        if self.parents.pop(run_id, None) not in self.parents:
+            self.on_sources(documents)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs) -> None:
+        self.parents.pop(run_id, None)
+
+
+class StageTimer(BaseCallbackHandler):
+    """
+    Records per-stage chain latencies into metrics.
+
+    A 'retrieval' timer is passed in the invoke config and only listens to
+    retriever events; 'condense' and 'generation' timers are attached to
+    their own LLM calls with with_config(), so each LLM call is attributed
+    to its stage even though the underlying clients are shared.
+    Each stage run is also recorded as a trace span. A retriever nested in
+    another (the base of a compression retriever) is part of the outer run.
+    """
+
+    def __init__(self, stage, tier, mode='sync', started=None):
+        self.stage = stage
+        self.tier = tier
+        self.mode = mode
+        self.started = started or time.perf_counter()
+        self.run_started = {}
+        self.spans = {}
+        self.tokens = 0
+        self.first_token_at = None
+
+    @property
+    def ignore_llm(self) -> bool:
+        return self.stage == 'retrieval'
+
+    @property
+    def ignore_chain(self) -> bool:
+        return True
+
+    def _start(self, run_id) -> None:
+        self.run_started[run_id] = time.perf_counter()
+        self.spans[run_id] = tracing.start_span(f'chain.{self.stage}', tier=self.tier, mode=self.mode)
+
+    def _end_span(self, run_id, error=None) -> None:
+        span = self.spans.pop(run_id, None)
+        if span is not None:
+            tracing.end_span(span, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs) -> None:
+        if parent_run_id not in self.run_started:
+            self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs) -> None:
+        self._end_span(run_id)
+        started = self.run_started.pop(run_id, None)
+        if started is not None:
+            RETRIEVAL_SECONDS.labels(tier=self.tier).observe(time.perf_counter() - started)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._start(run_id)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.tokens += 1
+        if self.first_token_at is None and self.stage == 'generation':
+            self.first_token_at = time.perf_counter()
+            TIME_TO_FIRST_TOKEN_SECONDS.labels(tier=self.tier).observe(self.first_token_at - self.started)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self._end_span(run_id)
+        started = self.run_started.pop(run_id, None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if self.stage == 'condense':
+            CONDENSE_SECONDS.labels(tier=self.tier).observe(elapsed)
+            return
+        GENERATION_SECONDS.labels(mode=self.mode, tier=self.tier).observe(elapsed)
+        tokens = self.tokens
+        if not tokens:
+            token_usage = (response.llm_output or {}).get('token_usage') or {}
+            tokens = token_usage.get('completion_tokens', 0)
+        if tokens and elapsed > 0:
+            GENERATION_TOKENS_PER_SECOND.labels(mode=self.mode, tier=self.tier).observe(tokens / elapsed)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._end_span(run_id, error)
+        self.run_started.pop(run_id, None)
+        if not isinstance(error, GenerationCancelled):
+            ERRORS.labels(operation=self.stage, tier=self.tier).inc()
+
+    def on_retriever_error(self, error, *, run_id, **kwargs) -> None:
+        self._end_span(run_id, error)
+        if self.run_started.pop(run_id, None) is not None and not isinstance(error, GenerationCancelled):
+            ERRORS.labels(operation='retrieval', tier=self.tier).inc()
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Records token usage of every LLM call it sees.
+
+    Bound to an LLM call like StageTimer, so each call is charged to
+    the tenant under the given operation. Provider-reported usage is used
+    when present; streamed responses without it are counted with tiktoken.
+    A cancelled stream is charged for its prompt and the tokens streamed
+    before the cancel, which the provider bills as well. Query embeddings
+    are charged by DocumentService.embed_queries, which retrievers embed
+    through.
+    """
+
+    def __init__(self, tracker: 'UsageTracker', tenant_id: str, operation: str):
+        self.tracker = tracker
+        self.tenant_id = tenant_id
+        self.operation = operation
+        self.prompts = {}
+        self.models = {}
+        self.streamed = {}
+
+    @property
+    def ignore_chain(self) -> bool:
+        return True
+
+    def _start(self, run_id, prompts: List[str], invocation_params: Optional[Dict[str, Any]]) -> None:
+        params = invocation_params or {}
+        self.prompts[run_id] = prompts
+        self.models[run_id] = params.get('model_name') or params.get('model')
+
+    def on_llm_start(self, serialized, prompts, *, run_id, invocation_params=None, **kwargs) -> None:
+        self._start(run_id, list(prompts), invocation_params)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, **kwargs) -> None:
+        self._start(run_id, [str(message.content) for batch in messages for message in batch], invocation_params)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        prompts = self.prompts.pop(run_id, [])
+        self.streamed.pop(run_id, None)
+        requested_model = self.models.pop(run_id, None)
+        llm_output = response.llm_output or {}
+        model = llm_output.get('model_name') or requested_model or DEFAULT_ANSWER_MODEL
+        token_usage = llm_output.get('token_usage') or {}
+        prompt_tokens = token_usage.get('prompt_tokens')
+        completion_tokens = token_usage.get('completion_tokens')
+        if not prompt_tokens:
+            prompt_tokens = count_tokens(prompts)
+        if not completion_tokens:
+            completion_tokens = count_tokens(
+                [generation.text for generations in response.generations for generation in generations]
+            )
+        self.tracker.record(self.tenant_id, model, self.operation, prompt_tokens or 0, completion_tokens or 0)
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs) -> None:
+        self.streamed.setdefault(run_id, []).append(token)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        prompts = self.prompts.pop(run_id, [])
+        model = self.models.pop(run_id, None) or DEFAULT_ANSWER_MODEL
+        streamed = self.streamed.pop(run_id, [])
+        if isinstance(error, GenerationCancelled):
+            self.tracker.record(self.tenant_id, model, self.operation, count_tokens(prompts),
+                                count_tokens([''.join(streamed)]) if streamed else 0)
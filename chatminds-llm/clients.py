@@ -0,0 +1,174 @@
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from metrics import OPENAI_HTTP_REQUESTS, OPENAI_HTTP_CONNECTIONS
+from usage import collecting_usage, add_reported_usage
+
+# Long-lived OpenAI clients. Every chat and embeddings client shares one
+# keep-alive connection pool (one sync, one async), so questions reuse open
+# TLS connections instead of handshaking per request. Clients hold no
+# per-request state; callbacks are passed in the run config or bound with
+# with_config(). This module imports langchain, so it is only loaded
+# together with the rest of the model stack.
+
+
+class _ConnectionTrace:
+    """httpcore trace hook noting whether a request had to open a connection."""
+
+    def __init__(self):
+        self.new_connection = False
+
+    def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == 'connection.connect_tcp.complete':
+            self.new_connection = True
+
+
+class _AsyncConnectionTrace(_ConnectionTrace):
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        super().__call__(event_name, info)
+
+
+def _record_connection(response: httpx.Response, client: str) -> None:
+    trace = response.request.extensions.get('trace')
+    if not isinstance(trace, _ConnectionTrace):
+        return
+    if trace.new_connection:
+        OPENAI_HTTP_CONNECTIONS.labels(client=client).inc()
+    OPENAI_HTTP_REQUESTS.labels(client=client, connection='new' if trace.new_connection else 'reused').inc()
+
+
+def _reports_usage(response: httpx.Response) -> bool:
+    """Whether the response is an embeddings result whose usage someone is collecting"""
+    return (collecting_usage() and response.is_success
+            and response.request.url.path.endswith('/embeddings'))
+
+
+def _record_usage(response: httpx.Response) -> None:
+    try:
+        add_reported_usage(response.json().get('usage'))
+    except ValueError:
+        pass
+
+
+def _on_request(request: httpx.Request) -> None:
+    request.extensions['trace'] = _ConnectionTrace()
+
+
+def _on_response(response: httpx.Response) -> None:
+    _record_connection(response, 'sync')
+    if _reports_usage(response):
+        response.read()
+        _record_usage(response)
+
+
+async def _on_async_request(request: httpx.Request) -> None:
+    request.extensions['trace'] = _AsyncConnectionTrace()
+
+
+async def _on_async_response(response: httpx.Response) -> None:
+    _record_connection(response, 'async')
+    if _reports_usage(response):
+        await response.aread()
+        _record_usage(response)
+
+
+class ClientRegistry:
+    """
+    Shared chat and embeddings clients keyed by model and parameters, over
+    one tuned connection pool per concurrency model.
+    """
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float,
+                 connect_timeout: float, read_timeout: float, max_retries: int):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self._http_client = None
+        self._http_async_client = None
+        self.chat_clients = {}
+        self.embedding_clients = {}
+
+    @classmethod
+    def from_env(cls) -> 'ClientRegistry':
+        return cls(
+            max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '100')),
+            max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20')),
+            keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY_SECONDS', '60')),
+            connect_timeout=float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', '5')),
+            read_timeout=float(os.getenv('LLM_TIMEOUT', '60')),
+            max_retries=int(os.getenv('OPENAI_MAX_RETRIES', '2')),
+        )
+
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            with self.lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        limits=self.limits, timeout=self.timeout,
+                        event_hooks={'request': [_on_request], 'response': [_on_response]}
+                    )
+        return self._http_client
+
+    def http_async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            with self.lock:
+                if self._http_async_client is None:
+                    self._http_async_client = httpx.AsyncClient(
+                        limits=self.limits, timeout=self.timeout,
+                        event_hooks={'request': [_on_async_request], 'response': [_on_async_response]}
+                    )
+        return self._http_async_client
+
+    @staticmethod
+    def _key(model: str, params: Dict[str, Any]) -> Tuple:
+        return (model,) + tuple(sorted(params.items()))
+
+    def chat(self, model: str, temperature: float = 0, streaming: bool = False, **params) -> ChatOpenAI:
+        """Shared chat client for model and parameters, created on first use."""
+        params.update(temperature=temperature, streaming=streaming)
+        key = self._key(model, params)
+        client = self.chat_clients.get(key)
+        if client is None:
+            http_client, http_async_client = self.http_client(), self.http_async_client()
+            with self.lock:
+                client = self.chat_clients.get(key)
+                if client is None:
+                    client = ChatOpenAI(model_name=model, http_client=http_client,
+                                        http_async_client=http_async_client, timeout=self.timeout,
+                                        max_retries=self.max_retries, **params)
+                    self.chat_clients[key] = client
+        return client
+
+    def embeddings(self, model: str, **params) -> OpenAIEmbeddings:
+        """Shared embeddings client for model and parameters, created on first use."""
+        key = self._key(model, params)
+        client = self.embedding_clients.get(key)
+        if client is None:
+            http_client, http_async_client = self.http_client(), self.http_async_client()
+            with self.lock:
+                client = self.embedding_clients.get(key)
+                if client is None:
+                    client = OpenAIEmbeddings(model=model, http_client=http_client,
+                                              http_async_client=http_async_client, timeout=self.timeout,
+                                              max_retries=self.max_retries, **params)
+                    self.embedding_clients[key] = client
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'chat_clients': len(self.chat_clients),
+            'embedding_clients': len(self.embedding_clients),
+            'max_connections': self.limits.max_connections,
+            'max_keepalive_connections': self.limits.max_keepalive_connections,
+            'keepalive_expiry': self.limits.keepalive_expiry,
+        }
+
+
+client_registry = ClientRegistry.from_env()
@@ -1,10 +1,15 @@
 import os
 import re
 import tempfile
-from typing import List, Dict, Any
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain.schema import Document
+from typing import List, Dict, Any, TYPE_CHECKING
 import logging
+import time
+from metrics import tenant_tier, INGEST_STAGE_SECONDS
+import tracing
+
+# langchain is imported where it is used so that importing this module stays cheap
+if TYPE_CHECKING:
+    from langchain.schema import Document
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -63,37 +68,47 @@ class DocumentProcessor:
         return text
     
     @staticmethod
-    def extract_and_clean_content(file_path: str, file_type: str) -> str:
+    def extract_and_clean_content(file_path: str, file_type: str, tenant_id: str = None) -> str:
         """
         Extract and clean content from a file.
         
         Args:
             file_path (str): Path to the file
             file_type (str): MIME type of the file
+            tenant_id (str): Tenant identifier, used to label stage timings
             
         Returns:
             str: Cleaned text content
         """
+        from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+
         try:
-            content = ""
-            
-            if 'text/plain' in file_type:
-                loader = TextLoader(file_path, encoding='utf-8')
-                documents = loader.load()
-                content = "\n".join([doc.page_content for doc in documents])
+            tier = tenant_tier(tenant_id)
+            extract_started = time.perf_counter()
+            with tracing.span('ingest.extract', tenant_id=tenant_id, file_type=file_type):
+                content = ""
+            
+                if 'text/plain' in file_type:
+                    loader = TextLoader(file_path, encoding='utf-8')
+                    documents = loader.load()
+                    content = "\n".join([doc.page_content for doc in documents])
                 
-            elif 'application/pdf' in file_type:
-                loader = PyPDFLoader(file_path)
-                documents = loader.load()
-                content = "\n".join([doc.page_content for doc in documents])
+                elif 'application/pdf' in file_type:
+                    loader = PyPDFLoader(file_path)
+                    documents = loader.load()
+                    content = "\n".join([doc.page_content for doc in documents])
                 
-            elif 'application/msword' in file_type or 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' in file_type:
-                loader = Docx2txtLoader(file_path)
-                documents = loader.load()
-                content = "\n".join([doc.page_content for doc in documents])
-            
+                elif 'application/msword' in file_type or 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' in file_type:
+                    loader = Docx2txtLoader(file_path)
+                    documents = loader.load()
+                    content = "\n".join([doc.page_content for doc in documents])
+
+            INGEST_STAGE_SECONDS.labels(stage='extract', tier=tier).observe(time.perf_counter() - extract_started)
+
             # Clean the extracted content
-            cleaned_content = DocumentProcessor.clean_text(content)
+            with tracing.span('ingest.clean', tenant_id=tenant_id), \
+                    INGEST_STAGE_SECONDS.labels(stage='clean', tier=tier).time():
+                cleaned_content = DocumentProcessor.clean_text(content)
             
             logger.info(f"Successfully extracted and cleaned content from {file_path}")
             return cleaned_content
@@ -127,7 +142,7 @@ class DocumentProcessor:
     
     @staticmethod
     def create_documents_from_cleaned_content(content: str, document_id: str, tenant_id: str, 
-                                            original_file_name: str = None) -> List[Document]:
+                                            original_file_name: str = None) -> List['Document']:
         """
         Create LangChain Document objects from cleaned content.
         
@@ -140,6 +155,8 @@ class DocumentProcessor:
         Returns:
             List[Document]: List of Document objects
         """
+        from langchain.schema import Document
+
         try:
             # Create a single document with metadata
             metadata = {
@@ -163,7 +180,7 @@ class DocumentProcessor:
     
     @staticmethod
     def process_document(raw_file_path: str, clean_file_path: str, file_type: str, 
-                        document_id: str, tenant_id: str, original_file_name: str = None) -> List[Document]:
+                        document_id: str, tenant_id: str, original_file_name: str = None) -> List['Document']:
         """
         Full document processing pipeline: extract, clean, save, and create Document objects.
         
@@ -180,7 +197,7 @@ class DocumentProcessor:
         """
         try:
             # Extract and clean content
-            cleaned_content = DocumentProcessor.extract_and_clean_content(raw_file_path, file_type)
+            cleaned_content = DocumentProcessor.extract_and_clean_content(raw_file_path, file_type, tenant_id)
             
             # Save cleaned content
             DocumentProcessor.save_cleaned_content(cleaned_content, clean_file_path)
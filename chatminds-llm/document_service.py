@@ -1,34 +1,102 @@
 import os
-import requests
 from urllib.parse import urlparse
-import bs4
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.chains import RetrievalQA, ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory, ConversationTokenBufferMemory
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.schema import SystemMessage
-from langchain.callbacks.base import BaseCallbackHandler
-from openai import OpenAI
 from threading import Timer
 from dotenv import load_dotenv
-import chromadb
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import uuid
+import json
+import base64
+import hashlib
+import threading
+import queue
+import time
+import contextvars
+from collections import OrderedDict
 from document_processor import DocumentProcessor
-import asyncio
-from typing import Any, Dict, List
+from vector_store_writer import VectorStoreWriter
+from url_sources import UrlSources
+import html_extractor
+from single_flight import SingleFlight
+import tracing
+import profiling
+import startup
+from warmup import access_log
+from usage import usage_tracker, reported_usage, embedding_tokens
+from metrics import (
+    tenant_tier, INTENT_FASTPATH_SECONDS, INGEST_STAGE_SECONDS, CACHE_REQUESTS, ERRORS, URL_FETCHES,
+    TIME_TO_SOURCES_SECONDS, ANSWERS_CANCELLED, CANCELLED_TOKENS_SAVED
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
 persist_directory = './data'
-key = os.environ["OPENAI_API_KEY"]
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Reduced output size of the embedding model for new tenants (unset keeps the
+# native 1536); existing tenants keep the size their vectors were embedded with
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS') or 0) or None
+ANSWER_MODEL = 'gpt-4o-mini'
+RETRIEVER_K = 3
+# Retrieved chunks are trimmed to their most relevant sentences before the
+# answer prompt ('none' passes them through whole)
+CONTEXT_COMPRESSION = os.getenv('CONTEXT_COMPRESSION', 'extractive')
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '400'))
+SOURCE_SNIPPET_CHARS = 300
+BUDGET_EXCEEDED_RESPONSE = ("This workspace has reached its usage budget, so I can only repeat answers to "
+                            "questions that were asked before. Please try again later or contact your administrator.")
+
+# The model stack (langchain, the vector stores, the OpenAI clients, HTTP and
+# HTML libraries) takes seconds to import, so it is loaded on first use
+# rather than with this module; /health and /metrics never need it.
+_model_stack_loaded = False
+_model_stack_lock = threading.Lock()
+
+
+def load_model_stack():
+    """Import the model stack into this module's globals, once."""
+    global _model_stack_loaded, requests, BeautifulSoup, PyPDFLoader, TextLoader, Docx2txtLoader
+    global RecursiveCharacterTextSplitter, vector_stores, ConversationalRetrievalChain, ConversationBufferMemory
+    global ConversationTokenBufferMemory, client_registry, get_openai_callback, TwoStageRetriever, SimilarityRetriever
+    global ContextualCompressionRetriever, ExtractiveCompressor
+    global StreamingCallbackHandler, StageTimer, UsageCallbackHandler, SourcesCallbackHandler, GenerationCancelled
+    global CancellationCallbackHandler
+    if _model_stack_loaded:
+        return
+    with _model_stack_lock:
+        if _model_stack_loaded:
+            return
+        with startup.timed_import('requests'):
+            import requests
+        with startup.timed_import('bs4'):
+            from bs4 import BeautifulSoup
+        with startup.timed_import('langchain'):
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            from langchain.chains import ConversationalRetrievalChain
+            from langchain.memory import ConversationBufferMemory, ConversationTokenBufferMemory
+            from langchain.retrievers import ContextualCompressionRetriever
+        with startup.timed_import('langchain_community'):
+            from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+            from langchain_community.callbacks import get_openai_callback
+        with startup.timed_import('vector_stores'):
+            import vector_stores
+            from retrievers import TwoStageRetriever, SimilarityRetriever, ExtractiveCompressor
+        with startup.timed_import('langchain_openai'):
+            from clients import client_registry
+        with startup.timed_import('callbacks'):
+            from callbacks import (
+                StreamingCallbackHandler, StageTimer, UsageCallbackHandler, SourcesCallbackHandler, GenerationCancelled,
+                CancellationCallbackHandler
+            )
+        _model_stack_loaded = True
+    startup.mark('model_stack_loaded')
+
+
+def get_embeddings(dimensions=None):
+    """Shared embeddings client, created on first use so a missing API key fails requests, not startup"""
+    load_model_stack()
+    if dimensions:
+        return client_registry.embeddings(EMBEDDING_MODEL, dimensions=dimensions)
+    return client_registry.embeddings(EMBEDDING_MODEL)
 
 # Custom prompt template for better responses
 CHATMINDS_PROMPT_TEMPLATE = """You are ChatMinds AI, an intelligent document assistant. Your primary role is to help users understand and find information from their uploaded documents.
@@ -46,19 +114,21 @@ Question: {question}
 
 Answer:"""
 
-class StreamingCallbackHandler(BaseCallbackHandler):
-    def __init__(self):
-        self.tokens = []
-        
-    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
-        self.tokens.append(token)
-    
-    def get_tokens(self):
-        return self.tokens
-
 class DocumentService:  
     memories = {} 
     clear_memory_timers = {}  # Tenant-wise clear_memory_timer
+    single_flight = SingleFlight()  # Shares identical in-flight questions
+    vectordbs = {}  # Tenant-wise open vector stores, shared by chat and search
+    vectordbs_lock = threading.Lock()
+    vectordb_generations = {}  # Tenant-wise on-disk generation each open store was opened at
+    document_indexes = {}  # Tenant-wise document centroid indexes for two-stage retrieval
+    answer_tokens_estimate = 250.0  # Running mean of streamed answer length, to estimate tokens saved by cancelling
+    query_embeddings = OrderedDict()  # LRU of recent query embeddings, by dimensions and query
+    query_embeddings_lock = threading.Lock()
+    QUERY_EMBEDDING_CACHE_SIZE = 2048
+    answers = OrderedDict()  # LRU of recent answers, served when a tenant is over budget
+    answers_lock = threading.Lock()
+    ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1024'))
 
     @staticmethod
     def is_greeting(question):
@@ -122,6 +192,22 @@ class DocumentService:
         else:
             return "I'm ChatMinds AI, your document assistant. I'm here to help you find information and answer questions about your uploaded documents. What would you like to know?"
 
+    @staticmethod
+    def detect_intent(question, tenant_id=None):
+        """Classify questions answerable without the LLM: 'greeting', 'conversational' or None"""
+        started = time.perf_counter()
+        with tracing.span('intent.detect') as span:
+            if DocumentService.is_greeting(question):
+                intent = 'greeting'
+            elif DocumentService.is_conversational_question(question):
+                intent = 'conversational'
+            else:
+                intent = None
+            span.set_attribute('chatminds.intent', intent or 'none')
+        INTENT_FASTPATH_SECONDS.labels(intent=intent or 'none', tier=tenant_tier(tenant_id)).observe(
+            time.perf_counter() - started)
+        return intent
+
     @staticmethod
     def get_greeting_response():
         """Return a simple greeting response without using LLM"""
@@ -135,22 +221,254 @@ class DocumentService:
         ]
         return random.choice(responses)
 
+    @staticmethod
+    def get_vectordb(tenant_id, touch=True):
+        """
+        Return the tenant's open vector store, opening it on first use and
+        reopening it once a writer, possibly on another replica, changed it
+        """
+        load_model_stack()
+        if touch:
+            access_log.touch(tenant_id)
+        tenant_directory = os.path.join(persist_directory, tenant_id)
+        generation = vector_stores.generation(tenant_directory)
+        vectordb = DocumentService._current_vectordb(tenant_id, generation)
+        CACHE_REQUESTS.labels(cache='vector_store', result='hit' if vectordb is not None else 'miss').inc()
+        if vectordb is None:
+            with DocumentService.vectordbs_lock:
+                vectordb = DocumentService._current_vectordb(tenant_id, generation)
+                if vectordb is None:
+                    with tracing.span('vector_store.open', tenant_id=tenant_id):
+                        vectordb = vector_stores.open_store(tenant_directory,
+                                                            DocumentService.tenant_embeddings(tenant_id))
+                    # A commit after the generation was read reopens the store again
+                    DocumentService.vectordbs[tenant_id] = vectordb
+                    DocumentService.vectordb_generations[tenant_id] = generation
+        return vectordb
+
+    @staticmethod
+    def _current_vectordb(tenant_id, generation):
+        """The tenant's open vector store if nothing changed it on disk since it was opened"""
+        vectordb = DocumentService.vectordbs.get(tenant_id)
+        if vectordb is None or DocumentService.vectordb_generations.get(tenant_id) != generation:
+            return None
+        # A tenant promoted from the flat index to Chroma is reopened
+        if isinstance(vectordb, vector_stores.FlatVectorStore) and vectordb.promoted():
+            return None
+        return vectordb
+
+    @staticmethod
+    def tenant_embeddings(tenant_id):
+        """Embeddings client producing vectors of the size the tenant's index holds"""
+        load_model_stack()
+        tenant_directory = os.path.join(persist_directory, tenant_id)
+        return get_embeddings(vector_stores.embedding_dimensions(tenant_directory, EMBEDDING_DIMENSIONS))
+
+    @staticmethod
+    def get_retriever(tenant_id, k):
+        """
+        Chunk retriever for the tenant: two-stage (nearest documents, then
+        their chunks) once the tenant has enough documents, plain similarity
+        search otherwise, with the chunks compressed to CONTEXT_TOKEN_BUDGET.
+        The query is embedded through embed_queries, so repeated questions
+        reuse the cached vector and provider calls are charged to the tenant.
+        """
+        vectordb = DocumentService.get_vectordb(tenant_id)
+        embed = lambda texts: DocumentService.embed_queries(texts, tenant_id)
+        document_index = DocumentService.document_indexes.get(tenant_id)
+        if document_index is None:
+            document_index = DocumentService.document_indexes.setdefault(
+                tenant_id, vector_stores.document_index(os.path.join(persist_directory, tenant_id)))
+        if len(document_index) >= vector_stores.TWO_STAGE_MIN_DOCUMENTS:
+            retriever = TwoStageRetriever(vectorstore=vectordb, document_index=document_index, embed=embed, k=k,
+                                          documents_k=vector_stores.TWO_STAGE_DOCUMENTS)
+        else:
+            retriever = SimilarityRetriever(vectorstore=vectordb, embed=embed, k=k)
+        if CONTEXT_COMPRESSION != 'extractive':
+            return retriever
+        compressor = ExtractiveCompressor(token_budget=CONTEXT_TOKEN_BUDGET, tier=tenant_tier(tenant_id))
+        return ContextualCompressionRetriever(base_compressor=compressor, base_retriever=retriever)
+
+    @staticmethod
+    def index_profile(tenant_id):
+        """Backend of the tenant's index and, on Chroma, its HNSW parameters"""
+        load_model_stack()
+        tenant_directory = os.path.join(persist_directory, tenant_id)
+        backend = vector_stores.backend_of(tenant_directory)
+        if backend != 'chroma':
+            return {'tenant_id': tenant_id, 'backend': backend}
+        return {'tenant_id': tenant_id, 'backend': backend, **vector_stores.index_profile(tenant_directory)}
+
+    @staticmethod
+    def set_search_ef(tenant_id, search_ef):
+        """Change how widely the tenant's HNSW index is searched, effective from the next query"""
+        load_model_stack()
+        tenant_directory = os.path.join(persist_directory, tenant_id)
+        if vector_stores.backend_of(tenant_directory) != 'chroma':
+            raise ValueError("Only tenants on Chroma have HNSW parameters")
+        profile = vector_stores.set_search_ef(tenant_directory, search_ef)
+        vectordb = DocumentService.vectordbs.get(tenant_id)
+        if isinstance(vectordb, vector_stores.ProfiledChroma):
+            vectordb.search_ef = search_ef
+        return {'tenant_id': tenant_id, 'backend': 'chroma', **profile}
+
+    @staticmethod
+    def tenant_exists(tenant_id):
+        return os.path.isdir(os.path.join(persist_directory, tenant_id))
+
+    @staticmethod
+    def warm_tenant(tenant_id):
+        """
+        Open the tenant's vector store and load its index into memory without
+        calling the embeddings provider.
+
+        Returns:
+            bool: Whether the tenant was warmed
+        """
+        if not DocumentService.tenant_exists(tenant_id):
+            return False
+        with tracing.span('vector_store.warm', tenant_id=tenant_id):
+            vector_stores.warm(DocumentService.get_vectordb(tenant_id, touch=False))
+        return True
+
+    @staticmethod
+    def embed_queries(queries, tenant_id=None):
+        """Embed queries in one provider call, reusing recently seen ones"""
+        embeddings = DocumentService.get_vectordb(tenant_id, touch=False).embeddings if tenant_id else get_embeddings()
+        dimensions = getattr(embeddings, 'dimensions', None)
+        cache = DocumentService.query_embeddings
+        vectors = {}
+        with DocumentService.query_embeddings_lock:
+            for query in queries:
+                if (dimensions, query) in cache:
+                    cache.move_to_end((dimensions, query))
+                    vectors[query] = cache[(dimensions, query)]
+        missing = list(dict.fromkeys(query for query in queries if query not in vectors))
+        CACHE_REQUESTS.labels(cache='query_embedding', result='hit').inc(len(queries) - len(missing))
+        CACHE_REQUESTS.labels(cache='query_embedding', result='miss').inc(len(missing))
+        if missing:
+            with reported_usage() as usage:
+                embedded = embeddings.embed_documents(missing)
+            for query, vector in zip(missing, embedded):
+                vectors[query] = vector
+            usage_tracker.record(tenant_id, EMBEDDING_MODEL, 'query_embed', embedding_tokens(missing, usage))
+            with DocumentService.query_embeddings_lock:
+                for query in missing:
+                    cache[(dimensions, query)] = vectors[query]
+                while len(cache) > DocumentService.QUERY_EMBEDDING_CACHE_SIZE:
+                    cache.popitem(last=False)
+        return [vectors[query] for query in queries]
+
+    @staticmethod
+    def _encode_cursor(offset):
+        return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        if not cursor:
+            return 0
+        try:
+            offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))['offset'])
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if offset < 0:
+            raise ValueError("Invalid cursor")
+        return offset
+
+    @staticmethod
+    def _search_by_vector(vectordb, vector, k, offset=0, document_ids=None):
+        search_filter = None
+        if document_ids:
+            search_filter = {'document_id': {'$in': list(document_ids)}}
+        # Fetch one extra hit to know whether there is a next page
+        hits = vectordb.similarity_search_by_vector_with_relevance_scores(
+            vector, k=offset + k + 1, filter=search_filter
+        )
+        relevance = vectordb._select_relevance_score_fn()
+        results = []
+        for document, distance in hits[offset:offset + k]:
+            start_index = document.metadata.get('start_index')
+            results.append({
+                'document_id': document.metadata.get('document_id'),
+                'chunk_id': document.metadata.get('chunk_id'),
+                'score': relevance(distance),
+                'content': document.page_content,
+                'start_offset': start_index,
+                'end_offset': start_index + len(document.page_content) if start_index is not None else None,
+                'metadata': document.metadata
+            })
+        next_cursor = DocumentService._encode_cursor(offset + k) if len(hits) > offset + k else None
+        return results, next_cursor
+
+    @staticmethod
+    def search(tenant_id, query, k=5, document_ids=None, cursor=None):
+        """
+        Retrieval-only search over the tenant's index, without calling the LLM.
+
+        Returns ranked chunks with relevance scores, chunk metadata and character
+        offsets into the source document, plus a cursor for the next page.
+        """
+        offset = DocumentService._decode_cursor(cursor)
+        vector = DocumentService.embed_queries([query], tenant_id)[0]
+        results, next_cursor = DocumentService._search_by_vector(
+            DocumentService.get_vectordb(tenant_id), vector, k, offset, document_ids
+        )
+        return {'query': query, 'results': results, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def search_batch(tenant_id, queries, k=5, document_ids=None):
+        """Search many queries with a single embedding call"""
+        vectordb = DocumentService.get_vectordb(tenant_id)
+        response = []
+        for query, vector in zip(queries, DocumentService.embed_queries(queries, tenant_id)):
+            results, next_cursor = DocumentService._search_by_vector(vectordb, vector, k, 0, document_ids)
+            response.append({'query': query, 'results': results, 'next_cursor': next_cursor})
+        return response
+
+    @staticmethod
+    def _new_memory():
+        # Token-limited memory keeps recent messages within 2000 tokens
+        return ConversationTokenBufferMemory(
+            llm=client_registry.chat(ANSWER_MODEL),
+            max_token_limit=2000,
+            return_messages=True,
+            input_key="question",
+            output_key="answer"
+        )
+
     @staticmethod
     def clear_memory(tenant_id):
+        load_model_stack()
         if tenant_id in DocumentService.memories:
             # Reset with token-limited memory
-            DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                max_token_limit=2000,
-                return_messages=True,
-                input_key="question",
-                output_key="answer"
-            )
+            DocumentService.memories[tenant_id] = DocumentService._new_memory()
         if tenant_id in DocumentService.clear_memory_timers:
             DocumentService.clear_memory_timers[tenant_id] = None
 
+    @staticmethod
+    def _download(response, download_directory, default_name, digest):
+        """Stream a response body to the download directory, hashing it on the way"""
+        file_name = os.path.basename(urlparse(response.url).path) or default_name
+        file_path = os.path.join(download_directory, file_name)
+        with open(file_path, 'wb') as downloaded_file:
+            for chunk in response.iter_content(chunk_size=8192):
+                digest.update(chunk)
+                downloaded_file.write(chunk)
+        return file_path
+
     @staticmethod
     def load_url(document_id, url, tenant_id):
+        """
+        Load a URL document, or refresh it if it was loaded before.
+
+        A URL loaded before under the same document_id is fetched with a
+        conditional GET; a 304 or a body with the same hash skips extraction
+        and embedding. Changed content replaces the document's chunks.
+
+        Returns:
+            str: 'new', 'updated', 'not_modified' or 'unchanged'
+        """
+        load_model_stack()
         document = []
         download_directory = "./docs"
         tenant_directory = os.path.join(persist_directory, tenant_id)
@@ -159,55 +477,80 @@ class DocumentService:
         if not os.path.exists(download_directory):
             os.makedirs(download_directory)
 
-        # find content-type of the url
-        response = requests.head(url)
-        content_type = response.headers.get('content-type')
-
-        # if content-type is text/html, extract the text from the html
-        if 'text/html' in content_type:
-            response = requests.get(url)
-            soup = bs4.BeautifulSoup(response.text, 'html.parser')
-            text = soup.get_text()
-            # fine tune the text
-            text = text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').replace('  ', ' ')
-            document_name = document_id + '.txt'
-            file_path = os.path.join(download_directory, document_name)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(text)
-            loader = TextLoader(os.path.join(download_directory, document_name))
-            document.extend(loader.load())
-
-        elif 'application/pdf' in content_type:
-            with requests.get(url, stream=True) as response:
-                response.raise_for_status()
-                parsed_url = urlparse(url)
-                file_name = os.path.basename(parsed_url.path)
-                if not file_name:
-                    file_name = 'document.pdf'
-                file_path = os.path.join(download_directory, file_name)
-                with open(file_path, 'wb') as downloaded_file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        downloaded_file.write(chunk)
-            loader = PyPDFLoader(file_path)
-            document.extend(loader.load())
-
-        elif 'application/msword' in content_type or 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' in content_type:
-            with requests.get(url, stream=True) as response:
-                response.raise_for_status()
-                parsed_url = urlparse(url)
-                file_name = os.path.basename(parsed_url.path)
-                if not file_name:
-                    file_name = 'document.docx'
-                file_path = os.path.join(download_directory, file_name)
-                with open(file_path, 'wb') as downloaded_file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        downloaded_file.write(chunk)
-            loader = Docx2txtLoader(file_path)
-            document.extend(loader.load())
+        sources = UrlSources(tenant_directory)
+        previous = sources.get(document_id)
+        if previous is not None and previous['url'] != url:
+            previous = None
+        headers = {}
+        if previous is not None:
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+
+        tier = tenant_tier(tenant_id)
+        extract_started = time.perf_counter()
+        extract_span = tracing.start_span('ingest.extract', tenant_id=tenant_id, url=url)
+
+        # One streamed GET; the body is only read once the content type is known
+        with requests.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 304 and previous is not None:
+                tracing.end_span(extract_span)
+                sources.update(document_id)
+                URL_FETCHES.labels(result='not_modified', tier=tier).inc()
+                return 'not_modified'
+            response.raise_for_status()
+            content_type = response.headers.get('content-type', '')
+            digest = hashlib.sha256()
+
+            # if content-type is text/html, extract the text from the html
+            if 'text/html' in content_type:
+                digest.update(response.content)
+                if previous is None or digest.hexdigest() != previous.get('content_hash'):
+                    # Main content only, headings kept (HTML_EXTRACTOR selects the backend)
+                    text = html_extractor.extract(response.text)
+                    document_name = document_id + '.txt'
+                    file_path = os.path.join(download_directory, document_name)
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                    loader = TextLoader(os.path.join(download_directory, document_name))
+                    document.extend(loader.load())
+
+            elif 'application/pdf' in content_type:
+                file_path = DocumentService._download(response, download_directory, 'document.pdf', digest)
+                if previous is None or digest.hexdigest() != previous.get('content_hash'):
+                    loader = PyPDFLoader(file_path)
+                    document.extend(loader.load())
+
+            elif 'application/msword' in content_type or 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' in content_type:
+                file_path = DocumentService._download(response, download_directory, 'document.docx', digest)
+                if previous is None or digest.hexdigest() != previous.get('content_hash'):
+                    loader = Docx2txtLoader(file_path)
+                    document.extend(loader.load())
+
+            validators = {
+                'url': url,
+                'etag': response.headers.get('etag'),
+                'last_modified': response.headers.get('last-modified'),
+                'content_hash': digest.hexdigest(),
+                'content_type': content_type,
+            }
+
+        if previous is not None and validators['content_hash'] == previous.get('content_hash'):
+            tracing.end_span(extract_span)
+            sources.update(document_id, **validators)
+            URL_FETCHES.labels(result='unchanged', tier=tier).inc()
+            return 'unchanged'
+
+        # Fetching, parsing and cleaning a URL are recorded as one extract stage
+        INGEST_STAGE_SECONDS.labels(stage='extract', tier=tier).observe(time.perf_counter() - extract_started)
+        tracing.end_span(extract_span)
 
         # Split the document into chunks
-        document_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        document_chunks = document_splitter.split_documents(document)
+        with tracing.span('ingest.split', tenant_id=tenant_id), \
+                INGEST_STAGE_SECONDS.labels(stage='split', tier=tier).time():
+            document_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, add_start_index=True)
+            document_chunks = document_splitter.split_documents(document)
 
         # Assign metadata to the chunks
         for i, chunk in enumerate(document_chunks):
@@ -215,13 +558,40 @@ class DocumentService:
             chunk.metadata['chunk_id'] = i
             chunk.metadata['tenant_id'] = tenant_id
 
-        vectordb = Chroma.from_documents(document_chunks, embedding=embeddings,
-                                                        persist_directory=tenant_directory)
-        vectordb.persist()
+        # A refreshed page replaces its old chunks in the same commit
+        VectorStoreWriter.add_documents(tenant_id, tenant_directory, document_chunks,
+                                        DocumentService.tenant_embeddings(tenant_id),
+                                        delete_document_ids=[document_id] if previous is not None else [])
+        sources.update(document_id, chunks=len(document_chunks), **validators)
+        result = 'updated' if previous is not None else 'new'
+        URL_FETCHES.labels(result=result, tier=tier).inc()
+        return result
 
+    @staticmethod
+    def refresh_urls(tenant_id):
+        """
+        Re-sync every URL document of a tenant. Meant to be run on a schedule;
+        unchanged pages cost one conditional request each.
+
+        Returns:
+            dict: Number of documents per outcome, plus the ids that failed
+        """
+        tenant_directory = os.path.join(persist_directory, tenant_id)
+        summary = {'new': 0, 'updated': 0, 'not_modified': 0, 'unchanged': 0, 'failed': []}
+        if not os.path.isdir(tenant_directory):
+            return summary
+        for document_id, source in UrlSources(tenant_directory).all().items():
+            try:
+                summary[DocumentService.load_url(document_id, source['url'], tenant_id)] += 1
+            except Exception as e:
+                print(f"Error refreshing {source['url']} for tenant {tenant_id}: {str(e)}")
+                URL_FETCHES.labels(result='failed', tier=tenant_tier(tenant_id)).inc()
+                summary['failed'].append(document_id)
+        return summary
 
     @staticmethod
     def load_website(base_url, tenant_id):
+        load_model_stack()
         if tenant_id in DocumentService.memories:
             # Ensure conversation memory always returns message objects so we can
             # build a chat history string to pass into chains explicitly.
@@ -250,12 +620,85 @@ class DocumentService:
         # remove duplicates
         urls = list(set(urls))
 
+        # Pages loaded before keep their document id, so re-crawling a site
+        # only re-embeds the pages that changed
+        sources = UrlSources(os.path.join(persist_directory, tenant_id))
         for url in urls:
-            document_id = str(uuid.uuid4())
+            document_id = sources.document_id_for(url) or str(uuid.uuid4())
             DocumentService.load_url(document_id, url, tenant_id)
 
+    @staticmethod
+    def sync_website(base_url, tenant_id):
+        """
+        Sync a tenant's copy of a site with its sitemaps.
+
+        Pages come from the sitemaps listed in robots.txt (or /sitemap.xml),
+        including nested sitemap indexes. A page whose lastmod matches the
+        one recorded when it was embedded is not fetched at all; others go
+        through load_url's conditional fetch. Pages of the site that are no
+        longer listed are deleted from the vector store. Progress is
+        checkpointed, so an interrupted sync resumes on the next call.
+
+        Returns:
+            dict: Number of pages per outcome, plus the URLs that failed
+
+        Raises:
+            SiteSyncError: If no sitemap could be read
+        """
+        load_model_stack()
+        from site_sync import read_robots, discover_pages, crawl_delay, SyncCheckpoint
+
+        tenant_directory = os.path.join(persist_directory, tenant_id)
+        sources = UrlSources(tenant_directory)
+        checkpoint = SyncCheckpoint(tenant_directory)
+        robots = read_robots(base_url)
+        summary = {'new': 0, 'updated': 0, 'not_modified': 0, 'unchanged': 0, 'skipped': 0, 'deleted': 0,
+                   'failed': [], 'resumed': False}
+
+        state = checkpoint.resume(base_url)
+        if state is None:
+            state = checkpoint.start(base_url, discover_pages(base_url, robots))
+        else:
+            summary['resumed'] = True
+
+        known = {source['url']: (document_id, source) for document_id, source in sources.all().items()}
+        delay = crawl_delay(robots)
+        tier = tenant_tier(tenant_id)
+        for url, lastmod in checkpoint.pending():
+            document_id, source = known.get(url, (None, None))
+            if source is not None and lastmod and source.get('lastmod') == lastmod:
+                summary['skipped'] += 1
+                URL_FETCHES.labels(result='skipped', tier=tier).inc()
+                checkpoint.complete(url)
+                continue
+            document_id = document_id or str(uuid.uuid4())
+            try:
+                summary[DocumentService.load_url(document_id, url, tenant_id)] += 1
+                sources.update(document_id, lastmod=lastmod, site=base_url)
+                checkpoint.complete(url)
+            except Exception as e:
+                print(f"Error syncing {url} for tenant {tenant_id}: {str(e)}")
+                URL_FETCHES.labels(result='failed', tier=tier).inc()
+                summary['failed'].append(url)
+                checkpoint.complete(url, failed=True)
+            if delay:
+                time.sleep(delay)
+
+        if not state['truncated']:
+            listed = set(state['pages'])
+            vanished = [document_id for document_id, source in sources.all().items()
+                        if source.get('site') == base_url and source['url'] not in listed]
+            if vanished:
+                VectorStoreWriter.delete_documents(tenant_id, tenant_directory, vanished,
+                                                   DocumentService.tenant_embeddings(tenant_id))
+                sources.remove(vanished)
+                summary['deleted'] = len(vanished)
+        checkpoint.finish()
+        return summary
+
     @staticmethod
     def load_document(document_id, data_list, tenant_id):
+        load_model_stack()
         document = []
         # Check if running in Docker or locally
         if os.path.exists("/app/shared_data"):
@@ -324,8 +767,10 @@ class DocumentService:
                     document.extend(loader.load())
 
         # Split the document into chunks
-        document_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        document_chunks = document_splitter.split_documents(document)
+        with tracing.span('ingest.split', tenant_id=tenant_id), \
+                INGEST_STAGE_SECONDS.labels(stage='split', tier=tenant_tier(tenant_id)).time():
+            document_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, add_start_index=True)
+            document_chunks = document_splitter.split_documents(document)
 
         # Assign metadata to the chunks
         for i, chunk in enumerate(document_chunks):
@@ -333,25 +778,130 @@ class DocumentService:
             chunk.metadata['chunk_id'] = i
             chunk.metadata['tenant_id'] = tenant_id
 
-        vectordb = Chroma.from_documents(document_chunks, embedding=embeddings, persist_directory=tenant_directory)
-        vectordb.persist()
+        VectorStoreWriter.add_documents(tenant_id, tenant_directory, document_chunks,
+                                        DocumentService.tenant_embeddings(tenant_id))
+
+
 
+    @staticmethod
+    def _answer_key(question, tenant_id):
+        return tenant_id, ' '.join(question.lower().split())
+
+    @staticmethod
+    def cache_answer(question, tenant_id, answer, source_documents):
+        """Remember an answer so it can be served while the tenant is over budget"""
+        key = DocumentService._answer_key(question, tenant_id)
+        with DocumentService.answers_lock:
+            DocumentService.answers[key] = {'result': answer, 'source_documents': source_documents}
+            DocumentService.answers.move_to_end(key)
+            while len(DocumentService.answers) > DocumentService.ANSWER_CACHE_SIZE:
+                DocumentService.answers.popitem(last=False)
+
+    @staticmethod
+    def get_cached_answer(question, tenant_id):
+        """Answer previously given to the same question, or the over-budget notice"""
+        key = DocumentService._answer_key(question, tenant_id)
+        with DocumentService.answers_lock:
+            cached = DocumentService.answers.get(key)
+        CACHE_REQUESTS.labels(cache='answer', result='hit' if cached else 'miss').inc()
+        return cached or {'result': BUDGET_EXCEEDED_RESPONSE, 'source_documents': []}
 
+    @staticmethod
+    def _flight_key(question, tenant_id):
+        """Identify a question by tenant, normalized text and conversation state"""
+        history_state = None
+        if tenant_id in DocumentService.memories:
+            messages = DocumentService.memories[tenant_id].chat_memory.messages
+            history_state = (len(messages), hash(messages[-1].content) if messages else None)
+        return tenant_id, ' '.join(question.split()), history_state
 
     @staticmethod
     def get_answer(question, tenant_id):
+        """Answer a question, sharing the work with identical in-flight requests"""
+        return DocumentService.single_flight.do(
+            DocumentService._flight_key(question, tenant_id),
+            lambda: DocumentService._compute_answer(question, tenant_id)
+        )
+
+    @staticmethod
+    def get_answer_stream(question, tenant_id):
+        """Stream an answer, fanning out one computation to identical in-flight requests"""
+        return DocumentService.single_flight.stream(
+            DocumentService._flight_key(question, tenant_id),
+            lambda cancelled: DocumentService._compute_answer_stream(question, tenant_id, cancelled)
+        )
+
+    @staticmethod
+    def build_stateless_chain(tenant_id):
+        """
+        Build a memory-less chain for batch evaluation. It holds no per-call
+        state, so one chain (and its retriever and client) is shared by every
+        question of a batch.
+        """
+        load_model_stack()
+        policy = usage_tracker.policy(tenant_id, RETRIEVER_K, ANSWER_MODEL)
+        retriever = DocumentService.get_retriever(tenant_id, policy['k'])
+        llm = client_registry.chat(policy['model']).with_config(
+            callbacks=[UsageCallbackHandler(usage_tracker, tenant_id, 'batch')])
+        return ConversationalRetrievalChain.from_llm(
+            llm=llm,
+            retriever=retriever,
+            return_source_documents=True
+        )
+
+    @staticmethod
+    def answer_stateless(chain, question, chat_history=None):
+        """
+        Answer one question without touching tenant memory.
+
+        Args:
+            chain: Chain from build_stateless_chain
+            question (str): The question
+            chat_history (list): Prior (question, answer) pairs of the item's own conversation
+
+        Returns:
+            dict: Answer, sources, token usage and timing of this question
+        """
+        load_model_stack()
+        started = time.perf_counter()
+        usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'total_cost': 0.0}
+
+        intent = DocumentService.detect_intent(question)
+        if intent == 'greeting':
+            result, source_documents = DocumentService.get_greeting_response(), []
+        elif intent == 'conversational':
+            result, source_documents = DocumentService.get_conversational_response(question), []
+        else:
+            with get_openai_callback() as callback:
+                llm_response = chain.invoke({"question": question, "chat_history": chat_history or []})
+            result = llm_response['answer']
+            source_documents = [{'metadata': document.metadata} for document in llm_response['source_documents']]
+            usage = {
+                'prompt_tokens': callback.prompt_tokens,
+                'completion_tokens': callback.completion_tokens,
+                'total_tokens': callback.total_tokens,
+                'total_cost': callback.total_cost
+            }
+
+        return {
+            'query': question,
+            'result': result,
+            'source_documents': source_documents,
+            'usage': usage,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    @staticmethod
+    def _compute_answer(question, tenant_id):
+        load_model_stack()
+        intent = DocumentService.detect_intent(question, tenant_id)
+
         # Check if it's a simple greeting - handle locally without LLM
-        if DocumentService.is_greeting(question):
+        if intent == 'greeting':
             greeting_response = DocumentService.get_greeting_response()
             # Still save to memory for context
             if tenant_id not in DocumentService.memories:
-                DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                    llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                    max_token_limit=2000,
-                    return_messages=True,
-                    input_key="question",
-                    output_key="answer"
-                )
+                DocumentService.memories[tenant_id] = DocumentService._new_memory()
             # Save the greeting exchange to memory
             DocumentService.memories[tenant_id].save_context(
                 {"question": question}, 
@@ -364,17 +914,11 @@ class DocumentService:
             }
         
         # Check if it's a conversational question about the AI
-        if DocumentService.is_conversational_question(question):
+        if intent == 'conversational':
             conversational_response = DocumentService.get_conversational_response(question)
             # Still save to memory for context
             if tenant_id not in DocumentService.memories:
-                DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                    llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                    max_token_limit=2000,
-                    return_messages=True,
-                    input_key="question",
-                    output_key="answer"
-                )
+                DocumentService.memories[tenant_id] = DocumentService._new_memory()
             # Save the conversational exchange to memory
             DocumentService.memories[tenant_id].save_context(
                 {"question": question}, 
@@ -389,18 +933,21 @@ class DocumentService:
         if tenant_id not in DocumentService.memories:
             # Use ConversationTokenBufferMemory to limit token usage
             # This keeps recent messages and summarizes older ones when token limit is reached
-            DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                max_token_limit=2000,  # Limit conversation history to 2000 tokens
-                return_messages=True,
-                input_key="question",
-                output_key="answer"
-            )
+            DocumentService.memories[tenant_id] = DocumentService._new_memory()
         
-        tenant_directory = os.path.join(persist_directory, tenant_id)
-        vectordb = Chroma(persist_directory=tenant_directory, embedding_function=embeddings)
-        retriever = vectordb.as_retriever(search_kwargs={"k": 3})
-        llm = ChatOpenAI(temperature=0, model_name='gpt-4o-mini')
+        tier = tenant_tier(tenant_id)
+        policy = usage_tracker.policy(tenant_id, RETRIEVER_K, ANSWER_MODEL)
+        if policy['level'] == 'cached_only':
+            cached = DocumentService.get_cached_answer(question, tenant_id)
+            return {
+                'query': question,
+                'result': cached['result'],
+                'source_documents': [{'metadata': document.metadata} for document in cached['source_documents']]
+            }
+
+        retriever = DocumentService.get_retriever(tenant_id, policy['k'])
+        llm = client_registry.chat(policy['model']).with_config(
+            callbacks=[StageTimer('generation', tier), UsageCallbackHandler(usage_tracker, tenant_id, 'answer')])
 
         # Use ConversationalRetrievalChain to maintain context. To make the
         # conversational chain more robust across multiple follow-up turns we
@@ -412,13 +959,21 @@ class DocumentService:
             llm=llm,
             retriever=retriever,
             memory=DocumentService.memories[tenant_id],
-            return_source_documents=True
+            return_source_documents=True,
+            condense_question_llm=client_registry.chat(policy['model']).with_config(
+                callbacks=[StageTimer('condense', tier), UsageCallbackHandler(usage_tracker, tenant_id, 'condense')])
         )
 
         # ConversationalRetrievalChain requires chat_history parameter even with memory
         # Pass empty list as chat_history since memory handles the conversation state
-        llm_response = pdf_qa.invoke({"question": question, "chat_history": []})
+        try:
+            llm_response = pdf_qa.invoke({"question": question, "chat_history": []},
+                                         config={'callbacks': [StageTimer('retrieval', tier)]})
+        except Exception:
+            ERRORS.labels(operation='answer', tier=tier).inc()
+            raise
 
+        DocumentService.cache_answer(question, tenant_id, llm_response['answer'], llm_response['source_documents'])
         serialized_response = {
             'query': question,
             'result': llm_response['answer'],
@@ -440,20 +995,36 @@ class DocumentService:
         return serialized_response
 
     @staticmethod
-    def get_answer_stream(question, tenant_id):
-        """Generator function for streaming responses"""
+    def _sources_chunk(documents):
+        """Stream chunk citing the documents an answer is built from, sent before its tokens"""
+        return {
+            'token': '',
+            'is_last': False,
+            'complete_response': None,
+            'sources': [{
+                'document_id': document.metadata.get('document_id'),
+                'name': document.metadata.get('original_file_name') or document.metadata.get('source'),
+                'snippet': document.page_content[:SOURCE_SNIPPET_CHARS]
+            } for document in documents]
+        }
+
+    @staticmethod
+    def _compute_answer_stream(question, tenant_id, cancelled=None):
+        """
+        Generator function for streaming responses. Once cancelled is set
+        the provider stream is aborted and the partial answer is dropped:
+        it is neither cached nor saved to the conversation memory.
+        """
+        load_model_stack()
+        started = time.perf_counter()
+        intent = DocumentService.detect_intent(question, tenant_id)
+
         # Check if it's a simple greeting - handle locally without LLM
-        if DocumentService.is_greeting(question):
+        if intent == 'greeting':
             greeting_response = DocumentService.get_greeting_response()
             # Still save to memory for context
             if tenant_id not in DocumentService.memories:
-                DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                    llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                    max_token_limit=2000,
-                    return_messages=True,
-                    input_key="question",
-                    output_key="answer"
-                )
+                DocumentService.memories[tenant_id] = DocumentService._new_memory()
             # Save the greeting exchange to memory
             DocumentService.memories[tenant_id].save_context(
                 {"question": question}, 
@@ -477,17 +1048,11 @@ class DocumentService:
             return
         
         # Check if it's a conversational question about the AI
-        if DocumentService.is_conversational_question(question):
+        if intent == 'conversational':
             conversational_response = DocumentService.get_conversational_response(question)
             # Still save to memory for context
             if tenant_id not in DocumentService.memories:
-                DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                    llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                    max_token_limit=2000,
-                    return_messages=True,
-                    input_key="question",
-                    output_key="answer"
-                )
+                DocumentService.memories[tenant_id] = DocumentService._new_memory()
             # Save the conversational exchange to memory
             DocumentService.memories[tenant_id].save_context(
                 {"question": question}, 
@@ -513,53 +1078,105 @@ class DocumentService:
         if tenant_id not in DocumentService.memories:
             # Use ConversationTokenBufferMemory to limit token usage
             # This keeps recent messages and summarizes older ones when token limit is reached
-            DocumentService.memories[tenant_id] = ConversationTokenBufferMemory(
-                llm=ChatOpenAI(temperature=0, model_name='gpt-4o-mini'),
-                max_token_limit=2000,  # Limit conversation history to 2000 tokens
-                return_messages=True,
-                input_key="question",
-                output_key="answer"
-            )
+            DocumentService.memories[tenant_id] = DocumentService._new_memory()
         
-        tenant_directory = os.path.join(persist_directory, tenant_id)
-        vectordb = Chroma(persist_directory=tenant_directory, embedding_function=embeddings)
-        retriever = vectordb.as_retriever(search_kwargs={"k": 3})
+        tier = tenant_tier(tenant_id)
+        policy = usage_tracker.policy(tenant_id, RETRIEVER_K, ANSWER_MODEL)
+        if policy['level'] == 'cached_only':
+            cached = DocumentService.get_cached_answer(question, tenant_id)
+            if cached['source_documents']:
+                yield DocumentService._sources_chunk(cached['source_documents'])
+            yield {
+                'token': cached['result'],
+                'is_last': True,
+                'complete_response': {'query': question, **cached}
+            }
+            return
+
+        retriever = DocumentService.get_retriever(tenant_id, policy['k'])
         
-        # Create callback handler for streaming
-        streaming_handler = StreamingCallbackHandler()
-        llm = ChatOpenAI(
-            temperature=0, 
-            model_name='gpt-4o-mini',
-            streaming=True,
-            callbacks=[streaming_handler]
+        # Create callback handler for streaming; tokens are handed over as
+        # soon as the provider sends them
+        token_queue = queue.Queue()
+        streaming_handler = StreamingCallbackHandler(token_queue)
+        # The retrieved documents go through the same queue, ahead of the tokens
+        sources_handler = SourcesCallbackHandler(lambda documents: token_queue.put(list(documents)))
+        llm = client_registry.chat(policy['model'], streaming=True).with_config(
+            callbacks=[streaming_handler, StageTimer('generation', tier, mode='stream', started=started),
+                       UsageCallbackHandler(usage_tracker, tenant_id, 'answer')]
         )
 
-        # Use ConversationalRetrievalChain to maintain context
+        # Use ConversationalRetrievalChain to maintain context. Follow-up
+        # questions are condensed by a separate non-streaming client so the
+        # rewritten question never leaks into the answer stream.
         pdf_qa = ConversationalRetrievalChain.from_llm(
             llm=llm, 
             retriever=retriever, 
             memory=DocumentService.memories[tenant_id],
-            return_source_documents=True
+            return_source_documents=True,
+            condense_question_llm=client_registry.chat(policy['model']).with_config(
+                callbacks=[StageTimer('condense', tier), UsageCallbackHandler(usage_tracker, tenant_id, 'condense')])
         )
-        # ConversationalRetrievalChain requires chat_history parameter even with memory
-        # Pass empty list as chat_history since memory handles the conversation state
-        llm_response = pdf_qa.invoke({"question": question, "chat_history": []})
-        
-        # Get all the streamed tokens
-        tokens = streaming_handler.get_tokens()
-        
-        # Yield tokens one by one
-        for i, token in enumerate(tokens):
-            is_last = (i == len(tokens) - 1)
-            yield {
-                'token': token,
-                'is_last': is_last,
-                'complete_response': {
-                    'query': question,
-                    'result': llm_response['answer'],
-                    'source_documents': llm_response['source_documents']
-                } if is_last else None
+
+        outcome = {}
+        # Checked at every step of the chain, so a cancel during condensing
+        # or retrieval stops the run before the answer is generated
+        cancellation = [CancellationCallbackHandler(cancelled)] if cancelled is not None else []
+
+        def run_chain():
+            try:
+                # ConversationalRetrievalChain requires chat_history parameter even with memory
+                # Pass empty list as chat_history since memory handles the conversation state
+                with profiling.attach():
+                    outcome['response'] = pdf_qa.invoke({"question": question, "chat_history": []},
+                                                         config={'callbacks': [StageTimer('retrieval', tier),
+                                                                               sources_handler] + cancellation})
+            except Exception as e:
+                if not isinstance(e, GenerationCancelled):
+                    ERRORS.labels(operation='answer_stream', tier=tier).inc()
+                outcome['error'] = e
+            finally:
+                token_queue.put(None)
+
+        # Run in a copy of the caller's context so chain spans join its trace
+        threading.Thread(target=contextvars.copy_context().run, args=(run_chain,), daemon=True).start()
+
+        # Hold back one token so the final chunk can carry the complete response
+        previous = None
+        while True:
+            token = token_queue.get()
+            if token is None:
+                break
+            if isinstance(token, list):
+                TIME_TO_SOURCES_SECONDS.labels(tier=tier).observe(time.perf_counter() - started)
+                yield DocumentService._sources_chunk(token)
+                continue
+            if previous is not None:
+                yield {'token': previous, 'is_last': False, 'complete_response': None}
+            previous = token
+
+        if isinstance(outcome.get('error'), GenerationCancelled):
+            # The chain stopped before saving to memory; the answer is dropped
+            streamed = len(streaming_handler.tokens)
+            ANSWERS_CANCELLED.labels(stage='generation' if streamed else 'retrieval', tier=tier).inc()
+            CANCELLED_TOKENS_SAVED.labels(tier=tier).inc(
+                max(0, round(DocumentService.answer_tokens_estimate) - streamed))
+            return
+        if 'error' in outcome:
+            raise outcome['error']
+        llm_response = outcome['response']
+        DocumentService.answer_tokens_estimate += 0.1 * (len(streaming_handler.tokens)
+                                                         - DocumentService.answer_tokens_estimate)
+        DocumentService.cache_answer(question, tenant_id, llm_response['answer'], llm_response['source_documents'])
+        yield {
+            'token': previous or '',
+            'is_last': True,
+            'complete_response': {
+                'query': question,
+                'result': llm_response['answer'],
+                'source_documents': llm_response['source_documents']
             }
+        }
         
         print("Chat History:", DocumentService.memories[tenant_id].chat_memory.messages)
         
@@ -0,0 +1,370 @@
+import os
+import json
+import uuid
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Exact-search vector index for small tenants: a memory-mapped matrix of
+# unit-normalised embeddings plus a JSON-lines sidecar holding the
+# id, text and metadata of each row. A manifest names the current generation
+# of the data files and how many rows are committed; appends only bump the row
+# count, deletes write a compacted generation and swap the manifest. Readers
+# never see a half-written row and can re-map by checking the manifest.
+MANIFEST_FILE = 'flat.json'
+SEARCH_BLOCK_ROWS = 2048  # rows converted to float32 per matmul block, kept cache sized
+# Storage types of the scanned matrix. Quantized indexes also keep the
+# float32 vectors in a file that is only read to rescore the top candidates
+# of a search, so it stays out of memory; int8 rows carry a float32 scale.
+DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+SUFFIXES = {'float32': 'f32', 'float16': 'f16', 'int8': 'i8'}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Encode unit vectors for storage.
+
+    Returns:
+        tuple: The encoded rows, and per-row scales for int8 (None otherwise)
+    """
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(DTYPES[dtype]), None
+
+
+class FlatIndex:
+    """
+    One tenant's flat index. Writes must come from a single writer (the
+    tenant's VectorStoreWriter); any number of readers may search. dtype
+    only applies when the index is created; an existing index keeps the
+    storage type in its manifest.
+    """
+
+    def __init__(self, directory: str, dtype: str = 'float16'):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported flat index dtype: {dtype}")
+        self.directory = directory
+        self.dtype = dtype
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.lock = threading.Lock()
+        self.loaded_version = None
+        self.manifest = None
+        self.vectors = None
+        self.scales = None
+        self.full = None
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.rows_by_document = {}
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, MANIFEST_FILE))
+
+    def _files(self, manifest: Dict[str, Any]) -> Dict[str, str]:
+        """Data files of a manifest's generation, by kind."""
+        generation = manifest['generation']
+        dtype = manifest['dtype']
+        files = {
+            'vectors': os.path.join(self.directory, f'vectors-{generation}.{SUFFIXES[dtype]}'),
+            'documents': os.path.join(self.directory, f'documents-{generation}.jsonl'),
+        }
+        if dtype == 'int8':
+            files['scales'] = os.path.join(self.directory, f'scales-{generation}.f32')
+        if manifest.get('full_precision'):
+            files['full'] = os.path.join(self.directory, f'full-{generation}.f32')
+        return files
+
+    def _new_manifest(self, dimensions: int, dtype: str, generation: int = 0) -> Dict[str, Any]:
+        return {'generation': generation, 'count': 0, 'dimensions': dimensions, 'dtype': dtype,
+                'full_precision': dtype != 'float32'}
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temporary_path, self.manifest_path)
+
+    def _version(self) -> Optional[Tuple[int, int]]:
+        # The manifest is replaced on every commit, so its inode changes
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self) -> bool:
+        """
+        Re-map the index if the writer committed since it was last loaded.
+
+        Returns:
+            bool: Whether the index exists
+        """
+        version = self._version()
+        if version is None:
+            return False
+        if version == self.loaded_version:
+            return True
+        with self.lock:
+            for _ in range(3):
+                version = self._version()
+                if version == self.loaded_version:
+                    return True
+                manifest = self._read_manifest()
+                if manifest is None:
+                    return False
+                try:
+                    arrays, ids, texts, metadatas = self._load(manifest)
+                    break
+                except FileNotFoundError:
+                    # A compaction removed this generation while we read it
+                    continue
+            else:
+                raise RuntimeError(f"Flat index in {self.directory} kept changing while loading")
+            self.manifest = manifest
+            self.vectors, self.scales, self.full = arrays['vectors'], arrays.get('scales'), arrays.get('full')
+            self.ids, self.texts, self.metadatas = ids, texts, metadatas
+            rows_by_document = {}
+            for row, metadata in enumerate(metadatas):
+                rows_by_document.setdefault(metadata.get('document_id'), []).append(row)
+            self.rows_by_document = rows_by_document
+            self.loaded_version = version
+        return True
+
+    def _load(self, manifest: Dict[str, Any]):
+        count, dimensions = manifest['count'], manifest['dimensions']
+        files = self._files(manifest)
+        shapes = {'vectors': (DTYPES[manifest['dtype']], (count, dimensions)),
+                  'scales': (np.float32, (count,)), 'full': (np.float32, (count, dimensions))}
+        arrays = {}
+        for kind, (dtype, shape) in shapes.items():
+            if kind not in files:
+                continue
+            if count:
+                arrays[kind] = np.memmap(files[kind], dtype=dtype, mode='r', shape=shape)
+            else:
+                arrays[kind] = np.zeros(shape, dtype=dtype)
+        ids, texts, metadatas = [], [], []
+        with open(files['documents'], encoding='utf-8') as f:
+            for line, _ in zip(f, range(count)):
+                row = json.loads(line)
+                ids.append(row['id'])
+                texts.append(row['text'])
+                metadatas.append(row['metadata'])
+        return arrays, ids, texts, metadatas
+
+    def __len__(self) -> int:
+        return self.manifest['count'] if self.refresh() else 0
+
+    # Writing
+
+    def append(self, vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict[str, Any]],
+               ids: Optional[List[str]] = None) -> List[str]:
+        """Append rows; they become visible to readers once the manifest is written."""
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        if not ids:
+            return []
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        manifest = self._read_manifest() or self._new_manifest(matrix.shape[1], self.dtype)
+        if matrix.shape[1] != manifest['dimensions']:
+            raise ValueError(f"Expected {manifest['dimensions']}-dimensional vectors, got {matrix.shape[1]}")
+        os.makedirs(self.directory, exist_ok=True)
+        files = self._files(manifest)
+        codes, scales = quantize(matrix, manifest['dtype'])
+        for kind, array in (('vectors', codes), ('scales', scales), ('full', matrix)):
+            if kind not in files:
+                continue
+            # Cut off rows a crashed writer may have left past the committed count
+            with open(files[kind], 'ab') as f:
+                f.truncate(manifest['count'] * (array.nbytes // len(array)))
+                f.write(array.tobytes())
+        self._truncate_lines(files['documents'], manifest['count'])
+        with open(files['documents'], 'a', encoding='utf-8') as f:
+            for row_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({'id': row_id, 'text': text, 'metadata': metadata}) + '\n')
+        manifest['count'] += len(ids)
+        self._write_manifest(manifest)
+        return ids
+
+    @staticmethod
+    def _truncate_lines(path: str, lines: int) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            for _ in range(lines):
+                f.readline()
+            f.truncate()
+
+    def delete_where(self, document_ids: Iterable[str]) -> int:
+        """Remove every row of the given documents by writing a compacted generation."""
+        document_ids = set(document_ids)
+        if not self.refresh():
+            return 0
+        keep = [row for row, metadata in enumerate(self.metadatas)
+                if metadata.get('document_id') not in document_ids]
+        removed = len(self.metadatas) - len(keep)
+        if removed:
+            old = self.manifest
+            new = dict(old, generation=old['generation'] + 1, count=len(keep))
+            files = self._files(new)
+            for kind, array in (('vectors', self.vectors), ('scales', self.scales), ('full', self.full)):
+                if kind in files:
+                    np.ascontiguousarray(array[keep]).tofile(files[kind])
+            self._commit_generation(old, new, keep)
+        return removed
+
+    def rebuild(self, vectors: Sequence[Sequence[float]], dtype: str) -> None:
+        """
+        Re-encode every row from new vectors, e.g. with fewer dimensions, and
+        storage type as a new generation. Rows keep their ids, text and metadata.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported flat index dtype: {dtype}")
+        if not self.refresh():
+            raise FileNotFoundError(f"No flat index in {self.directory}")
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        if len(matrix) != len(self.ids):
+            raise ValueError(f"Expected {len(self.ids)} vectors, got {len(matrix)}")
+        old = self.manifest
+        new = dict(self._new_manifest(matrix.shape[1], dtype, old['generation'] + 1), count=len(matrix))
+        files = self._files(new)
+        codes, scales = quantize(matrix, dtype)
+        for kind, array in (('vectors', codes), ('scales', scales), ('full', matrix)):
+            if kind in files:
+                array.tofile(files[kind])
+        self._commit_generation(old, new, range(len(self.ids)))
+
+    def _commit_generation(self, old: Dict[str, Any], new: Dict[str, Any], rows: Iterable[int]) -> None:
+        """Write the documents of a new generation, switch the manifest to it and drop the old one."""
+        with open(self._files(new)['documents'], 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({'id': self.ids[row], 'text': self.texts[row],
+                                    'metadata': self.metadatas[row]}) + '\n')
+        self._write_manifest(new)
+        # Open memory maps keep the old files readable until they are dropped
+        for path in self._files(old).values():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def destroy(self) -> None:
+        """Remove the index files, e.g. after promotion to another backend."""
+        manifest = self._read_manifest()
+        os.remove(self.manifest_path)
+        if manifest is not None:
+            for path in self._files(manifest).values():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # Reading
+
+    def _scan(self, vectors: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        scores = np.empty(vectors.shape[0], dtype=np.float32)
+        for start in range(0, vectors.shape[0], SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def search(self, vector: Sequence[float], k: int, document_ids: Optional[Iterable[str]] = None,
+               rescore: int = 4) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        """
+        Nearest rows by cosine similarity. With document_ids only the rows of
+        those documents are scored. On a quantized index the best
+        k * rescore rows of the scan are rescored with their float32 vectors;
+        rescore=0 ranks by the quantized scores alone.
+
+        Returns:
+            list: (id, text, metadata, squared L2 distance between unit vectors), nearest first
+        """
+        if not self.refresh() or k <= 0:
+            return []
+        with self.lock:
+            vectors, scales, full, rows_by_document = self.vectors, self.scales, self.full, self.rows_by_document
+            ids, texts, metadatas = self.ids, self.texts, self.metadatas
+        query = _normalize(np.asarray([vector], dtype=np.float32))[0]
+        if query.shape[0] != vectors.shape[1]:
+            raise ValueError(f"Expected a {vectors.shape[1]}-dimensional query, got {query.shape[0]}")
+        rows = None
+        if document_ids is not None:
+            rows = np.array(sorted(row for document_id in set(document_ids)
+                                   for row in rows_by_document.get(document_id, ())), dtype=np.int64)
+            vectors = vectors[rows]
+            scales = scales[rows] if scales is not None else None
+        count = vectors.shape[0]
+        if not count:
+            return []
+        scores = self._scan(vectors, scales, query)
+        k = min(k, count)
+        rescoring = full is not None and rescore > 0
+        candidates = min(count, k * rescore) if rescoring else k
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if rescoring:
+            # Sorted rows read the full precision file front to back
+            top = np.sort(rows[top] if rows is not None else top)
+            top_scores = np.asarray(full[top], dtype=np.float32) @ query
+        else:
+            top_scores = scores[top]
+            top = rows[top] if rows is not None else top
+        order = np.argsort(-top_scores)[:k]
+        return [(ids[row], texts[row], metadatas[row], float(2.0 - 2.0 * score))
+                for row, score in zip(top[order], top_scores[order])]
+
+    def vectors_float32(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Rows as float32, at full precision when the index keeps it."""
+        if not self.refresh():
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.full is not None:
+            return np.array(self.full[start:stop], dtype=np.float32)
+        block = np.array(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def rows(self) -> Iterable[Tuple[str, List[float], str, Dict[str, Any]]]:
+        """Every row as (id, vector, text, metadata), e.g. to migrate to another backend."""
+        if not self.refresh():
+            return
+        for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+            block = self.vectors_float32(start, start + SEARCH_BLOCK_ROWS)
+            for row, vector in enumerate(block.tolist(), start):
+                yield self.ids[row], vector, self.texts[row], self.metadatas[row]
+
+    def stats(self) -> Dict[str, Any]:
+        """Size of the index; scan_bytes is what a search keeps in memory."""
+        if not self.refresh():
+            return {'count': 0, 'dimensions': None, 'dtype': None, 'scan_bytes': 0, 'disk_bytes': 0}
+        scan_bytes = self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        disk_bytes = sum(os.path.getsize(path) for path in self._files(self.manifest).values()
+                         if os.path.exists(path))
+        return {'count': self.manifest['count'], 'dimensions': self.manifest['dimensions'],
+                'dtype': self.manifest['dtype'], 'scan_bytes': scan_bytes, 'disk_bytes': disk_bytes}
+
+    def warm(self) -> None:
+        """Fault the scanned matrix into the page cache; the full precision file is left on disk."""
+        if not self.refresh():
+            return
+        for start in range(0, self.vectors.shape[0], SEARCH_BLOCK_ROWS):
+            float(np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32).sum())
+        if self.scales is not None:
+            float(self.scales.sum())
@@ -0,0 +1,277 @@
+import os
+import re
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional
+
+# HTML to text for URL documents. Backends:
+#   main - main content only: boilerplate dropped by markup and link density,
+#          headings kept as markdown (default)
+#   text - every visible block, structure kept, no boilerplate removal
+#   bs4  - the original BeautifulSoup get_text() extraction
+HTML_EXTRACTOR = os.getenv('HTML_EXTRACTOR', 'main')
+
+# Never visible text
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'head', 'iframe', 'object', 'canvas', 'select'}
+# Page chrome; dropped by the main content backend
+BOILERPLATE_TAGS = {'nav', 'header', 'footer', 'aside', 'form', 'button', 'dialog'}
+BOILERPLATE_PATTERN = re.compile(
+    r'(^|[\s_-])(nav|navbar|menu|breadcrumbs?|footer|sidebar|cookie|banner|share|social|related|'
+    r'comments?|advert|ads|promo|popup|modal|subscribe|newsletter|skip-link)($|[\s_-])',
+    re.IGNORECASE
+)
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'pre', 'blockquote',
+    'table', 'tr', 'td', 'th', 'caption', 'figure', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'br', 'hr', 'body', 'details', 'summary', 'address', 'nav', 'header', 'footer', 'aside', 'form', 'dialog',
+}
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+VOID_TAGS = {'br', 'hr', 'img', 'input', 'meta', 'link', 'area', 'base', 'col', 'embed', 'source', 'track', 'wbr'}
+CONTENT_ROOTS = {'main', 'article'}
+
+# Block classification thresholds for the main content backend
+MIN_CONTENT_WORDS = 8
+MAX_LINK_DENSITY = 0.33
+BAD_LINK_DENSITY = 0.5
+
+WHITESPACE = re.compile(r'\s+')
+
+
+class Block:
+    """A run of text between block-level tags."""
+
+    __slots__ = ('kind', 'level', 'text', 'link_chars', 'root', 'boilerplate', 'label')
+
+    def __init__(self, kind: str, level: int, text: str, link_chars: int, root: Optional[int], boilerplate: bool):
+        self.kind = kind  # 'heading', 'item', 'pre' or 'text'
+        self.level = level
+        self.text = text
+        self.link_chars = link_chars
+        self.root = root  # index of the enclosing <main>/<article>, if any
+        self.boilerplate = boilerplate
+        self.label = None
+
+    @property
+    def link_density(self) -> float:
+        return self.link_chars / len(self.text) if self.text else 0.0
+
+    def render(self) -> str:
+        if self.kind == 'heading':
+            return '#' * self.level + ' ' + self.text
+        if self.kind == 'item':
+            return '- ' + self.text
+        return self.text
+
+
+class _BlockParser(HTMLParser):
+    """Single pass over the markup that cuts the page into text blocks."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.stack = []  # (tag, boilerplate, root) of open elements
+        self.skip_depth = 0
+        self.boilerplate_depth = 0
+        self.link_depth = 0
+        self.pre_depth = 0
+        self.roots = 0
+        self.root_stack = []
+        self.parts = []
+        self.link_chars = 0
+
+    def _kind(self):
+        """Kind and heading level of text written at the current position."""
+        for tag, _, _ in reversed(self.stack):
+            if tag in HEADING_TAGS:
+                return 'heading', HEADING_TAGS[tag]
+            if tag == 'pre':
+                return 'pre', 0
+            if tag == 'li':
+                return 'item', 0
+        return 'text', 0
+
+    def _flush(self) -> None:
+        if self.parts:
+            text = ''.join(self.parts)
+            text = text.strip('\n') if self.pre_depth else WHITESPACE.sub(' ', text).strip()
+            if text:
+                kind, level = self._kind()
+                self.blocks.append(Block(kind, level, text, self.link_chars,
+                                         self.root_stack[-1] if self.root_stack else None,
+                                         self.boilerplate_depth > 0))
+        self.parts = []
+        self.link_chars = 0
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if self.skip_depth:
+            if tag in SKIP_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in SKIP_TAGS:
+            self.skip_depth = 1
+            return
+        if tag in VOID_TAGS:
+            if tag in BLOCK_TAGS:
+                self._flush()
+            return
+
+        attributes = dict(attrs)
+        marker = ' '.join(filter(None, (attributes.get('id'), attributes.get('class'), attributes.get('role'))))
+        boilerplate = tag in BOILERPLATE_TAGS or bool(marker and BOILERPLATE_PATTERN.search(marker)) \
+            or attributes.get('aria-hidden') == 'true' or 'hidden' in attributes
+        root = tag in CONTENT_ROOTS
+        if tag in BLOCK_TAGS or boilerplate:
+            self._flush()
+        self.stack.append((tag, boilerplate, root))
+
+        if boilerplate:
+            self.boilerplate_depth += 1
+        if root:
+            self.root_stack.append(self.roots)
+            self.roots += 1
+        if tag == 'a':
+            self.link_depth += 1
+        elif tag == 'pre':
+            self.pre_depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.skip_depth:
+            if tag in SKIP_TAGS:
+                self.skip_depth -= 1
+            return
+        if tag in VOID_TAGS:
+            return
+        # Pop to the matching open element, closing anything left unclosed
+        for position in range(len(self.stack) - 1, -1, -1):
+            if self.stack[position][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > position:
+            open_tag, boilerplate, root = self.stack[-1]
+            if open_tag in BLOCK_TAGS or boilerplate:
+                self._flush()
+            self.stack.pop()
+            if boilerplate:
+                self.boilerplate_depth -= 1
+            if root:
+                self.root_stack.pop()
+            if open_tag == 'a':
+                self.link_depth -= 1
+            elif open_tag == 'pre':
+                self.pre_depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        if self.skip_depth:
+            return
+        self.parts.append(data)
+        if self.link_depth:
+            self.link_chars += len(data.strip())
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+
+def parse_blocks(html: str) -> List[Block]:
+    parser = _BlockParser()
+    parser.feed(html)
+    parser.close()
+    return parser.blocks
+
+
+def _classify(blocks: List[Block]) -> None:
+    """
+    Label blocks good, bad or short by length and link density, then let
+    short blocks and headings take the label of their context: a short block
+    between good blocks is content, a heading is kept if content follows it.
+    """
+    for block in blocks:
+        words = len(block.text.split())
+        if block.boilerplate or block.link_density > BAD_LINK_DENSITY:
+            block.label = 'bad'
+        elif block.kind == 'pre' or (words >= MIN_CONTENT_WORDS and block.link_density <= MAX_LINK_DENSITY):
+            block.label = 'good'
+        else:
+            block.label = 'short'
+
+    def neighbour(index: int, step: int) -> Optional[str]:
+        index += step
+        while 0 <= index < len(blocks):
+            if blocks[index].label != 'short' and blocks[index].kind != 'heading':
+                return blocks[index].label
+            index += step
+        return None
+
+    resolved = []
+    for index, block in enumerate(blocks):
+        if block.label != 'short':
+            resolved.append(block.label)
+        elif block.kind == 'heading':
+            resolved.append('good' if neighbour(index, 1) == 'good' else 'bad')
+        else:
+            before, after = neighbour(index, -1), neighbour(index, 1)
+            resolved.append('good' if before == 'good' and after in ('good', None) or
+                            after == 'good' and before is None else 'bad')
+    for block, label in zip(blocks, resolved):
+        block.label = label
+
+
+def _join(blocks: List[Block]) -> str:
+    return '\n\n'.join(block.render() for block in blocks)
+
+
+def extract_text(html: str) -> str:
+    """Every visible block of the page, with headings and list items marked up."""
+    return _join(parse_blocks(html))
+
+
+def extract_main_content(html: str) -> str:
+    """
+    Main content of the page as markdown-ish text.
+
+    If the page marks up its content with <main> or <article>, only the
+    largest such element is considered. Page chrome (nav, footer, menus,
+    cookie banners) and link-heavy blocks are dropped, so they are neither
+    embedded nor retrieved.
+    """
+    blocks = parse_blocks(html)
+    if not blocks:
+        return ''
+    root_sizes = {}
+    for block in blocks:
+        if block.root is not None:
+            root_sizes[block.root] = root_sizes.get(block.root, 0) + len(block.text)
+    if root_sizes:
+        largest = max(root_sizes, key=root_sizes.get)
+        # A thin <article> (e.g. a teaser card) is not the main content
+        if root_sizes[largest] >= 0.25 * sum(len(block.text) for block in blocks):
+            blocks = [block for block in blocks if block.root == largest]
+
+    _classify(blocks)
+    content = [block for block in blocks if block.label == 'good']
+    if not content:
+        # Nothing looked like prose; fall back to the non-boilerplate text
+        content = [block for block in blocks if not block.boilerplate] or blocks
+    return _join(content)
+
+
+def extract_with_bs4(html: str) -> str:
+    """The original extraction: all text of the page on one line."""
+    import bs4
+    text = bs4.BeautifulSoup(html, 'html.parser').get_text()
+    return text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').replace('  ', ' ')
+
+
+EXTRACTORS: Dict[str, Callable[[str], str]] = {
+    'main': extract_main_content,
+    'text': extract_text,
+    'bs4': extract_with_bs4,
+}
+
+
+def extract(html: str, backend: str = None) -> str:
+    """Extract text from html with the configured (or given) backend."""
+    backend = backend or HTML_EXTRACTOR
+    if backend not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor '{backend}', expected one of {', '.join(EXTRACTORS)}")
+    return EXTRACTORS[backend](html)
@@ -1,11 +1,69 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from document_service import DocumentService
-from fastapi.middleware.cors import CORSMiddleware
+import startup
+
+with startup.timed_import('fastapi', phase='startup'):
+    from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.middleware.cors import CORSMiddleware
+    from starlette.background import BackgroundTask
+    from pydantic import BaseModel
+with startup.timed_import('service', phase='startup'):
+    from document_service import DocumentService, load_model_stack
+    from admission import AdmissionController, AdmissionRejected, Priority
+    from sse import stream_token_events, coalesce_tokens, SSE_HEADERS
+    from tracing import setup_tracing, span
+    import profiling
+    from usage import usage_tracker
+    from warmup import WarmUp, access_log
+    from metrics import (
+        CONTENT_TYPE as METRICS_CONTENT_TYPE, render as render_metrics, HTTP_REQUEST_SECONDS, ERRORS, tenant_tier
+    )
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from collections import OrderedDict
+import asyncio
 import json
+import logging
+import os
+import orjson
+import time
+
+logger = logging.getLogger(__name__)
+
+# Import the model stack and open the hottest tenants in the background once
+# the app is serving; /health answers right away, /ready once warm-up is done
+warmup = WarmUp.from_env(access_log)
+
+# Paths that answer while the worker is still warming up
+UNGATED_PATHS = ('/health', '/ready', '/metrics', '/startup', '/stats', '/profiles')
+READINESS_GATE = os.getenv('READINESS_GATE', 'true').lower() == 'true'
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.mark('serving')
+    warmup.start(load_model_stack, DocumentService.warm_tenant)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+startup.mark('app_created')
+admission = AdmissionController.from_env()
+setup_tracing(app)
+
+
+# Middlewares registered later wrap earlier ones. The gate comes first so it
+# runs inside CORS and request metrics: its 503s carry CORS headers and are
+# counted like any other response.
+@app.middleware("http")
+async def gate_until_ready(request: Request, call_next):
+    # A warming replica answers 503 so nginx retries the request on a warm one
+    if READINESS_GATE and not request.url.path.startswith(UNGATED_PATHS) and not warmup.is_ready():
+        return JSONResponse(status_code=503, content={'detail': 'Service is warming up'},
+                            headers={'Retry-After': '2'})
+    return await call_next(request)
+
 
-app = FastAPI()
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +73,61 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by endpoint function rather than raw path to keep cardinality low
+        endpoint = request.scope.get('endpoint')
+        route = getattr(endpoint, '__name__', 'unmatched')
+        HTTP_REQUEST_SECONDS.labels(method=request.method, route=route, status=f"{status // 100}xx").observe(
+            time.perf_counter() - started)
+        if status >= 500:
+            ERRORS.labels(operation=route, tier=tenant_tier(request.headers.get('x-tenant-id'))).inc()
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    profile = profiling.start(request.headers, request.url.path)
+    if profile is None:
+        return await call_next(request)
+
+    # Set before the endpoint runs so its worker threads see the profile
+    profiling.activate(profile)
+    try:
+        response = await call_next(request)
+    except Exception:
+        profiling.finish(profile, 500)
+        raise
+
+    # Streamed answers keep working after the headers are sent, so the
+    # profile ends with the body rather than with call_next
+    body_iterator = response.body_iterator
+
+    async def profiled_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            profiling.finish(profile, response.status_code)
+
+    response.body_iterator = profiled_body()
+    return response
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 
 class UrlRequest(BaseModel):
     document_id: str
@@ -37,6 +150,57 @@ class QuestionRequest(BaseModel):
 class MemoryRequest(BaseModel):
     tenant_id: str
 
+class RefreshRequest(BaseModel):
+    tenant_id: str
+
+class SearchRequest(BaseModel):
+    tenant_id: str
+    query: str
+    k: int = 5
+    document_ids: Optional[List[str]] = None
+    cursor: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    tenant_id: str
+    queries: List[str]
+    k: int = 5
+    document_ids: Optional[List[str]] = None
+
+class BatchQuestion(BaseModel):
+    question: str
+    id: Optional[str] = None
+    conversation_id: Optional[str] = None
+
+class BatchQuestionRequest(BaseModel):
+    tenant_id: str
+    questions: List[BatchQuestion]
+    concurrency: int = 8
+
+class BudgetRequest(BaseModel):
+    daily_limit: Optional[float] = None  # USD, None for no limit
+    monthly_limit: Optional[float] = None
+
+class IndexProfileRequest(BaseModel):
+    search_ef: int
+
+
+MAX_SEARCH_K = 50
+MAX_SEARCH_EF = 1000
+MAX_SEARCH_BATCH = 100
+MAX_BATCH_QUESTIONS = 1000
+MAX_BATCH_CONCURRENCY = int(os.getenv('ASK_BATCH_MAX_CONCURRENCY', '8'))
+
+
+async def acquire_with_retry(tenant_id, priority, attempts=5):
+    """Acquire a slot, backing off on rejection instead of failing the item"""
+    for attempt in range(attempts):
+        try:
+            return await admission.acquire(tenant_id, priority)
+        except AdmissionRejected as e:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(e.retry_after)
+
 
 @app.post('/load_document')
 async def load_document(request: DocumentRequest):
@@ -47,7 +211,13 @@ async def load_document(request: DocumentRequest):
     if not document_id or not data_list or not tenant_id:
         raise HTTPException(status_code=400, detail="document_id, tenant_id and data_list are required")
 
-    DocumentService.load_document(document_id, data_list, tenant_id)
+    lease = await admission.acquire(tenant_id, Priority.INGEST)
+    try:
+        # Run off the event loop so concurrent uploads can be coalesced by the
+        # tenant's vector store writer instead of being serialized here.
+        await run_in_threadpool(profiling.run, DocumentService.load_document, document_id, data_list, tenant_id)
+    finally:
+        lease.release()
     return {"message": "document loaded successfully"}
 
 
@@ -60,8 +230,27 @@ async def load_url(request: UrlRequest):
     if not document_id or not url or not tenant_id:
         raise HTTPException(status_code=400, detail="document_id, tenant_id and url are required")
 
-    DocumentService.load_url(document_id, url, tenant_id)
-    return {"message": "url loaded successfully"}
+    lease = await admission.acquire(tenant_id, Priority.INGEST)
+    try:
+        status = await run_in_threadpool(profiling.run, DocumentService.load_url, document_id, url, tenant_id)
+    finally:
+        lease.release()
+    return {"message": "url loaded successfully", "status": status}
+
+@app.post('/refresh_urls')
+async def refresh_urls(request: RefreshRequest):
+    """Re-sync all of a tenant's URL documents with conditional requests; meant for a daily schedule"""
+    tenant_id = request.tenant_id
+
+    if not tenant_id:
+        raise HTTPException(status_code=400, detail="tenant_id is required")
+
+    lease = await admission.acquire(tenant_id, Priority.INGEST)
+    try:
+        summary = await run_in_threadpool(profiling.run, DocumentService.refresh_urls, tenant_id)
+    finally:
+        lease.release()
+    return summary
 
 @app.post('/load_website')
 async def load_website(request: WebsiteRequest):
@@ -71,10 +260,35 @@ async def load_website(request: WebsiteRequest):
     if not url or not tenant_id:
         raise HTTPException(status_code=400, detail="tenant_id and url are required")
 
-    DocumentService.load_website(url, tenant_id)
+    lease = await admission.acquire(tenant_id, Priority.INGEST)
+    try:
+        await run_in_threadpool(profiling.run, DocumentService.load_website, url, tenant_id)
+    finally:
+        lease.release()
     return {"message": "Website loaded successfully"}
 
 
+@app.post('/sync_website')
+async def sync_website(request: WebsiteRequest):
+    """Incrementally sync a site from its sitemaps; an interrupted sync resumes on the next call"""
+    url = request.url
+    tenant_id = request.tenant_id
+
+    if not url or not tenant_id:
+        raise HTTPException(status_code=400, detail="tenant_id and url are required")
+
+    from site_sync import SiteSyncError
+
+    lease = await admission.acquire(tenant_id, Priority.INGEST)
+    try:
+        summary = await run_in_threadpool(profiling.run, DocumentService.sync_website, url, tenant_id)
+    except SiteSyncError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        lease.release()
+    return summary
+
+
 @app.post('/ask_question')
 async def ask_question(request: QuestionRequest):
     question = request.question
@@ -83,9 +297,17 @@ async def ask_question(request: QuestionRequest):
     if not question or not tenant_id:
         raise HTTPException(status_code=400, detail="question and tenant_id is required")
 
-    answer = DocumentService.get_answer(question, tenant_id)
+    lease = await admission.acquire(tenant_id, Priority.CHAT)
+    try:
+        answer = await run_in_threadpool(profiling.run, DocumentService.get_answer, question, tenant_id)
+    finally:
+        lease.release()
     return answer
 
+def serialize_source_documents(documents):
+    return [{'metadata': document.metadata} for document in documents]
+
+
 @app.post('/ask_question_stream')
 async def ask_question_stream(request: QuestionRequest):
     question = request.question
@@ -94,39 +316,284 @@ async def ask_question_stream(request: QuestionRequest):
     if not question or not tenant_id:
         raise HTTPException(status_code=400, detail="question and tenant_id is required")
 
-    def generate_response():
+    # The slot is held until the stream finishes, not just until we return
+    lease = await admission.acquire(tenant_id, Priority.CHAT)
+
+    def complete_payload(chunk):
+        complete_response = chunk['complete_response']
+        return {
+            'answer': {
+                'query': question,
+                'result': complete_response['result'],
+                'source_documents': serialize_source_documents(complete_response['source_documents'])
+            }
+        }
+
+    async def generate_response():
         try:
-            for chunk in DocumentService.get_answer_stream(question, tenant_id):
-                if chunk['is_last']:
-                    # Last chunk - send complete response data
-                    complete_response = chunk['complete_response']
-                    serialized_response = {
-                        'query': question,
-                        'result': complete_response['result'],
-                        'source_documents': [
-                            {'metadata': document.metadata}
-                            for document in complete_response['source_documents']
-                        ]
-                    }
-                    yield f"data: {json.dumps({'type': 'token', 'content': chunk['token'], 'complete': True, 'answer': serialized_response})}\n\n"
-                else:
-                    # Send individual token
-                    yield f"data: {json.dumps({'type': 'token', 'content': chunk['token'], 'complete': False})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+            async for frame in stream_token_events(
+                DocumentService.get_answer_stream(question, tenant_id), complete_payload
+            ):
+                yield frame
+        finally:
+            lease.release()
 
     return StreamingResponse(
         generate_response(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "*",
-            "Access-Control-Allow-Headers": "*",
-        }
+        media_type="text/event-stream",
+        # Also release if the client goes away before the stream starts
+        background=BackgroundTask(lease.release),
+        headers=SSE_HEADERS
     )
 
+
+@app.websocket('/ws/chat/{tenant_id}')
+async def chat_socket(websocket: WebSocket, tenant_id: str):
+    """
+    One socket per chat session.
+
+    Client messages:
+        {"type": "question", "id": "...", "question": "..."}  starts an answer,
+            cancelling the one in progress
+        {"type": "cancel"}  stops the answer in progress
+        {"type": "ping"}
+
+    Server messages are the same sources and token payloads as the SSE
+    stream plus the question id, and "cancelled" / "error" / "pong" notices. An idle socket
+    holds nothing but the connection itself; the tenant's vector store is
+    shared through DocumentService and stays open while sessions use it.
+    """
+    await websocket.accept()
+    if DocumentService.tenant_exists(tenant_id):
+        await run_in_threadpool(DocumentService.get_vectordb, tenant_id)
+
+    async def send(payload):
+        await websocket.send_text(orjson.dumps(payload).decode())
+
+    async def notify(payload):
+        """Send a notice from an answer task; the socket may already be closed"""
+        try:
+            await send(payload)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def answer(question_id, question):
+        try:
+            lease = await admission.acquire(tenant_id, Priority.CHAT)
+        except AdmissionRejected as e:
+            await notify({'type': 'error', 'id': question_id, 'content': e.reason, 'retry_after': e.retry_after})
+            return
+        try:
+            with span('chat.question', tenant_id=tenant_id, question_id=question_id):
+                async for payload in coalesce_tokens(
+                    DocumentService.get_answer_stream(question, tenant_id),
+                    lambda chunk: {'answer': {
+                        'query': question,
+                        'result': chunk['complete_response']['result'],
+                        'source_documents': serialize_source_documents(chunk['complete_response']['source_documents'])
+                    }}
+                ):
+                    if payload is not None:
+                        payload['id'] = question_id
+                        await send(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Chat answer failed for tenant {tenant_id}: {str(e)}")
+            await notify({'type': 'error', 'id': question_id, 'content': str(e)})
+        finally:
+            lease.release()
+
+    current = None
+    current_id = None
+
+    async def cancel_current():
+        nonlocal current
+        if current is not None and not current.done():
+            current.cancel()
+            try:
+                await current
+            except asyncio.CancelledError:
+                pass
+            await send({'type': 'cancelled', 'id': current_id})
+        current = None
+
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(frame.get('code', 1000))
+            if frame.get('text') is None:
+                await send({'type': 'error', 'content': 'Messages must be text frames'})
+                continue
+            try:
+                message = orjson.loads(frame['text'])
+            except orjson.JSONDecodeError:
+                await send({'type': 'error', 'content': 'Messages must be JSON'})
+                continue
+            kind = message.get('type') if isinstance(message, dict) else None
+            if kind == 'question':
+                question = (message.get('question') or '').strip()
+                if not question:
+                    await send({'type': 'error', 'id': message.get('id'), 'content': 'question is required'})
+                    continue
+                await cancel_current()
+                current_id = message.get('id')
+                current = asyncio.create_task(answer(current_id, question))
+            elif kind == 'cancel':
+                await cancel_current()
+            elif kind == 'ping':
+                await send({'type': 'pong'})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if current is not None and not current.done():
+            current.cancel()
+
+
+@app.post('/search')
+async def search(request: SearchRequest):
+    if not request.query or not request.tenant_id:
+        raise HTTPException(status_code=400, detail="query and tenant_id are required")
+    if not 1 <= request.k <= MAX_SEARCH_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_SEARCH_K}")
+    if not DocumentService.tenant_exists(request.tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant ID not found")
+
+    lease = await admission.acquire(request.tenant_id, Priority.CHAT)
+    try:
+        return await run_in_threadpool(
+            profiling.run, DocumentService.search, request.tenant_id, request.query, request.k,
+            request.document_ids, request.cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        lease.release()
+
+
+@app.post('/search/batch')
+async def search_batch(request: BatchSearchRequest):
+    if not request.queries or not request.tenant_id:
+        raise HTTPException(status_code=400, detail="queries and tenant_id are required")
+    if len(request.queries) > MAX_SEARCH_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SEARCH_BATCH} queries per batch")
+    if not 1 <= request.k <= MAX_SEARCH_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_SEARCH_K}")
+    if not DocumentService.tenant_exists(request.tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant ID not found")
+
+    lease = await admission.acquire(request.tenant_id, Priority.CHAT)
+    try:
+        results = await run_in_threadpool(
+            profiling.run, DocumentService.search_batch, request.tenant_id, request.queries, request.k, request.document_ids
+        )
+    finally:
+        lease.release()
+    return {'results': results}
+
+
+@app.post('/ask_batch')
+async def ask_batch(request: BatchQuestionRequest):
+    """
+    Answer many questions with bounded concurrency and stream results as NDJSON
+    in completion order. Questions sharing a conversation_id run in order with
+    their own history; all other questions are independent and stateless.
+    Tenant memory is never touched.
+    """
+    tenant_id = request.tenant_id
+
+    if not tenant_id or not request.questions:
+        raise HTTPException(status_code=400, detail="tenant_id and questions are required")
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+    if not DocumentService.tenant_exists(tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant ID not found")
+
+    # Batches are not served from the answer cache, so an exhausted budget rejects them outright
+    if await run_in_threadpool(usage_tracker.level, tenant_id) == 'cached_only':
+        raise HTTPException(status_code=402, detail="Usage budget exceeded")
+
+    # One retriever and client for the whole batch
+    chain = await run_in_threadpool(DocumentService.build_stateless_chain, tenant_id)
+
+    groups = OrderedDict()
+    for index, item in enumerate(request.questions):
+        key = ('conversation', item.conversation_id) if item.conversation_id else ('item', index)
+        groups.setdefault(key, []).append((index, item))
+
+    semaphore = asyncio.Semaphore(max(1, min(request.concurrency, MAX_BATCH_CONCURRENCY)))
+    finished = asyncio.Queue()
+    # Set when the budget runs out mid-batch; questions not started by then are skipped
+    budget_exhausted = asyncio.Event()
+
+    async def run_group(items):
+        history = []
+        for index, item in items:
+            record = {'type': 'result', 'index': index, 'id': item.id, 'conversation_id': item.conversation_id}
+            async with semaphore:
+                # Checked per question, so the spend of earlier answers counts and a
+                # batch overshoots the budget by at most the questions in flight
+                if budget_exhausted.is_set() or \
+                        await run_in_threadpool(usage_tracker.level, tenant_id) == 'cached_only':
+                    budget_exhausted.set()
+                    return
+                try:
+                    lease = await acquire_with_retry(tenant_id, Priority.BATCH)
+                    try:
+                        answer = await run_in_threadpool(
+                            profiling.run, DocumentService.answer_stateless, chain, item.question, list(history)
+                        )
+                    finally:
+                        lease.release()
+                    record.update(answer)
+                    history.append((item.question, answer['result']))
+                except Exception as e:
+                    record.update({'query': item.question, 'error': str(e)})
+            await finished.put(record)
+
+    async def run_groups(tasks):
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await finished.put(None)
+
+    async def generate_results():
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(run_group(items)) for items in groups.values()]
+        tasks.append(asyncio.create_task(run_groups(list(tasks))))
+        usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'total_cost': 0.0}
+        answered = 0
+        errors = 0
+        try:
+            while True:
+                record = await finished.get()
+                if record is None:
+                    break
+                answered += 1
+                if 'error' in record:
+                    errors += 1
+                else:
+                    for field in usage:
+                        usage[field] += record['usage'][field]
+                yield json.dumps(record) + "\n"
+            skipped = len(request.questions) - answered
+            if budget_exhausted.is_set():
+                yield json.dumps({'type': 'error', 'error': 'Usage budget exceeded', 'skipped': skipped}) + "\n"
+            yield json.dumps({
+                'type': 'summary',
+                'count': len(request.questions),
+                'errors': errors,
+                'skipped': skipped,
+                'usage': usage,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+            }) + "\n"
+        finally:
+            # Stop outstanding work if the client goes away
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+
+
 @app.post('/clear_memory')
 async def clear_memory(request: MemoryRequest):
     tenant_id = request.tenant_id
@@ -141,6 +608,111 @@ async def get_history(tenant_id: str):
     return DocumentService.memories[tenant_id].chat_memory.messages
 
 
+@app.get('/usage/{tenant_id}')
+async def get_usage(tenant_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Token usage and cost of a tenant per day, model and operation between
+    start and end (YYYY-MM-DD, inclusive), with current spend against budget.
+    """
+    rows = await run_in_threadpool(usage_tracker.usage, tenant_id, start, end)
+    totals = {
+        field: sum(row[field] for row in rows)
+        for field in ('requests', 'prompt_tokens', 'completion_tokens', 'cost')
+    }
+    return {
+        'tenant_id': tenant_id,
+        'usage': rows,
+        'totals': totals,
+        'spend': await run_in_threadpool(usage_tracker.spend, tenant_id),
+        'budget': await run_in_threadpool(usage_tracker.get_budget, tenant_id),
+    }
+
+
+@app.get('/budgets/{tenant_id}')
+async def get_budget(tenant_id: str):
+    budget = await run_in_threadpool(usage_tracker.get_budget, tenant_id)
+    level = await run_in_threadpool(usage_tracker.level, tenant_id)
+    return {'tenant_id': tenant_id, **budget, 'level': level}
+
+
+@app.put('/budgets/{tenant_id}')
+async def set_budget(tenant_id: str, request: BudgetRequest):
+    """Set a tenant's daily and monthly spend limits in USD"""
+    for limit in (request.daily_limit, request.monthly_limit):
+        if limit is not None and limit < 0:
+            raise HTTPException(status_code=400, detail="Budget limits must not be negative")
+    await run_in_threadpool(usage_tracker.set_budget, tenant_id, request.daily_limit, request.monthly_limit)
+    return {'tenant_id': tenant_id, 'daily_limit': request.daily_limit, 'monthly_limit': request.monthly_limit}
+
+
+@app.get('/index_profile/{tenant_id}')
+async def get_index_profile(tenant_id: str):
+    if not DocumentService.tenant_exists(tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant ID not found")
+    return await run_in_threadpool(DocumentService.index_profile, tenant_id)
+
+
+@app.put('/index_profile/{tenant_id}')
+async def set_index_profile(tenant_id: str, request: IndexProfileRequest):
+    """Set the search_ef a tenant's HNSW index is queried with; see tune_hnsw.py for a recommendation"""
+    if not 1 <= request.search_ef <= MAX_SEARCH_EF:
+        raise HTTPException(status_code=400, detail=f"search_ef must be between 1 and {MAX_SEARCH_EF}")
+    if not DocumentService.tenant_exists(tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant ID not found")
+    try:
+        return await run_in_threadpool(DocumentService.set_search_ef, tenant_id, request.search_ef)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get('/stats')
+async def get_stats():
+    """Runtime counters for admission control and request coalescing"""
+    return {
+        'admission': admission.stats(),
+        'coalescing': DocumentService.single_flight.get_stats()
+    }
+
+
+@app.get('/metrics')
+async def get_metrics():
+    """Prometheus text exposition, summed over every worker"""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get('/profiles')
+async def list_profiles(request: Request, limit: int = 100):
+    """Captured request profiles, newest first. Requires the profiling admin token."""
+    if not profiling.is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    return {'profiles': await run_in_threadpool(profiling.list_profiles, limit)}
+
+
+@app.get('/profiles/{profile_id}')
+async def get_profile(request: Request, profile_id: str):
+    """Collapsed stacks of one profile, for flamegraph.pl or speedscope"""
+    if not profiling.is_admin(request.headers):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    path = await run_in_threadpool(profiling.profile_path, profile_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path, encoding='utf-8') as f:
+        return PlainTextResponse(f.read())
+
+
+@app.get('/startup')
+async def get_startup():
+    """Startup milestones and import-time breakdown of this worker"""
+    return startup.report()
+
+
+@app.get('/ready')
+async def readiness_check():
+    """Readiness for routing traffic: 200 once warm-up has finished or timed out, 503 with progress before"""
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
+
 @app.get('/health')
 async def health_check():
     """Health check endpoint for Docker and load balancers"""
@@ -0,0 +1,114 @@
+import os
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Metrics of the LLM service, kept with prometheus_client like the web app's.
+# When PROMETHEUS_MULTIPROC_DIR is set, every worker process writes its
+# samples there and a scrape of any worker returns the sum over all of them.
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, from fast-path checks up to slow generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+
+def render() -> bytes:
+    """Prometheus text exposition, aggregated across workers in multiprocess mode"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+# Tenants are labelled by tier only, never by id, to keep series counts flat.
+# TENANT_TIERS is a comma separated list of tenant_id=tier pairs.
+DEFAULT_TENANT_TIER = os.getenv('DEFAULT_TENANT_TIER', 'standard')
+_TENANT_TIERS = dict(
+    pair.split('=', 1) for pair in os.getenv('TENANT_TIERS', '').split(',') if '=' in pair
+)
+
+
+def tenant_tier(tenant_id: str) -> str:
+    return _TENANT_TIERS.get(tenant_id, DEFAULT_TENANT_TIER)
+
+
+# Question answering stages
+INTENT_FASTPATH_SECONDS = Histogram(
+    'chatminds_intent_fastpath_seconds', 'Time spent on greeting/conversational intent detection',
+    ['intent', 'tier'],
+    buckets=DEFAULT_BUCKETS)
+RETRIEVAL_SECONDS = Histogram(
+    'chatminds_retrieval_seconds', 'Vector store retrieval latency', ['tier'],
+    buckets=DEFAULT_BUCKETS)
+CONTEXT_COMPRESSION_SECONDS = Histogram(
+    'chatminds_context_compression_seconds', 'Time spent compressing retrieved context', ['tier'],
+    buckets=DEFAULT_BUCKETS)
+CONTEXT_TOKENS = Counter(
+    'chatminds_context_tokens_total', 'Retrieved context tokens before and after compression', ['stage', 'tier'])
+CONDENSE_SECONDS = Histogram(
+    'chatminds_condense_seconds', 'Time spent condensing follow-up questions with the LLM', ['tier'],
+    buckets=DEFAULT_BUCKETS)
+TIME_TO_SOURCES_SECONDS = Histogram(
+    'chatminds_time_to_sources_seconds', 'Time from question to the sources event of a streamed answer', ['tier'],
+    buckets=DEFAULT_BUCKETS)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    'chatminds_time_to_first_token_seconds', 'Time from question to first streamed answer token', ['tier'],
+    buckets=DEFAULT_BUCKETS)
+ANSWERS_CANCELLED = Counter(
+    'chatminds_answers_cancelled_total', 'Streamed answers stopped because every client went away',
+    ['stage', 'tier'])
+CANCELLED_TOKENS_SAVED = Counter(
+    'chatminds_cancelled_tokens_saved_total', 'Estimated answer tokens not generated thanks to cancellation',
+    ['tier'])
+GENERATION_SECONDS = Histogram(
+    'chatminds_generation_seconds', 'Answer generation time of the LLM', ['mode', 'tier'],
+    buckets=DEFAULT_BUCKETS)
+GENERATION_TOKENS_PER_SECOND = Histogram(
+    'chatminds_generation_tokens_per_second', 'Answer generation throughput', ['mode', 'tier'],
+    buckets=RATE_BUCKETS)
+
+# Ingestion stages: extract, clean, split, embed, persist
+INGEST_STAGE_SECONDS = Histogram(
+    'chatminds_ingest_stage_seconds', 'Document ingestion time per stage', ['stage', 'tier'],
+    buckets=DEFAULT_BUCKETS)
+URL_FETCHES = Counter(
+    'chatminds_url_fetches_total', 'URL document fetches by outcome', ['result', 'tier'])
+
+# Spend
+LLM_TOKENS = Counter(
+    'chatminds_llm_tokens_total', 'Tokens sent to and received from the model provider',
+    ['kind', 'operation', 'tier'])
+BUDGET_DEGRADED = Counter(
+    'chatminds_budget_degraded_total', 'Answers degraded because a tenant is near or over budget',
+    ['level', 'tier'])
+
+# Connection reuse of the shared OpenAI connection pools
+OPENAI_HTTP_REQUESTS = Counter(
+    'chatminds_openai_http_requests_total', 'Requests to the OpenAI API by whether they opened a connection',
+    ['client', 'connection'])
+OPENAI_HTTP_CONNECTIONS = Counter(
+    'chatminds_openai_http_connections_opened_total', 'Connections opened to the OpenAI API', ['client'])
+
+CACHE_REQUESTS = Counter(
+    'chatminds_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result'])
+ERRORS = Counter(
+    'chatminds_errors_total', 'Errors by operation', ['operation', 'tier'])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'chatminds_http_request_seconds', 'HTTP request latency by route', ['method', 'route', 'status'],
+    buckets=DEFAULT_BUCKETS)
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    'chatminds_admission_wait_seconds', 'Time requests waited for an admission slot', ['priority'],
+    buckets=DEFAULT_BUCKETS)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'chatminds_admission_queue_depth', 'Requests waiting for an admission slot', ['priority'],
+    multiprocess_mode='livesum')
+ADMISSION_ACTIVE = Gauge(
+    'chatminds_admission_active', 'Requests holding an admission slot', multiprocess_mode='livesum')
+ADMISSION_REJECTED = Counter(
+    'chatminds_admission_rejected_total', 'Requests rejected by admission control', ['reason'])
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Shrink the vector indexes of existing tenants.
+
+text-embedding-3 vectors can be shortened: the first d components of a
+vector, renormalised, are what the API returns for dimensions=d. Tenants
+are therefore migrated from their stored vectors and nothing is embedded
+again.
+
+    report   recall@k and index memory for combinations of dimensions and
+             flat index storage type, measured on one tenant's own vectors.
+             Held-out chunks are the queries, and exact search over the
+             full vectors is the ground truth:
+
+                 python migrate_embeddings.py report --tenant <id> --dimensions 1536,1024,512,256
+
+    migrate  move tenants to fewer dimensions and/or another storage type:
+
+                 python migrate_embeddings.py migrate --all --dimensions 512 --dtype int8
+
+    documents  build the document index used for two-stage retrieval, for
+               tenants that have not been written to since it was added:
+
+                 python migrate_embeddings.py documents --all
+
+A flat index tenant is re-encoded in place. A Chroma tenant small enough
+for the flat index moves to it. A larger one has its collection rebuilt with
+the shorter vectors, which keep float32 storage in Chroma. Each tenant is
+migrated under its write lock, but the service caches open stores and query
+embeddings, so restart it after migrating.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from filelock import FileLock
+
+import vector_stores
+from flat_index import FlatIndex, DTYPES
+
+COLLECTION = 'langchain'  # the collection name the LangChain wrapper uses
+READ_BATCH = 5000
+SCRATCH_DIRECTORY = 'migration'  # inside the tenant directory
+SCRATCH_COMPLETE = 'complete'
+
+
+def truncate(vectors, dimensions):
+    """Shorten vectors to their first dimensions components, renormalised."""
+    if dimensions is None or dimensions == vectors.shape[1]:
+        shortened = vectors
+    elif dimensions > vectors.shape[1]:
+        raise ValueError(f"Cannot grow {vectors.shape[1]}-dimensional vectors to {dimensions} "
+                         "without embedding again")
+    else:
+        shortened = vectors[:, :dimensions]
+    norms = np.linalg.norm(shortened, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (shortened / norms).astype(np.float32)
+
+
+def _collection(directory):
+    import chromadb
+    return chromadb.PersistentClient(path=directory).get_or_create_collection(COLLECTION)
+
+
+def read_chroma(directory):
+    """Every chunk of a Chroma tenant as (ids, vectors, texts, metadatas)."""
+    collection = _collection(directory)
+    ids, vectors, texts, metadatas = [], [], [], []
+    for offset in range(0, collection.count(), READ_BATCH):
+        batch = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=READ_BATCH, offset=offset)
+        ids.extend(batch['ids'])
+        vectors.extend(batch['embeddings'])
+        texts.extend(batch['documents'])
+        metadatas.extend(batch['metadatas'])
+    return ids, np.asarray(vectors, dtype=np.float32), texts, metadatas
+
+
+def read_tenant(directory):
+    """A tenant's chunks as (ids, vectors, texts, metadatas), whichever backend holds them."""
+    backend = vector_stores.backend_of(directory)
+    if backend == 'flat':
+        index = FlatIndex(directory)
+        index.refresh()
+        return list(index.ids), index.vectors_float32(), list(index.texts), list(index.metadatas)
+    if backend == 'chroma':
+        return read_chroma(directory)
+    raise FileNotFoundError(f"No vector store in {directory}")
+
+
+def _remove_chroma(directory):
+    os.remove(os.path.join(directory, vector_stores.CHROMA_FILE))
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            uuid.UUID(name)
+        except ValueError:
+            continue
+        if os.path.isdir(path):  # an HNSW segment
+            shutil.rmtree(path)
+
+
+def rebuild_chroma(directory, dimensions=None, profile=None):
+    """
+    Rebuild a Chroma collection with shortened vectors and/or another HNSW
+    profile (default: the tenant's current one). The vectors are copied to a
+    scratch flat index first, so a run interrupted after the old collection
+    is dropped resumes from it.
+    """
+    profile = profile or vector_stores.index_profile(directory)
+    scratch_directory = os.path.join(directory, SCRATCH_DIRECTORY)
+    scratch = FlatIndex(scratch_directory, 'float32')
+    if not os.path.exists(os.path.join(scratch_directory, SCRATCH_COMPLETE)):
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+        ids, vectors, texts, metadatas = read_chroma(directory)
+        for start in range(0, len(ids), READ_BATCH):
+            stop = start + READ_BATCH
+            scratch.append(truncate(vectors[start:stop], dimensions), texts[start:stop], metadatas[start:stop],
+                           ids[start:stop])
+        open(os.path.join(scratch_directory, SCRATCH_COMPLETE), 'w').close()
+    import chromadb
+    client = chromadb.PersistentClient(path=directory)
+    client.delete_collection(COLLECTION)
+    collection = client.create_collection(COLLECTION, metadata=vector_stores.collection_metadata(profile))
+    batch = ([], [], [], [])
+    for row in scratch.rows():
+        for column, value in zip(batch, row):
+            column.append(value)
+        if len(batch[0]) >= READ_BATCH:
+            collection.add(ids=batch[0], embeddings=batch[1], documents=batch[2], metadatas=batch[3])
+            batch = ([], [], [], [])
+    if batch[0]:
+        collection.add(ids=batch[0], embeddings=batch[1], documents=batch[2], metadatas=batch[3])
+    vector_stores.write_index_profile(directory, profile)
+    shutil.rmtree(scratch_directory)
+    return len(scratch)
+
+
+def migrate_tenant(directory, model, dimensions, dtype, dry_run=False):
+    """Migrate one tenant; returns what was done."""
+    with FileLock(os.path.join(directory, '.write.lock')):
+        backend = vector_stores.backend_of(directory)
+        if backend is None:
+            return {'tenant': os.path.basename(directory), 'action': 'skipped', 'reason': 'no vector store'}
+        started = time.perf_counter()
+        count = len(FlatIndex(directory)) if backend == 'flat' else _collection(directory).count()
+        if backend == 'flat':
+            action = 'reencoded'
+        elif os.path.exists(os.path.join(directory, SCRATCH_DIRECTORY, SCRATCH_COMPLETE)):
+            action = 'rebuilt_chroma'  # resume an interrupted rebuild; the collection may be partial
+        elif count <= vector_stores.FLAT_INDEX_MAX_CHUNKS and vector_stores.VECTOR_STORE_BACKEND != 'chroma':
+            action = 'moved_to_flat'
+        else:
+            action = 'rebuilt_chroma'
+        result = {'tenant': os.path.basename(directory), 'backend': backend, 'chunks': count, 'action': action}
+        if dry_run or (not count and action != 'rebuilt_chroma'):
+            return result
+        if action == 'reencoded':
+            index = FlatIndex(directory)
+            index.rebuild(truncate(index.vectors_float32(), dimensions), dtype)
+        elif action == 'moved_to_flat':
+            ids, vectors, texts, metadatas = read_chroma(directory)
+            # One append writes the manifest once, so the tenant switches
+            # backend only when every row is in place
+            FlatIndex(directory, dtype).append(truncate(vectors, dimensions), texts, metadatas, ids)
+            _remove_chroma(directory)
+        else:
+            result['chunks'] = rebuild_chroma(directory, dimensions)
+        if dimensions is not None:
+            vector_stores.record_embedding(directory, model, dimensions, overwrite=True)
+        # Centroids must have the dimensions of the chunk vectors
+        result['documents'] = vector_stores.build_document_index(directory, vector_stores.open_store(directory, None))
+        if action != 'rebuilt_chroma':
+            result.update(FlatIndex(directory).stats())
+        result['seconds'] = round(time.perf_counter() - started, 1)
+        return result
+
+
+def index_documents(directory):
+    """Build one tenant's document index from its stored chunk vectors."""
+    with FileLock(os.path.join(directory, '.write.lock')):
+        if vector_stores.backend_of(directory) is None:
+            return {'tenant': os.path.basename(directory), 'action': 'skipped', 'reason': 'no vector store'}
+        store = vector_stores.open_store(directory, None)
+        return {'tenant': os.path.basename(directory), 'action': 'indexed',
+                'documents': vector_stores.build_document_index(directory, store)}
+
+
+def report(directory, dimension_options, dtypes, queries, k, rescore):
+    """Recall@k and memory of every combination of dimensions and storage type."""
+    ids, vectors, texts, metadatas = read_tenant(directory)
+    if len(ids) <= queries:
+        raise ValueError(f"Tenant has {len(ids)} chunks, need more than --queries {queries}")
+    rng = np.random.default_rng(0)
+    held_out = rng.choice(len(ids), size=queries, replace=False)
+    indexed = np.setdiff1d(np.arange(len(ids)), held_out)
+    full = truncate(vectors[indexed], None)
+    query_vectors = truncate(vectors[held_out], None)
+    truth = [set(np.argsort(-(full @ query))[:k]) for query in query_vectors]
+
+    for dimensions in dimension_options:
+        shortened = truncate(full, dimensions)
+        shortened_queries = truncate(query_vectors, dimensions)
+        for dtype in dtypes:
+            root = tempfile.mkdtemp(prefix='embedding-report-')
+            try:
+                index = FlatIndex(root, dtype)
+                index.append(shortened, [''] * len(indexed), [{} for _ in indexed],
+                             [str(row) for row in range(len(indexed))])
+                stats = index.stats()
+                for rescore_factor in ([0, rescore] if dtype != 'float32' else [0]):
+                    recalls, latencies = [], []
+                    for query, expected in zip(shortened_queries, truth):
+                        started = time.perf_counter()
+                        hits = index.search(query, k, rescore=rescore_factor)
+                        latencies.append((time.perf_counter() - started) * 1000)
+                        recalls.append(len({int(hit[0]) for hit in hits} & expected) / k)
+                    print(json.dumps({
+                        'dimensions': int(shortened.shape[1]), 'dtype': dtype, 'rescore': rescore_factor,
+                        f'recall@{k}': round(statistics.mean(recalls), 4),
+                        'p50_ms': round(statistics.median(latencies), 2),
+                        'memory_bytes_per_chunk': round(stats['scan_bytes'] / len(indexed), 1),
+                        'memory_mb': round(stats['scan_bytes'] / 1024 / 1024, 2),
+                        'disk_mb': round(stats['disk_bytes'] / 1024 / 1024, 2),
+                        'chunks': len(indexed),
+                    }))
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+
+
+def _tenant_directories(args):
+    if args.all:
+        return sorted(os.path.join(args.data, name) for name in os.listdir(args.data)
+                      if os.path.isdir(os.path.join(args.data, name)))
+    return [os.path.join(args.data, tenant) for tenant in args.tenant]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='./data', help='Directory holding the tenant directories')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    report_parser = commands.add_parser('report', help='Recall and memory per dimensions and storage type')
+    report_parser.add_argument('--tenant', required=True)
+    report_parser.add_argument('--dimensions', default='1536,1024,512,256')
+    report_parser.add_argument('--dtypes', default=','.join(DTYPES))
+    report_parser.add_argument('--queries', type=int, default=200)
+    report_parser.add_argument('--k', type=int, default=5)
+    report_parser.add_argument('--rescore', type=int, default=vector_stores.FLAT_INDEX_RESCORE_FACTOR)
+
+    migrate_parser = commands.add_parser('migrate', help='Migrate tenants to fewer dimensions or another dtype')
+    tenants = migrate_parser.add_mutually_exclusive_group(required=True)
+    tenants.add_argument('--tenant', action='append')
+    tenants.add_argument('--all', action='store_true')
+    migrate_parser.add_argument('--dimensions', type=int,
+                                default=int(os.getenv('EMBEDDING_DIMENSIONS') or 0) or None,
+                                help='Target dimensions (default EMBEDDING_DIMENSIONS, else unchanged)')
+    migrate_parser.add_argument('--dtype', choices=list(DTYPES), default=vector_stores.FLAT_INDEX_DTYPE,
+                                help='Flat index storage type (default FLAT_INDEX_DTYPE)')
+    migrate_parser.add_argument('--model', default='text-embedding-3-small')
+    migrate_parser.add_argument('--dry-run', action='store_true')
+
+    documents_parser = commands.add_parser('documents', help='Build the document index of tenants')
+    tenants = documents_parser.add_mutually_exclusive_group(required=True)
+    tenants.add_argument('--tenant', action='append')
+    tenants.add_argument('--all', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        report(os.path.join(args.data, args.tenant), [int(value) for value in args.dimensions.split(',')],
+               args.dtypes.split(','), args.queries, args.k, args.rescore)
+        return
+
+    for directory in _tenant_directories(args):
+        try:
+            if args.command == 'documents':
+                result = index_documents(directory)
+            else:
+                result = migrate_tenant(directory, args.model, args.dimensions, args.dtype, args.dry_run)
+        except Exception as e:
+            result = {'tenant': os.path.basename(directory), 'action': 'failed', 'error': str(e)}
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Opt-in request profiling. A request is profiled when it carries the admin
+# token in the X-Profile header, or when it is picked by PROFILE_SAMPLE_RATE;
+# sampled profiles are only kept if the request took at least PROFILE_SLOW_MS.
+ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '2000'))
+INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000.0
+PROFILE_DIRECTORY = os.getenv('PROFILE_DIR', './logs/profiles')
+INDEX_FILE = 'index.jsonl'
+MAX_STACK_DEPTH = 128
+
+_current: contextvars.ContextVar[Optional['Profile']] = contextvars.ContextVar('profile', default=None)
+
+
+class Profile:
+    """Stack samples of the threads working on one request."""
+
+    def __init__(self, route: str, trigger: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.trigger = trigger
+        self.created = time.time()
+        self.started = time.perf_counter()
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+
+    @contextmanager
+    def attach(self):
+        ident = threading.get_ident()
+        with _sampler.lock:
+            self.threads.add(ident)
+        try:
+            yield
+        finally:
+            with _sampler.lock:
+                self.threads.discard(ident)
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Sampler:
+    """
+    One background thread samples every active profile, and only while at
+    least one profile is active; an idle service pays nothing.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = set()
+        self.thread = None
+
+    def add(self, profile: Profile) -> None:
+        with self.lock:
+            self.profiles.add(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self.thread.start()
+
+    def remove(self, profile: Profile) -> None:
+        with self.lock:
+            self.profiles.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            with self.lock:
+                if not self.profiles:
+                    self.thread = None
+                    return
+                targets = [(profile, list(profile.threads)) for profile in self.profiles]
+            frames = sys._current_frames()
+            for profile, threads in targets:
+                for ident in threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.stacks[_collapse(frame)] += 1
+                        profile.samples += 1
+            del frames
+            time.sleep(INTERVAL)
+
+
+_sampler = _Sampler()
+
+
+def start(headers: Any, route: str) -> Optional[Profile]:
+    """Start profiling a request if one of the triggers applies."""
+    if is_admin(headers):
+        trigger = 'header'
+    elif SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        trigger = 'sampled'
+    else:
+        return None
+    profile = Profile(route, trigger)
+    _sampler.add(profile)
+    return profile
+
+
+def activate(profile: Profile) -> contextvars.Token:
+    """Make profile the current request's profile for code run in this context."""
+    return _current.set(profile)
+
+
+def finish(profile: Profile, status: int) -> Optional[Dict[str, Any]]:
+    """
+    Stop sampling and write the profile if it should be kept.
+
+    Returns:
+        dict: Index entry of the written profile, or None if it was discarded
+    """
+    _sampler.remove(profile)
+    duration_ms = (time.perf_counter() - profile.started) * 1000
+    if profile.trigger == 'sampled' and duration_ms < SLOW_MS:
+        return None
+    if not profile.stacks:
+        return None
+
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    file_name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(profile.created))}-{profile.id}.collapsed"
+    with open(os.path.join(PROFILE_DIRECTORY, file_name), 'w', encoding='utf-8') as f:
+        for stack, count in profile.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    entry = {
+        'id': profile.id,
+        'file': file_name,
+        'route': profile.route,
+        'trigger': profile.trigger,
+        'status': status,
+        'duration_ms': round(duration_ms, 1),
+        'samples': profile.samples,
+        'created': profile.created,
+    }
+    with open(os.path.join(PROFILE_DIRECTORY, INDEX_FILE), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+    logger.info(f"Captured {profile.trigger} profile {profile.id} for {profile.route} ({entry['duration_ms']} ms)")
+    return entry
+
+
+@contextmanager
+def attach():
+    """Sample the calling thread for the current request's profile, if any."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.attach():
+        yield
+
+
+def run(function: Callable, *args, **kwargs) -> Any:
+    """Call function on a worker thread so the request's profile samples it."""
+    with attach():
+        return function(*args, **kwargs)
+
+
+def is_admin(headers: Any) -> bool:
+    requested = headers.get('x-profile')
+    return bool(requested and ADMIN_TOKEN and hmac.compare_digest(requested, ADMIN_TOKEN))
+
+
+def list_profiles(limit: int = 100) -> List[Dict[str, Any]]:
+    """Most recent captured profiles first."""
+    index_path = os.path.join(PROFILE_DIRECTORY, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return entries[::-1][:limit]
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    for entry in list_profiles(limit=sys.maxsize):
+        if entry['id'] == profile_id:
+            return os.path.join(PROFILE_DIRECTORY, entry['file'])
+    return None
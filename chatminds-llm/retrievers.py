@@ -0,0 +1,186 @@
+import math
+import re
+import time
+import logging
+from collections import Counter
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, Callbacks
+from langchain_core.documents import Document
+from langchain_core.documents.compressor import BaseDocumentCompressor
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+import tracing
+from metrics import CONTEXT_COMPRESSION_SECONDS, CONTEXT_TOKENS
+from usage import token_counts
+from vector_stores import FLAT_INDEX_RESCORE_FACTOR
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+WORD = re.compile(r'\w+')
+STOPWORDS = frozenset(
+    'a an and are as at be by can do does for from has have how i in is it its of on or our should that the their '
+    'there this to was what when where which who why will with you your'.split())
+
+
+def _with_relevance(hits):
+    """
+    Documents of (document, squared L2 distance) hits, with the chunk's
+    cosine similarity to the query in metadata['relevance'] (embeddings are
+    unit length, so cosine = 1 - distance / 2)
+    """
+    return [Document(page_content=document.page_content,
+                     metadata={**document.metadata, 'relevance': round(1 - distance / 2, 4)})
+            for document, distance in hits]
+
+
+def _terms(text):
+    """Lowercased words with a plural 's' dropped, so 'refunds' matches 'refund'"""
+    return [word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+            for word in WORD.findall(text.lower())]
+
+
+class SimilarityRetriever(BaseRetriever):
+    """
+    Plain top-k similarity search. The query is embedded with embed, the
+    tenant's cached query embedding. Each chunk carries its similarity to
+    the query in metadata['relevance'], which the compressor ranks by.
+    """
+
+    vectorstore: VectorStore
+    embed: Any  # texts -> vectors
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return _with_relevance(self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            self.embed([query])[0], k=self.k))
+
+
+class TwoStageRetriever(BaseRetriever):
+    """
+    Document-then-chunk retrieval for large tenants. The query is matched
+    against one centroid per document first, and only the chunks of the
+    nearest documents are searched, so the chunk search no longer grows with
+    the whole corpus. Chunks carry metadata['relevance'] as above.
+    """
+
+    vectorstore: VectorStore
+    document_index: Any  # FlatIndex of document centroids
+    embed: Any  # texts -> vectors
+    k: int = 4
+    documents_k: int = 10
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector = self.embed([query])[0]
+        with tracing.span('retrieve.documents', documents_k=self.documents_k):
+            nearest = self.document_index.search(vector, self.documents_k, rescore=FLAT_INDEX_RESCORE_FACTOR)
+        if not nearest:
+            return _with_relevance(self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                vector, k=self.k))
+        document_ids = [document_id for document_id, _, _, _ in nearest]
+        with tracing.span('retrieve.chunks', documents=len(document_ids)):
+            return _with_relevance(self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                vector, k=self.k, filter={'document_id': {'$in': document_ids}}))
+
+
+class ExtractiveCompressor(BaseDocumentCompressor):
+    """
+    Trims retrieved chunks to the sentences that answer the query, so the
+    answer prompt is shorter and the first token comes sooner. Scoring is
+    local and CPU-only: nothing is sent to the embeddings provider.
+
+    Each sentence is scored by BM25 against the query terms plus a weighted
+    relevance of its chunk: the chunk's similarity to the query from the
+    store (metadata['relevance']), or its rank when that is missing. So a
+    sentence that paraphrases the query still ranks by how relevant its
+    chunk is. The best top_chunk_sentences of the top-ranked chunk are
+    always kept; the rest are added best first while they fit in
+    token_budget. Repeated sentences (chunk overlap) are kept once. Each
+    chunk keeps its metadata and its kept sentences in their original order;
+    chunks with none left are dropped.
+    """
+
+    token_budget: int
+    relevance_weight: float = 0.5
+    top_chunk_sentences: int = 2
+    tier: str = 'standard'
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        if not documents:
+            return []
+        started = time.perf_counter()
+        sentences = []  # (document position, text)
+        seen = set()
+        for position, document in enumerate(documents):
+            for sentence in SENTENCE_BOUNDARY.split(document.page_content):
+                sentence = sentence.strip()
+                key = ' '.join(WORD.findall(sentence.lower()))
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                sentences.append((position, sentence))
+        if not sentences:
+            return list(documents)
+
+        texts = [sentence for _, sentence in sentences]
+        positions = [position for position, _ in sentences]
+        relevance = self._chunk_relevance(documents)
+        lexical = self._bm25(query, texts)
+        scores = [match + self.relevance_weight * relevance[position]
+                  for match, position in zip(lexical, positions)]
+        lengths = token_counts(texts)
+
+        # Stable, so equal scores keep document order
+        ranked = sorted(range(len(sentences)), key=lambda index: -scores[index])
+        kept = set([index for index in ranked if positions[index] == 0][:self.top_chunk_sentences])
+        used = sum(lengths[index] for index in kept)
+        for index in ranked:
+            if index not in kept and used + lengths[index] <= self.token_budget:
+                kept.add(index)
+                used += lengths[index]
+
+        compressed = []
+        for position, document in enumerate(documents):
+            text = ' '.join(sentence for index, (owner, sentence) in enumerate(sentences)
+                            if owner == position and index in kept)
+            if text:
+                compressed.append(Document(page_content=text, metadata=dict(document.metadata)))
+
+        CONTEXT_TOKENS.labels(stage='retrieved', tier=self.tier).inc(
+            sum(token_counts([document.page_content for document in documents])))
+        CONTEXT_TOKENS.labels(stage='kept', tier=self.tier).inc(used)
+        CONTEXT_COMPRESSION_SECONDS.labels(tier=self.tier).observe(time.perf_counter() - started)
+        return compressed
+
+    @staticmethod
+    def _chunk_relevance(documents):
+        """Relevance of each chunk scaled so the best is 1, by store similarity or else by rank"""
+        similarities = [document.metadata.get('relevance') for document in documents]
+        if any(similarity is None for similarity in similarities):
+            return [1 - position / len(documents) for position in range(len(documents))]
+        best = max(max(similarities), 1e-6)
+        return [max(similarity, 0.0) / best for similarity in similarities]
+
+    @staticmethod
+    def _bm25(query, sentences, k1=1.2, b=0.75):
+        """BM25 of each sentence against the query terms, scaled so the best is 1"""
+        terms = [term for term in _terms(query) if term not in STOPWORDS]
+        tokenized = [_terms(sentence) for sentence in sentences]
+        average = max(sum(len(words) for words in tokenized) / len(tokenized), 1)
+        frequency = Counter(term for words in tokenized for term in set(words))
+        scores = []
+        for words in tokenized:
+            counts = Counter(words)
+            score = 0.0
+            for term in terms:
+                if counts[term]:
+                    idf = math.log(1 + (len(tokenized) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+                    score += idf * counts[term] * (k1 + 1) / (counts[term] + k1 * (1 - b + b * len(words) / average))
+            scores.append(score)
+        best = max(scores) or 1.0
+        return [score / best for score in scores]
@@ -0,0 +1,185 @@
+import threading
+import contextvars
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator
+
+from metrics import CACHE_REQUESTS
+
+
+class StreamFlight:
+    """
+    One in-flight streamed computation shared by any number of subscribers.
+
+    The producer publishes chunks as they are generated; every subscriber
+    replays what was already published and then follows the live stream, so
+    a subscriber that attaches late still receives the complete answer.
+    When the last subscriber leaves before the stream is done, cancelled is
+    set so the producer can stop early.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.condition = threading.Condition()
+        self.cancelled = threading.Event()
+
+    def publish(self, chunk: Any) -> None:
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error: Exception = None) -> None:
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def subscribe(self) -> 'Subscription':
+        """Count a subscriber at once, so the flight is not cancelled before it starts reading"""
+        with self.condition:
+            self.subscribers += 1
+        return Subscription(self)
+
+    def release(self) -> None:
+        """Called once per subscriber when it stops reading, finished or not"""
+        with self.condition:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.cancelled.set()
+            self.condition.notify_all()
+
+
+class Subscription:
+    """
+    A subscriber's iterator over a StreamFlight. close() may be called from
+    any thread, including while another thread is blocked waiting for the
+    next chunk: the subscriber is released at once (cancelling the flight if
+    it was the last one) and the waiting iteration ends.
+    """
+
+    def __init__(self, flight: StreamFlight):
+        self.flight = flight
+        self.index = 0
+        self.pending = []
+        self.closed = False
+
+    def __iter__(self) -> 'Subscription':
+        return self
+
+    def __next__(self) -> Any:
+        flight = self.flight
+        while not self.pending:
+            with flight.condition:
+                while self.index >= len(flight.chunks) and not flight.done and not self.closed:
+                    flight.condition.wait()
+                if self.closed:
+                    raise StopIteration
+                self.pending = flight.chunks[self.index:]
+                self.index = len(flight.chunks)
+                if not self.pending:
+                    # Done and fully replayed
+                    error = flight.error
+                    self.close()
+                    if error is not None:
+                        raise error
+                    raise StopIteration
+        return self.pending.pop(0)
+
+    def close(self) -> None:
+        with self.flight.condition:
+            if self.closed:
+                return
+            self.closed = True
+        self.flight.release()
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical calls.
+
+    The first caller for a key runs the computation; callers that arrive
+    while it is still running wait for and share its result instead of
+    repeating the work. Keys are forgotten as soon as the computation ends.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, Future] = {}
+        self.streams: Dict[Hashable, StreamFlight] = {}
+        self.stats = {
+            'calls': 0,
+            'calls_coalesced': 0,
+            'streams': 0,
+            'streams_coalesced': 0,
+        }
+
+    def do(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+                self.stats['calls'] += 1
+            else:
+                self.stats['calls_coalesced'] += 1
+        CACHE_REQUESTS.labels(cache='single_flight', result='miss' if leader else 'hit').inc()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = compute()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+
+    def stream(self, key: Hashable, produce: Callable[[threading.Event], Iterable[Any]]) -> Iterator[Any]:
+        """
+        Subscribe to the stream for key, starting a producer thread if none
+        is running. The producer runs independently of any one subscriber, so
+        a subscriber that disconnects does not cut off the others; it is
+        called with the flight's cancelled event, which is set once every
+        subscriber has gone. A cancelled flight is never joined.
+        """
+        with self.lock:
+            flight = self.streams.get(key)
+            if flight is None or flight.cancelled.is_set():
+                flight = StreamFlight()
+                self.streams[key] = flight
+                self.stats['streams'] += 1
+                # The producer inherits the leader's context so its spans join the leader's trace
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._produce, key, flight, produce), daemon=True).start()
+                leader = True
+            else:
+                self.stats['streams_coalesced'] += 1
+                leader = False
+            # Subscribed under the lock, so the flight cannot be cancelled in between
+            subscription = flight.subscribe()
+        CACHE_REQUESTS.labels(cache='single_flight_stream', result='miss' if leader else 'hit').inc()
+        return subscription
+
+    def _produce(self, key: Hashable, flight: StreamFlight,
+                 produce: Callable[[threading.Event], Iterable[Any]]) -> None:
+        try:
+            for chunk in produce(flight.cancelled):
+                flight.publish(chunk)
+            flight.finish()
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            with self.lock:
+                if self.streams.get(key) is flight:
+                    del self.streams[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.calls) + len(self.streams))
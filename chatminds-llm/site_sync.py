@@ -0,0 +1,168 @@
+import os
+import gzip
+import json
+import time
+import logging
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Sitemap-driven site sync. Pages are discovered from the sitemaps listed in
+# robots.txt (or /sitemap.xml), and a page is only fetched when its lastmod
+# differs from the one recorded when it was last embedded.
+USER_AGENT = os.getenv('SITE_SYNC_USER_AGENT', 'ChatMindsBot/1.0')
+MAX_PAGES = int(os.getenv('SITE_SYNC_MAX_PAGES', '5000'))
+MAX_SITEMAPS = int(os.getenv('SITE_SYNC_MAX_SITEMAPS', '200'))
+MAX_SITEMAP_DEPTH = 3
+MAX_CRAWL_DELAY = float(os.getenv('SITE_SYNC_MAX_CRAWL_DELAY', '5'))
+REQUEST_TIMEOUT = float(os.getenv('SITE_SYNC_TIMEOUT_SECONDS', '30'))
+CHECKPOINT_FILE = 'site_sync.json'
+CHECKPOINT_EVERY = 25  # pages between checkpoint writes
+
+
+class SiteSyncError(Exception):
+    """The site's pages could not be discovered"""
+
+
+def _get(url: str) -> requests.Response:
+    return requests.get(url, headers={'User-Agent': USER_AGENT}, timeout=REQUEST_TIMEOUT)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def read_robots(base_url: str) -> RobotFileParser:
+    """robots.txt of the site; a missing file allows everything."""
+    robots_url = urljoin(base_url, '/robots.txt')
+    parser = RobotFileParser(robots_url)
+    try:
+        response = _get(robots_url)
+        lines = response.text.splitlines() if response.status_code == 200 else []
+    except requests.RequestException as e:
+        logger.warning(f"Could not read {robots_url}: {str(e)}")
+        lines = []
+    parser.parse(lines)
+    return parser
+
+
+def read_sitemap(url: str) -> Tuple[str, List[Tuple[str, Optional[str]]]]:
+    """
+    Fetch and parse one sitemap.
+
+    Returns:
+        tuple: 'index' or 'urlset', and its (loc, lastmod) entries
+    """
+    response = _get(url)
+    response.raise_for_status()
+    content = response.content
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+    root = ElementTree.fromstring(content)
+    entries = []
+    for element in root:
+        fields = {_local_name(child.tag): (child.text or '').strip() for child in element}
+        if fields.get('loc'):
+            entries.append((fields['loc'], fields.get('lastmod') or None))
+    return ('index' if _local_name(root.tag) == 'sitemapindex' else 'urlset'), entries
+
+
+def discover_pages(base_url: str, robots: RobotFileParser) -> Dict[str, Optional[str]]:
+    """
+    Pages of the site with their lastmod, from every sitemap reachable from
+    robots.txt or /sitemap.xml. Nested sitemap indexes are followed up to
+    MAX_SITEMAP_DEPTH. Only pages on the same host that robots.txt allows
+    are returned.
+
+    Raises:
+        SiteSyncError: If no sitemap could be read
+    """
+    host = urlparse(base_url).netloc
+    queue = [(url, 0) for url in (robots.site_maps() or [urljoin(base_url, '/sitemap.xml')])]
+    seen = set()
+    pages = {}
+    read = 0
+    while queue and len(seen) < MAX_SITEMAPS and len(pages) < MAX_PAGES:
+        sitemap_url, depth = queue.pop(0)
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        try:
+            kind, entries = read_sitemap(sitemap_url)
+        except (requests.RequestException, ElementTree.ParseError, OSError) as e:
+            logger.warning(f"Could not read sitemap {sitemap_url}: {str(e)}")
+            continue
+        read += 1
+        if kind == 'index':
+            if depth < MAX_SITEMAP_DEPTH:
+                queue.extend((loc, depth + 1) for loc, _ in entries)
+            continue
+        for loc, lastmod in entries:
+            if urlparse(loc).netloc == host and robots.can_fetch(USER_AGENT, loc):
+                pages[loc] = lastmod
+                if len(pages) >= MAX_PAGES:
+                    break
+    if not read:
+        raise SiteSyncError(f"No readable sitemap found for {base_url}")
+    return pages
+
+
+def crawl_delay(robots: RobotFileParser) -> float:
+    delay = robots.crawl_delay(USER_AGENT)
+    return min(float(delay), MAX_CRAWL_DELAY) if delay else 0.0
+
+
+class SyncCheckpoint:
+    """
+    Progress of a tenant's site sync, persisted next to its vector store so
+    an interrupted sync resumes where it stopped instead of starting over.
+    """
+
+    def __init__(self, tenant_directory: str):
+        self.path = os.path.join(tenant_directory, CHECKPOINT_FILE)
+        self.state = None
+
+    def resume(self, site: str) -> Optional[Dict]:
+        """Unfinished sync of the same site, if any."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('site') != site or state.get('finished'):
+            return None
+        self.state = state
+        return state
+
+    def start(self, site: str, pages: Dict[str, Optional[str]]) -> Dict:
+        # A sitemap cut off at MAX_PAGES does not list every page, so nothing
+        # may be deleted for being absent from it
+        self.state = {'site': site, 'started': time.time(), 'finished': None, 'pages': pages,
+                      'truncated': len(pages) >= MAX_PAGES, 'completed': [], 'failed': []}
+        self.save()
+        return self.state
+
+    def pending(self) -> Iterator[Tuple[str, Optional[str]]]:
+        done = set(self.state['completed']) | set(self.state['failed'])
+        for url, lastmod in self.state['pages'].items():
+            if url not in done:
+                yield url, lastmod
+
+    def complete(self, url: str, failed: bool = False) -> None:
+        self.state['failed' if failed else 'completed'].append(url)
+        if (len(self.state['completed']) + len(self.state['failed'])) % CHECKPOINT_EVERY == 0:
+            self.save()
+
+    def finish(self) -> None:
+        self.state['finished'] = time.time()
+        self.save()
+
+    def save(self) -> None:
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,206 @@
+import os
+import time
+import asyncio
+import inspect
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+import orjson
+
+# Tokens are coalesced into one frame until this much time has passed since
+# the first buffered token or this many bytes are buffered.
+FLUSH_INTERVAL = float(os.getenv('SSE_FLUSH_INTERVAL_MS', '15')) / 1000.0
+FLUSH_BYTES = int(os.getenv('SSE_FLUSH_BYTES', '512'))
+HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Tell nginx not to buffer this response
+    "X-Accel-Buffering": "no",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "*",
+    "Access-Control-Allow-Headers": "*",
+}
+
+
+class EventStream:
+    """Formats server-sent events with increasing event ids."""
+
+    # Comment lines are ignored by clients but keep proxies and sockets alive
+    HEARTBEAT = b": keep-alive\n\n"
+
+    def __init__(self):
+        self.last_id = 0
+
+    def open(self) -> bytes:
+        """First bytes of the stream, sent before any work so headers go out immediately."""
+        return b"retry: 3000\n\n"
+
+    def event(self, data: Dict[str, Any], event: str = None) -> bytes:
+        self.last_id += 1
+        frame = b"id: %d\n" % self.last_id
+        if event:
+            frame += b"event: " + event.encode() + b"\n"
+        return frame + b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+def close_iterator(iterator: Iterator[Any]) -> None:
+    """
+    Close an iterator the consumer is done with, from any thread. Generators
+    can only be closed when not running, so they are left to the thread
+    driving them; other iterators (single-flight subscriptions) close at once.
+    """
+    close = getattr(iterator, 'close', None)
+    if close is not None and not inspect.isgenerator(iterator):
+        close()
+
+
+async def iterate_in_thread(iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Drive a blocking iterator from a worker thread and yield its items on the
+    event loop. When the consumer stops early the iterator is closed: right
+    away if it can be closed from another thread, otherwise from the worker
+    thread after its current item.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def pump():
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            loop.call_soon_threadsafe(items.put_nowait, (done, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, (done, e))
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    # A dedicated thread rather than the shared executor: a stream can block
+    # for its whole lifetime waiting on the model
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        while True:
+            item, error = await items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        close_iterator(iterator)
+
+
+async def coalesce_tokens(chunks: Iterator[Dict[str, Any]],
+                          complete_payload: Callable[[Dict[str, Any]], Dict[str, Any]],
+                          flush_interval: float = FLUSH_INTERVAL,
+                          flush_bytes: int = FLUSH_BYTES,
+                          heartbeat_interval: float = HEARTBEAT_INTERVAL) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Coalesce DocumentService stream chunks into token payloads.
+
+    The first token is flushed at once; later tokens are coalesced into one
+    payload per flush interval or byte budget, so a fast model produces tens
+    of frames per second instead of one frame per token. None is yielded as a
+    heartbeat while the model is still working. A chunk carrying 'sources'
+    is passed on at once as a sources payload.
+
+    Args:
+        chunks: Blocking iterator of {'token', 'is_last', 'complete_response'} chunks
+        complete_payload: Builds the extra fields of the final payload from its chunk
+
+    Yields:
+        dict: Sources and token payloads, or None for a heartbeat
+    """
+    events = iterate_in_thread(chunks).__aiter__()
+    buffer = []
+    buffered_bytes = 0
+    deadline = None
+    first_token_sent = False
+    pending = None
+
+    def flush() -> Dict[str, Any]:
+        nonlocal buffer, buffered_bytes, deadline
+        payload = {'type': 'token', 'content': ''.join(buffer), 'complete': False}
+        buffer, buffered_bytes, deadline = [], 0, None
+        return payload
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            timeout = heartbeat_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            finished, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not finished:
+                yield flush() if buffer else None
+                continue
+
+            try:
+                chunk = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+
+            if 'sources' in chunk:
+                if buffer:
+                    yield flush()
+                yield {'type': 'sources', 'sources': chunk['sources']}
+                continue
+
+            if chunk['is_last']:
+                payload = {'type': 'token', 'content': ''.join(buffer) + chunk['token'], 'complete': True}
+                buffer = []
+                payload.update(complete_payload(chunk))
+                yield payload
+                continue
+
+            buffer.append(chunk['token'])
+            buffered_bytes += len(chunk['token'])
+            if not first_token_sent:
+                first_token_sent = True
+                yield flush()
+            elif buffered_bytes >= flush_bytes:
+                yield flush()
+            elif deadline is None:
+                deadline = time.monotonic() + flush_interval
+    finally:
+        if pending is not None:
+            # Let the cancelled step finish, or aclose() finds the generator still running
+            pending.cancel()
+            await asyncio.wait({pending})
+        await events.aclose()
+        # Also releases a subscription that was never read from
+        close_iterator(chunks)
+
+
+async def stream_token_events(chunks: Iterator[Dict[str, Any]],
+                              complete_payload: Callable[[Dict[str, Any]], Dict[str, Any]],
+                              **options) -> AsyncIterator[bytes]:
+    """
+    Turn DocumentService stream chunks into a text/event-stream, with each
+    payload sent as an event named after its type ('sources' or 'token').
+
+    Takes the same options as coalesce_tokens.
+
+    Yields:
+        bytes: Encoded SSE frames
+    """
+    stream = EventStream()
+    payloads = coalesce_tokens(chunks, complete_payload, **options)
+    try:
+        yield stream.open()
+        async for payload in payloads:
+            yield EventStream.HEARTBEAT if payload is None else stream.event(payload, payload['type'])
+    except Exception as e:
+        yield stream.event({'type': 'error', 'content': str(e)})
+    finally:
+        await payloads.aclose()
+        # A client gone before the first payload never started coalesce_tokens
+        close_iterator(chunks)
@@ -0,0 +1,56 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict
+
+# Wall clock when this module was first imported, i.e. very early in the
+# application import; the process start time is read from /proc when available.
+IMPORTED_AT = time.time()
+
+
+def _process_started() -> float:
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return IMPORTED_AT
+
+
+PROCESS_STARTED = _process_started()
+
+_lock = threading.Lock()
+_imports = []  # (name, seconds, phase) in load order
+_events = {}  # name -> seconds since process start
+
+
+@contextmanager
+def timed_import(name: str, phase: str = 'lazy'):
+    """Record how long the imports in the block took, the first time they run."""
+    started = time.perf_counter()
+    yield
+    with _lock:
+        _imports.append((name, round(time.perf_counter() - started, 4), phase))
+
+
+def mark(event: str) -> None:
+    """Record when a startup milestone was reached; the first time wins."""
+    with _lock:
+        _events.setdefault(event, round(time.time() - PROCESS_STARTED, 4))
+
+
+def report() -> Dict[str, Any]:
+    """Startup milestones and the import time of each lazily loaded dependency."""
+    with _lock:
+        imports = [{'module': name, 'seconds': seconds, 'phase': phase} for name, seconds, phase in _imports]
+        events = dict(_events)
+    return {
+        'process_started': PROCESS_STARTED,
+        'uptime_seconds': round(time.time() - PROCESS_STARTED, 3),
+        'events': events,
+        'imports': imports,
+        'import_seconds_total': round(sum(entry['seconds'] for entry in imports), 4),
+    }
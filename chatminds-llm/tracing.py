@@ -0,0 +1,187 @@
+import os
+import re
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.trace import Link, Status, StatusCode
+    from opentelemetry.propagators.textmap import default_getter
+except ImportError:  # Tracing is optional; spans become no-ops without the API
+    trace = None
+
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'chatminds-llm')
+# Export to an OTLP collector when an endpoint is configured, otherwise to a
+# local JSON-lines file when OTEL_TRACES_FILE is set. With neither, spans are
+# still created (so trace ids propagate) but nothing is recorded.
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+TRACES_FILE = os.getenv('OTEL_TRACES_FILE')
+EXCLUDED_URLS = os.getenv('OTEL_EXCLUDED_URLS', 'health,metrics,ready')
+
+# Browser requests carry the trace id of the page they were made from. The web
+# app records no span of its own, so there is no parent to continue: the
+# request span starts a new root in the page's trace instead.
+TRACE_ID_HEADER = 'x-trace-id'
+TRACE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+_page_trace_id = contextvars.ContextVar('page_trace_id', default=None)
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def set_status(self, *args, **kwargs) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def get_span_context(self):
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _PageTracePropagator:
+    """
+    Propagator that reads the page's trace id header. A request that also has
+    a traceparent keeps it as its parent; otherwise the trace id is held for
+    the id generator, which gives it to the request's root span.
+    """
+
+    def extract(self, carrier, context=None, getter=None):
+        if trace.get_current_span(context).get_span_context().is_valid:
+            return context
+        values = (getter or default_getter).get(carrier, TRACE_ID_HEADER)
+        value = values[0].strip().lower() if values else ''
+        if TRACE_ID_PATTERN.match(value) and int(value, 16):
+            _page_trace_id.set(int(value, 16))
+        return context
+
+    def inject(self, carrier, context=None, setter=None) -> None:
+        pass
+
+    @property
+    def fields(self):
+        return {TRACE_ID_HEADER}
+
+
+class _PageTraceIdGenerator:
+    """Random ids, except that the next root span takes a pending page trace id"""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def generate_span_id(self) -> int:
+        return self.ids.generate_span_id()
+
+    def generate_trace_id(self) -> int:
+        trace_id = _page_trace_id.get()
+        if trace_id is None:
+            return self.ids.generate_trace_id()
+        _page_trace_id.set(None)
+        return trace_id
+
+
+def _build_exporter():
+    if OTLP_ENDPOINT:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=OTLP_ENDPOINT)
+    if TRACES_FILE:
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        os.makedirs(os.path.dirname(TRACES_FILE) or '.', exist_ok=True)
+        return ConsoleSpanExporter(
+            out=open(TRACES_FILE, 'a', encoding='utf-8'),
+            formatter=lambda span: span.to_json(indent=None) + '\n'
+        )
+    return None
+
+
+def setup_tracing(app) -> bool:
+    """
+    Configure the tracer provider and instrument the FastAPI app.
+
+    Incoming W3C traceparent headers become the parents of the request
+    spans. Requests from the browser send the page's trace id instead, and
+    their request spans are roots in that trace.
+
+    Returns:
+        bool: Whether spans are being exported
+    """
+    if trace is None:
+        logger.info("OpenTelemetry is not installed, tracing disabled")
+        return False
+
+    exporter = _build_exporter()
+    if exporter is None:
+        return False
+
+    from opentelemetry.propagate import get_global_textmap, set_global_textmap
+    from opentelemetry.propagators.composite import CompositePropagator
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.id_generator import RandomIdGenerator
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+    provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}),
+                              id_generator=_PageTraceIdGenerator(RandomIdGenerator()))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    set_global_textmap(CompositePropagator([get_global_textmap(), _PageTracePropagator()]))
+    FastAPIInstrumentor.instrument_app(app, excluded_urls=EXCLUDED_URLS)
+    logger.info(f"Tracing enabled, exporting to {OTLP_ENDPOINT or TRACES_FILE}")
+    return True
+
+
+def _tracer():
+    return trace.get_tracer('chatminds')
+
+
+def _attributes(attributes: dict) -> dict:
+    return {f'chatminds.{key}': value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, links: Iterable[Any] = (), **attributes):
+    """Run the block in a child span of the current span."""
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+    links = [Link(context) for context in links if context is not None]
+    with _tracer().start_as_current_span(name, links=links, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, **attributes):
+    """
+    Start a span without making it current, for stages whose start and end
+    are reported by separate callbacks. The caller must end it.
+    """
+    if trace is None:
+        return _NOOP_SPAN
+    return _tracer().start_span(name, attributes=_attributes(attributes))
+
+
+def end_span(current, error: BaseException = None) -> None:
+    if error is not None:
+        current.record_exception(error)
+        if trace is not None:
+            current.set_status(Status(StatusCode.ERROR, str(error)))
+    current.end()
+
+
+def current_span_context():
+    """Context of the active span, for linking work done on another thread."""
+    if trace is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return context if context.is_valid else None
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Measure HNSW settings on a tenant's own corpus and recommend a profile.
+
+Builds an in-memory Chroma collection from the tenant's stored vectors for
+each profile and queries it with held-out chunks at each search_ef. Each
+result line has recall@k against exact search, p50/p99 latency, build
+time and the estimated index memory. The last line recommends the
+cheapest setting that reaches the target recall with a p99 within 10% of
+the best one:
+
+    python tune_hnsw.py --tenant <id> --target-recall 0.95
+
+--apply writes the recommended search_ef to the tenant's index profile;
+PUT /index_profile/{tenant_id} does the same on a running service without
+a restart. --apply --rebuild also rebuilds the collection when the
+recommended M or construction_ef differ from the tenant's.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+from filelock import FileLock
+
+import vector_stores
+from migrate_embeddings import read_tenant, rebuild_chroma, truncate
+
+SEARCH_EF = '10,16,32,64,128,256'
+ADD_BATCH = 5000
+
+
+def estimated_memory_mb(chunks, dimensions, m):
+    """hnswlib memory: float32 vectors, 2M links on level 0 and M on the expected 1/(M-1) upper levels."""
+    per_chunk = dimensions * 4 + 8 + (2 * m * 4 + 4) + (m * 4 + 4) / max(m - 1, 1)
+    return chunks * per_chunk / 1024 / 1024
+
+
+def measure(client, profile, indexed, queries, truth, search_efs, k):
+    name = f"tune-{profile['M']}-{profile['construction_ef']}"
+    collection = client.create_collection(name, metadata=vector_stores.collection_metadata(profile))
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(indexed), ADD_BATCH):
+            block = indexed[start:start + ADD_BATCH]
+            collection.add(ids=[str(row) for row in range(start, start + len(block))], embeddings=block.tolist())
+        build_seconds = time.perf_counter() - started
+        memory_mb = estimated_memory_mb(len(indexed), indexed.shape[1], profile['M'])
+        results = []
+        for search_ef in search_efs:
+            recalls, latencies = [], []
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                # Same query as ProfiledChroma: n_results widens hnswlib's ef
+                neighbours = collection.query(query_embeddings=[query.tolist()], n_results=max(k, search_ef),
+                                              include=['distances'])
+                latencies.append((time.perf_counter() - started) * 1000)
+                found = {int(row_id) for row_id in neighbours['ids'][0][:k]}
+                recalls.append(len(found & expected) / k)
+            latencies.sort()
+            results.append({
+                'profile': profile.get('profile'), 'M': profile['M'], 'construction_ef': profile['construction_ef'],
+                'search_ef': search_ef, f'recall@{k}': round(statistics.mean(recalls), 4),
+                'p50_ms': round(statistics.median(latencies), 2),
+                'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+                'build_seconds': round(build_seconds, 1), 'memory_mb': round(memory_mb, 1),
+            })
+        return results
+    finally:
+        client.delete_collection(name)
+
+
+def recommend(results, target_recall, k):
+    recall_key = f'recall@{k}'
+    passing = [result for result in results if result[recall_key] >= target_recall]
+    if not passing:
+        return dict(max(results, key=lambda result: result[recall_key]), reached_target=False)
+    best_p99 = min(result['p99_ms'] for result in passing)
+    fast = [result for result in passing if result['p99_ms'] <= best_p99 * 1.1]
+    return dict(min(fast, key=lambda result: (result['memory_mb'], result['search_ef'])), reached_target=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='./data', help='Directory holding the tenant directories')
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--profiles', default=','.join(vector_stores.HNSW_PROFILES))
+    parser.add_argument('--search-ef', default=SEARCH_EF)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--target-recall', type=float, default=0.95)
+    parser.add_argument('--apply', action='store_true', help="Write the recommended search_ef to the tenant's profile")
+    parser.add_argument('--rebuild', action='store_true', help='With --apply, rebuild with the recommended M')
+    args = parser.parse_args()
+
+    import chromadb
+
+    directory = os.path.join(args.data, args.tenant)
+    ids, vectors, _, _ = read_tenant(directory)
+    if len(ids) <= args.queries:
+        raise SystemExit(f"Tenant has {len(ids)} chunks, need more than --queries {args.queries}")
+    rng = np.random.default_rng(0)
+    held_out = rng.choice(len(ids), size=args.queries, replace=False)
+    indexed = truncate(vectors[np.setdiff1d(np.arange(len(ids)), held_out)], None)
+    queries = truncate(vectors[held_out], None)
+    truth = [set(np.argsort(-(indexed @ query))[:args.k]) for query in queries]
+
+    current = vector_stores.index_profile(directory)
+    profiles = [{'profile': name, **vector_stores.HNSW_PROFILES[name]} for name in args.profiles.split(',')]
+    if not any((profile['M'], profile['construction_ef']) == (current['M'], current['construction_ef'])
+               for profile in profiles):
+        profiles.append(current)
+    search_efs = [int(value) for value in args.search_ef.split(',')]
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for profile in profiles:
+        for result in measure(client, profile, indexed, queries, truth, search_efs, args.k):
+            print(json.dumps(result))
+            results.append(result)
+
+    recommended = recommend(results, args.target_recall, args.k)
+    rebuild_needed = (recommended['M'], recommended['construction_ef']) != (current['M'], current['construction_ef'])
+    print(json.dumps({'tenant': args.tenant, 'chunks': len(ids), 'current': current, 'recommended': recommended,
+                      'rebuild_needed': rebuild_needed}))
+
+    if not args.apply:
+        return
+    if vector_stores.backend_of(directory) != 'chroma':
+        raise SystemExit("Only tenants on Chroma have HNSW parameters; nothing applied")
+    with FileLock(os.path.join(directory, '.write.lock')):
+        if rebuild_needed and args.rebuild:
+            rebuild_chroma(directory, profile={key: recommended[key] for key in
+                                               ('profile', 'M', 'construction_ef', 'search_ef')})
+        else:
+            vector_stores.set_search_ef(directory, recommended['search_ef'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from filelock import FileLock
+
+SOURCES_FILE = 'url_sources.json'
+
+
+class UrlSources:
+    """
+    Fetch metadata of a tenant's URL documents, kept next to its vector
+    store: document_id -> url, ETag, Last-Modified, content hash and content
+    type of the version that is currently embedded. Used to re-fetch URLs
+    conditionally and to skip re-embedding pages that have not changed.
+    """
+
+    _locks = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(self, tenant_directory: str):
+        os.makedirs(tenant_directory, exist_ok=True)
+        self.path = os.path.join(tenant_directory, SOURCES_FILE)
+        self.file_lock = FileLock(os.path.join(tenant_directory, '.url_sources.lock'))
+        with UrlSources._locks_lock:
+            self.lock = UrlSources._locks.setdefault(self.path, threading.Lock())
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock, self.file_lock:
+            return self._read()
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return self.all().get(document_id)
+
+    def document_id_for(self, url: str) -> Optional[str]:
+        """Document id a URL was last loaded under, if any."""
+        for document_id, source in self.all().items():
+            if source['url'] == url:
+                return document_id
+        return None
+
+    def _write(self, sources: Dict[str, Dict[str, Any]]) -> None:
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(sources, f, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def update(self, document_id: str, **fields) -> None:
+        """Merge fields into the document's entry and write the file atomically."""
+        with self.lock, self.file_lock:
+            sources = self._read()
+            source = sources.setdefault(document_id, {})
+            source.update(fields, fetched_at=time.time())
+            self._write(sources)
+
+    def remove(self, document_ids: Iterable[str]) -> None:
+        with self.lock, self.file_lock:
+            sources = self._read()
+            for document_id in document_ids:
+                sources.pop(document_id, None)
+            self._write(sources)
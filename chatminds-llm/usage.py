@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from metrics import tenant_tier, LLM_TOKENS, BUDGET_DEGRADED
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens as (input, output). MODEL_PRICING can override or
+# extend the table with the same JSON shape, e.g. {"gpt-4o": [2.5, 10.0]}.
+DEFAULT_PRICING = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+PRICING = dict(DEFAULT_PRICING, **{
+    model: tuple(prices) for model, prices in json.loads(os.getenv('MODEL_PRICING', '{}')).items()
+})
+
+DEFAULT_ANSWER_MODEL = 'gpt-4o-mini'
+EMBEDDING_OPERATIONS = ('embed', 'query_embed')
+TOKEN_ENCODING = 'cl100k_base'
+
+
+def _optional_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value not in (None, '') else None
+
+
+def price(model: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+    """Cost in USD of a call; unknown models are priced by their closest known prefix."""
+    prices = PRICING.get(model)
+    if prices is None:
+        matches = [name for name in PRICING if model.startswith(name)]
+        prices = PRICING[max(matches, key=len)] if matches else (0.0, 0.0)
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+_encoding = None
+
+
+def count_tokens(texts: List[str]) -> int:
+    """
+    Token count of texts, used when the provider does not report usage.
+    Accounting never fails a request: 0 is returned if tiktoken is unavailable.
+    """
+    global _encoding
+    try:
+        if _encoding is None:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        return sum(len(tokens) for tokens in _encoding.encode_batch(list(texts), disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"Could not count tokens for usage: {str(e)}")
+        return 0
+
+
+def token_counts(texts: List[str]) -> List[int]:
+    """Token count of each text, estimated from its length if tiktoken is unavailable."""
+    global _encoding
+    try:
+        if _encoding is None:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        return [len(tokens) for tokens in _encoding.encode_batch(list(texts), disallowed_special=())]
+    except Exception:
+        return [max(1, len(text) // 4) for text in texts]
+
+
+class ProviderUsage:
+    """Tokens the provider reported for the embeddings requests made inside reported_usage()"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.responses = 0
+
+
+_reported_usage = contextvars.ContextVar('reported_usage', default=None)
+
+
+@contextmanager
+def reported_usage():
+    """
+    Collect the usage the provider reports for embeddings requests made in
+    the block. The embeddings client drops the usage field, so the shared
+    HTTP client reads it from the responses (see clients.py).
+    """
+    usage = ProviderUsage()
+    token = _reported_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _reported_usage.reset(token)
+
+
+def collecting_usage() -> bool:
+    return _reported_usage.get() is not None
+
+
+def add_reported_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """Add the usage field of one provider response to the block collecting it"""
+    collector = _reported_usage.get()
+    if collector is None or not isinstance(usage, dict):
+        return
+    collector.prompt_tokens += int(usage.get('prompt_tokens') or 0)
+    collector.responses += 1
+
+
+def embedding_tokens(texts: List[str], usage: ProviderUsage) -> int:
+    """Tokens to charge for embedding texts: the provider's count, tiktoken's if it reported none"""
+    return usage.prompt_tokens if usage.responses else count_tokens(texts)
+
+
+def _day(now: datetime) -> str:
+    return now.strftime('%Y-%m-%d')
+
+
+def _month(now: datetime) -> str:
+    return now.strftime('%Y-%m')
+
+
+class UsageTracker:
+    """
+    Per-tenant token and cost accounting.
+
+    Calls are aggregated in memory per (tenant, day, model, operation) and
+    flushed to sqlite in batches by a background thread. Budget checks read
+    the flushed totals of every process sharing the database, refreshed
+    periodically, plus this process's unflushed usage.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            tenant_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            model TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, day, model, operation)
+        );
+        CREATE TABLE IF NOT EXISTS tenant_budgets (
+            tenant_id TEXT PRIMARY KEY,
+            daily_limit REAL,
+            monthly_limit REAL
+        );
+    """
+
+    def __init__(self, db_path: str, flush_interval: float, refresh_interval: float,
+                 default_daily_limit: Optional[float], default_monthly_limit: Optional[float],
+                 soft_limit: float, reduced_k: int, fallback_model: Optional[str]):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.default_daily_limit = default_daily_limit
+        self.default_monthly_limit = default_monthly_limit
+        self.soft_limit = soft_limit
+        self.reduced_k = reduced_k
+        self.fallback_model = fallback_model
+        self.lock = threading.Lock()
+        self.pending = {}  # (tenant, day, model, operation) -> [requests, prompt, completion, cost]
+        self.flushed = {}  # tenant -> (refreshed_at, day, day_cost, month, month_cost)
+        self.budgets = {}  # tenant -> (refreshed_at, daily_limit, monthly_limit)
+        self.thread = None
+        self.initialized = False
+        self.unswapped_models = set()
+
+    @classmethod
+    def from_env(cls) -> 'UsageTracker':
+        return cls(
+            db_path=os.getenv('USAGE_DB_PATH', './data/usage.db'),
+            flush_interval=float(os.getenv('USAGE_FLUSH_SECONDS', '10')),
+            refresh_interval=float(os.getenv('USAGE_REFRESH_SECONDS', '60')),
+            default_daily_limit=_optional_float(os.getenv('USAGE_DEFAULT_DAILY_BUDGET')),
+            default_monthly_limit=_optional_float(os.getenv('USAGE_DEFAULT_MONTHLY_BUDGET')),
+            # Share of a budget after which answers are degraded to save spend
+            soft_limit=float(os.getenv('USAGE_SOFT_LIMIT', '0.8')),
+            reduced_k=int(os.getenv('USAGE_REDUCED_K', '1')),
+            # Unset by default: the answer model is already the cheapest priced one
+            fallback_model=os.getenv('USAGE_FALLBACK_MODEL') or None,
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        if not self.initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(self.SCHEMA)
+            self.initialized = True
+        return connection
+
+    def record(self, tenant_id: str, model: str, operation: str, prompt_tokens: int,
+               completion_tokens: int = 0) -> None:
+        """Add one provider call to the tenant's usage."""
+        if not tenant_id or (not prompt_tokens and not completion_tokens):
+            return
+        cost = price(model, prompt_tokens, completion_tokens)
+        key = (tenant_id, _day(datetime.now(timezone.utc)), model, operation)
+        with self.lock:
+            totals = self.pending.setdefault(key, [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += cost
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='usage-flush', daemon=True)
+                self.thread.start()
+
+        tier = tenant_tier(tenant_id)
+        kind = 'embedding' if operation in EMBEDDING_OPERATIONS else 'prompt'
+        LLM_TOKENS.labels(kind=kind, operation=operation, tier=tier).inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels(kind='completion', operation=operation, tier=tier).inc(completion_tokens)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed: {str(e)}")
+
+    def flush(self) -> None:
+        """Write aggregated usage to sqlite."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(
+                        """INSERT INTO usage_daily
+                               (tenant_id, day, model, operation, requests, prompt_tokens, completion_tokens, cost)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (tenant_id, day, model, operation) DO UPDATE SET
+                               requests = requests + excluded.requests,
+                               prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                               completion_tokens = completion_tokens + excluded.completion_tokens,
+                               cost = cost + excluded.cost""",
+                        [key + tuple(totals) for key, totals in pending.items()]
+                    )
+            finally:
+                connection.close()
+        except Exception:
+            # Put the batch back so it is retried with the next flush
+            with self.lock:
+                for key, totals in pending.items():
+                    current = self.pending.setdefault(key, [0, 0, 0, 0.0])
+                    for i, value in enumerate(totals):
+                        current[i] += value
+            raise
+
+        # Keep the cached flushed totals in step until their next refresh
+        with self.lock:
+            for (tenant_id, day, _, _), totals in pending.items():
+                cached = self.flushed.get(tenant_id)
+                if cached is not None and cached[1] == day:
+                    self.flushed[tenant_id] = (cached[0], day, cached[2] + totals[3], cached[3], cached[4] + totals[3])
+
+    def _flushed_spend(self, tenant_id: str, now: datetime):
+        day, month = _day(now), _month(now)
+        with self.lock:
+            cached = self.flushed.get(tenant_id)
+        if cached is not None and cached[1] == day and time.monotonic() - cached[0] < self.refresh_interval:
+            return cached[2], cached[4]
+
+        connection = self._connect()
+        try:
+            day_cost, month_cost = connection.execute(
+                """SELECT COALESCE(SUM(CASE WHEN day = ? THEN cost END), 0), COALESCE(SUM(cost), 0)
+                   FROM usage_daily WHERE tenant_id = ? AND day LIKE ?""",
+                (day, tenant_id, month + '-%')
+            ).fetchone()
+        finally:
+            connection.close()
+        with self.lock:
+            self.flushed[tenant_id] = (time.monotonic(), day, day_cost, month, month_cost)
+        return day_cost, month_cost
+
+    def spend(self, tenant_id: str) -> Dict[str, float]:
+        """The tenant's spend in USD for the current UTC day and month."""
+        now = datetime.now(timezone.utc)
+        day_cost, month_cost = self._flushed_spend(tenant_id, now)
+        day, month = _day(now), _month(now)
+        with self.lock:
+            for (pending_tenant, pending_day, _, _), totals in self.pending.items():
+                if pending_tenant != tenant_id:
+                    continue
+                if pending_day == day:
+                    day_cost += totals[3]
+                if pending_day.startswith(month):
+                    month_cost += totals[3]
+        return {'day': round(day_cost, 6), 'month': round(month_cost, 6)}
+
+    def get_budget(self, tenant_id: str) -> Dict[str, Optional[float]]:
+        with self.lock:
+            cached = self.budgets.get(tenant_id)
+        if cached is None or time.monotonic() - cached[0] >= self.refresh_interval:
+            connection = self._connect()
+            try:
+                row = connection.execute(
+                    "SELECT daily_limit, monthly_limit FROM tenant_budgets WHERE tenant_id = ?", (tenant_id,)
+                ).fetchone()
+            finally:
+                connection.close()
+            daily, monthly = row if row else (self.default_daily_limit, self.default_monthly_limit)
+            cached = (time.monotonic(), daily, monthly)
+            with self.lock:
+                self.budgets[tenant_id] = cached
+        return {'daily_limit': cached[1], 'monthly_limit': cached[2]}
+
+    def set_budget(self, tenant_id: str, daily_limit: Optional[float], monthly_limit: Optional[float]) -> None:
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    """INSERT INTO tenant_budgets (tenant_id, daily_limit, monthly_limit) VALUES (?, ?, ?)
+                       ON CONFLICT (tenant_id) DO UPDATE SET
+                           daily_limit = excluded.daily_limit, monthly_limit = excluded.monthly_limit""",
+                    (tenant_id, daily_limit, monthly_limit)
+                )
+        finally:
+            connection.close()
+        with self.lock:
+            self.budgets.pop(tenant_id, None)
+
+    def level(self, tenant_id: str) -> str:
+        """
+        Service level of the tenant given its spend against its budgets:
+        'normal', 'reduced' past the soft limit, 'cached_only' once exhausted.
+        """
+        budget = self.get_budget(tenant_id)
+        if budget['daily_limit'] is None and budget['monthly_limit'] is None:
+            return 'normal'
+
+        spend = self.spend(tenant_id)
+        used = max(
+            spend['day'] / budget['daily_limit'] if budget['daily_limit'] else 0.0,
+            spend['month'] / budget['monthly_limit'] if budget['monthly_limit'] else 0.0,
+        )
+        if used >= 1.0:
+            return 'cached_only'
+        if used >= self.soft_limit:
+            return 'reduced'
+        return 'normal'
+
+    def policy(self, tenant_id: str, k: int, model: str) -> Dict[str, Any]:
+        """
+        How to answer for the tenant.
+
+        Returns:
+            dict: level, the retriever k and the answer model to use
+        """
+        level = self.level(tenant_id)
+        if level == 'normal':
+            return {'level': level, 'k': k, 'model': model}
+        BUDGET_DEGRADED.labels(level=level, tier=tenant_tier(tenant_id)).inc()
+        return {'level': level, 'k': min(k, self.reduced_k), 'model': self._fallback_for(model)}
+
+    def _fallback_for(self, model: str) -> str:
+        """The fallback model if it is cheaper than model, otherwise model itself"""
+        fallback = self.fallback_model
+        if fallback and price(fallback, 1_000_000, 1_000_000) < price(model, 1_000_000, 1_000_000):
+            return fallback
+        if model not in self.unswapped_models:
+            self.unswapped_models.add(model)
+            logger.warning(f"USAGE_FALLBACK_MODEL {fallback or '(unset)'} is not cheaper than {model}; "
+                           f"degraded answers only use a smaller k")
+        return model
+
+    def usage(self, tenant_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Daily usage rows of the tenant between start and end (YYYY-MM-DD, inclusive)."""
+        self.flush()
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                """SELECT day, model, operation, requests, prompt_tokens, completion_tokens, cost
+                   FROM usage_daily
+                   WHERE tenant_id = ? AND day >= ? AND day <= ?
+                   ORDER BY day, model, operation""",
+                (tenant_id, start or '0000-00-00', end or '9999-99-99')
+            ).fetchall()
+        finally:
+            connection.close()
+        columns = ('day', 'model', 'operation', 'requests', 'prompt_tokens', 'completion_tokens', 'cost')
+        return [dict(zip(columns, row)) for row in rows]
+
+
+usage_tracker = UsageTracker.from_env()
+atexit.register(usage_tracker.flush)
@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+import time
+import logging
+from typing import Any, Iterable, List
+
+from filelock import FileLock
+
+from metrics import tenant_tier, INGEST_STAGE_SECONDS, ERRORS
+import tracing
+from usage import usage_tracker, reported_usage, embedding_tokens
+
+logger = logging.getLogger(__name__)
+
+# How long a tenant writer waits for more batches before committing, and how
+# long an idle writer thread lives before it is torn down.
+COALESCE_WINDOW = float(os.getenv('VECTOR_WRITE_COALESCE_MS', '20')) / 1000.0
+MAX_DOCUMENTS_PER_COMMIT = int(os.getenv('VECTOR_WRITE_MAX_BATCH', '5000'))
+WRITER_IDLE_TIMEOUT = float(os.getenv('VECTOR_WRITER_IDLE_SECONDS', '30'))
+
+
+class TimedEmbeddings:
+    """
+    Wraps an embedding function and accumulates time and tokens spent embedding,
+    and the document vectors, which the document index is updated from. Tokens
+    are those the provider reports, counted with tiktoken if it reports none.
+    Implements the Embeddings interface by duck typing so that langchain is
+    only imported when a write is committed.
+    """
+
+    def __init__(self, embedding_function: Any):
+        self.embedding_function = embedding_function
+        self.elapsed = 0.0
+        self.tokens = 0
+        self.vectors = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        try:
+            with tracing.span('ingest.embed', texts=len(texts)), reported_usage() as usage:
+                vectors = self.embedding_function.embed_documents(texts)
+        finally:
+            self.elapsed += time.perf_counter() - started
+        self.tokens += embedding_tokens(texts, usage)
+        self.vectors.extend(vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        started = time.perf_counter()
+        try:
+            return self.embedding_function.embed_query(text)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+class WriteRequest:
+    """
+    A batch of documents waiting to be committed by a tenant writer. The
+    chunks of delete_document_ids are removed before the documents are added,
+    so a document can be replaced in one commit.
+    """
+
+    def __init__(self, documents: List[Any], delete_document_ids: Iterable[str] = ()):
+        self.documents = documents
+        self.delete_document_ids = set(delete_document_ids)
+        # Commits run on the writer thread; the submitter's span is linked instead
+        self.span_context = tracing.current_span_context()
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout: float = None) -> None:
+        if not self.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for vector store write")
+        if self.error is not None:
+            raise self.error
+
+
+class TenantWriter:
+    """
+    Single writer for one tenant's vector store.
+
+    Batches are queued by request handlers and committed by one background
+    thread. Whatever is queued when the thread wakes up is coalesced into a
+    single add + persist, so concurrent uploads share one sqlite transaction
+    and one HNSW update instead of fighting over the files.
+    """
+
+    def __init__(self, tenant_id: str, tenant_directory: str, embedding_function: Any):
+        self.tenant_id = tenant_id
+        self.tenant_directory = tenant_directory
+        self.embedding_function = embedding_function
+        self.queue = queue.Queue()
+        # Cross-process lock so that uvicorn workers sharing the data volume
+        # never write the same directory at the same time.
+        self.file_lock = FileLock(os.path.join(tenant_directory, '.write.lock'))
+        self.thread = threading.Thread(target=self._run, name=f"vector-writer-{tenant_id}", daemon=True)
+
+    def _collect_batch(self, first: WriteRequest) -> List[WriteRequest]:
+        batch = [first]
+        document_count = len(first.documents)
+        deadline = time.monotonic() + COALESCE_WINDOW
+        while document_count < MAX_DOCUMENTS_PER_COMMIT:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            document_count += len(request.documents)
+        return batch
+
+    def _commit(self, batch: List[WriteRequest]) -> None:
+        import vector_stores
+
+        documents = self._surviving_documents(batch)
+        delete_document_ids = set().union(*(request.delete_document_ids for request in batch))
+        embedding_function = TimedEmbeddings(self.embedding_function)
+        model = getattr(self.embedding_function, 'model', 'text-embedding-3-small')
+        try:
+            with tracing.span('ingest.persist', links=[request.span_context for request in batch],
+                              tenant_id=self.tenant_id, documents=len(documents), batches=len(batch)), \
+                    self.file_lock:
+                started = time.perf_counter()
+                vectordb = vector_stores.open_store(self.tenant_directory, embedding_function)
+                if delete_document_ids:
+                    vector_stores.delete_documents(vectordb, delete_document_ids)
+                if documents:
+                    vectordb.add_documents(documents)
+                vector_stores.persist(vectordb)
+                # Queries of a new tenant must be embedded like its first chunks
+                vector_stores.record_embedding(self.tenant_directory, model,
+                                               getattr(self.embedding_function, 'dimensions', None))
+                with tracing.span('ingest.document_index', tenant_id=self.tenant_id):
+                    vector_stores.update_document_index(self.tenant_directory, vectordb, documents,
+                                                        embedding_function.vectors, delete_document_ids)
+                if vector_stores.should_promote(vectordb):
+                    with tracing.span('vector_store.promote', tenant_id=self.tenant_id):
+                        vector_stores.promote(vectordb, embedding_function)
+                vector_stores.bump_generation(self.tenant_directory)
+                elapsed = time.perf_counter() - started
+            tier = tenant_tier(self.tenant_id)
+            INGEST_STAGE_SECONDS.labels(stage='embed', tier=tier).observe(embedding_function.elapsed)
+            INGEST_STAGE_SECONDS.labels(stage='persist', tier=tier).observe(elapsed - embedding_function.elapsed)
+            usage_tracker.record(self.tenant_id, model, 'embed', embedding_function.tokens)
+            logger.info(f"Committed {len(documents)} chunks from {len(batch)} batches for tenant {self.tenant_id}"
+                        + (f", replacing {len(delete_document_ids)} documents" if delete_document_ids else ""))
+        except Exception as e:
+            logger.error(f"Vector store write failed for tenant {self.tenant_id}: {str(e)}")
+            ERRORS.labels(operation='persist', tier=tenant_tier(self.tenant_id)).inc()
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    @staticmethod
+    def _surviving_documents(batch: List[WriteRequest]) -> List[Any]:
+        """
+        Documents of the batch in submission order, minus those replaced by a
+        later request of the same batch; deletes are applied before adds.
+        """
+        replaced_later = set()
+        surviving = []
+        for request in reversed(batch):
+            surviving.extend(document for document in reversed(request.documents)
+                             if document.metadata.get('document_id') not in replaced_later)
+            replaced_later |= request.delete_document_ids
+        surviving.reverse()
+        return surviving
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self.queue.get(timeout=WRITER_IDLE_TIMEOUT)
+            except queue.Empty:
+                # Retire only if nothing was queued while we decided to stop;
+                # submit() holds the same lock while it enqueues.
+                with VectorStoreWriter._lock:
+                    if self.queue.empty():
+                        VectorStoreWriter.writers.pop(self.tenant_id, None)
+                        return
+                continue
+            self._commit(self._collect_batch(first))
+
+
+class VectorStoreWriter:
+    """
+    Per-tenant single-writer discipline for the vector store.
+
+    Readers open the persisted store directly and never take these locks.
+    """
+    writers = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def submit(tenant_id: str, tenant_directory: str, documents: List[Any], embedding_function: Any,
+               delete_document_ids: Iterable[str] = ()) -> WriteRequest:
+        """
+        Queue documents for the tenant's writer without waiting for the commit.
+
+        Args:
+            tenant_id (str): Tenant identifier
+            tenant_directory (str): Persist directory of the tenant's vector store
+            documents (List[Any]): Chunked documents to add
+            embedding_function (Any): Embeddings used for the tenant's store
+            delete_document_ids (Iterable[str]): Documents whose chunks are removed first
+
+        Returns:
+            WriteRequest: Handle that can be waited on for the commit result
+        """
+        request = WriteRequest(documents, delete_document_ids)
+        if not documents and not request.delete_document_ids:
+            request.done.set()
+            return request
+
+        with VectorStoreWriter._lock:
+            writer = VectorStoreWriter.writers.get(tenant_id)
+            if writer is None:
+                writer = TenantWriter(tenant_id, tenant_directory, embedding_function)
+                VectorStoreWriter.writers[tenant_id] = writer
+                writer.thread.start()
+            writer.queue.put(request)
+        return request
+
+    @staticmethod
+    def add_documents(tenant_id: str, tenant_directory: str, documents: List[Any], embedding_function: Any,
+                      timeout: float = None, delete_document_ids: Iterable[str] = ()) -> None:
+        """Queue documents for the tenant's writer and block until they are committed."""
+        VectorStoreWriter.submit(tenant_id, tenant_directory, documents, embedding_function,
+                                 delete_document_ids).wait(timeout)
+
+    @staticmethod
+    def delete_documents(tenant_id: str, tenant_directory: str, document_ids: Iterable[str],
+                         embedding_function: Any, timeout: float = None) -> None:
+        """Remove every chunk of the given documents and block until committed."""
+        VectorStoreWriter.add_documents(tenant_id, tenant_directory, [], embedding_function, timeout,
+                                        delete_document_ids=document_ids)
@@ -0,0 +1,456 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import Chroma
+
+from flat_index import FlatIndex
+
+# Vector store backends behind DocumentService and the tenant writers.
+#   auto   - new tenants start on the flat index and are promoted to Chroma
+#            (HNSW) once they pass FLAT_INDEX_MAX_CHUNKS chunks (default)
+#   flat   - new tenants use the flat index and are never promoted
+#   chroma - new tenants use Chroma
+# A tenant that already has data keeps the backend its data is in. This
+# module imports langchain, so it is only loaded with the model stack.
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'auto')
+FLAT_INDEX_MAX_CHUNKS = int(os.getenv('FLAT_INDEX_MAX_CHUNKS', '20000'))
+# Storage type of new flat indexes (float32, float16 or int8) and how many
+# candidates per result a quantized index rescores at full precision
+FLAT_INDEX_DTYPE = os.getenv('FLAT_INDEX_DTYPE', 'float16')
+FLAT_INDEX_RESCORE_FACTOR = int(os.getenv('FLAT_INDEX_RESCORE_FACTOR', '4'))
+CHROMA_FILE = 'chroma.sqlite3'
+EMBEDDING_FILE = 'embedding.json'  # model and dimensions a tenant's vectors were embedded with
+# Replaced after every change to a tenant's store. Replicas share the data
+# volume, and Chroma keeps its HNSW index in memory, so a process holding a
+# store open reopens it when this file changed since.
+GENERATION_FILE = 'generation'
+PROMOTE_BATCH_SIZE = 1000
+
+# HNSW parameters of Chroma tenants. M and construction_ef are fixed when a
+# tenant's collection is created, from the profile HNSW_PROFILE names or, for
+# auto, the one matching the tenant's size then. search_ef is applied per
+# query, so it can be changed at any time. Collections that predate profiles
+# were built with Chroma's defaults.
+HNSW_PROFILES = {
+    'small': {'M': 8, 'construction_ef': 64, 'search_ef': 32},
+    'medium': {'M': 16, 'construction_ef': 128, 'search_ef': 64},
+    'large': {'M': 32, 'construction_ef': 200, 'search_ef': 128},
+}
+CHROMA_DEFAULT_PROFILE = {'profile': None, 'M': 16, 'construction_ef': 100, 'search_ef': 10}
+HNSW_PROFILE = os.getenv('HNSW_PROFILE', 'auto')
+HNSW_LARGE_CHUNKS = int(os.getenv('HNSW_LARGE_CHUNKS', '200000'))
+INDEX_PROFILE_FILE = 'index_profile.json'
+
+# Document index for two-stage retrieval: one centroid per document (the
+# mean of its unit chunk vectors), kept next to the chunk index by the
+# tenant's writer. Tenants with at least TWO_STAGE_MIN_DOCUMENTS documents
+# first pick the TWO_STAGE_DOCUMENTS nearest documents, then search only
+# their chunks.
+DOCUMENT_INDEX_DIRECTORY = 'document_index'
+TWO_STAGE_MIN_DOCUMENTS = int(os.getenv('TWO_STAGE_MIN_DOCUMENTS', '500'))
+TWO_STAGE_DOCUMENTS = int(os.getenv('TWO_STAGE_DOCUMENTS', '10'))
+
+logger = logging.getLogger(__name__)
+
+
+def _filter_document_ids(search_filter: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """The flat index only filters on document_id, which is all the service uses."""
+    if not search_filter:
+        return None
+    if set(search_filter) != {'document_id'}:
+        raise ValueError(f"Unsupported filter for the flat index: {search_filter}")
+    condition = search_filter['document_id']
+    if isinstance(condition, dict):
+        if set(condition) != {'$in'}:
+            raise ValueError(f"Unsupported filter for the flat index: {search_filter}")
+        return list(condition['$in'])
+    return [condition]
+
+
+class FlatVectorStore(VectorStore):
+    """LangChain vector store over a tenant's FlatIndex, searched exactly."""
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings):
+        self.persist_directory = persist_directory
+        self.index = FlatIndex(persist_directory, FLAT_INDEX_DTYPE)
+        self._embedding_function = embedding_function
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self._embedding_function.embed_documents(texts)
+        return self.index.append(vectors, texts, metadatas or [{} for _ in texts], ids)
+
+    def delete_documents(self, document_ids: Iterable[str]) -> int:
+        return self.index.delete_where(document_ids)
+
+    def similarity_search_by_vector_with_relevance_scores(
+            self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None,
+            **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Nearest chunks with their squared L2 distance, like Chroma's default space."""
+        hits = self.index.search(embedding, k, _filter_document_ids(filter), FLAT_INDEX_RESCORE_FACTOR)
+        return [(Document(page_content=text, metadata=metadata), distance) for _, text, metadata, distance in hits]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in
+                self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   persist_directory: str = './data/flat', **kwargs: Any) -> 'FlatVectorStore':
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def promoted(self) -> bool:
+        """Whether the tenant moved to another backend since this store was opened."""
+        return not FlatIndex.exists(self.persist_directory) and backend_of(self.persist_directory) is not None
+
+
+class ProfiledChroma(Chroma):
+    """
+    Chroma store searched with its tenant's search_ef. hnswlib searches with
+    max(ef, n_results) candidates, so asking Chroma for search_ef neighbours
+    widens the search; only the documents of the best k are then read.
+    """
+
+    def __init__(self, *args: Any, search_ef: int = CHROMA_DEFAULT_PROFILE['search_ef'], **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.search_ef = search_ef
+
+    def similarity_search_by_vector_with_relevance_scores(
+            self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None,
+            where_document: Optional[Dict[str, Any]] = None, search_ef: Optional[int] = None,
+            **kwargs: Any) -> List[Tuple[Document, float]]:
+        search_ef = search_ef or self.search_ef
+        if search_ef <= k:
+            return super().similarity_search_by_vector_with_relevance_scores(
+                embedding, k, filter=filter, where_document=where_document, **kwargs)
+        neighbours = self._collection.query(query_embeddings=[list(embedding)], n_results=search_ef, where=filter,
+                                            where_document=where_document, include=['distances'])
+        ids, distances = neighbours['ids'][0][:k], neighbours['distances'][0][:k]
+        if not ids:
+            return []
+        rows = self._collection.get(ids=ids, include=['documents', 'metadatas'])
+        found = {row_id: (text, metadata) for row_id, text, metadata
+                 in zip(rows['ids'], rows['documents'], rows['metadatas'])}
+        return [(Document(page_content=found[row_id][0], metadata=found[row_id][1] or {}), distance)
+                for row_id, distance in zip(ids, distances) if row_id in found]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in
+                self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self._embedding_function.embed_query(query), k, filter, **kwargs)
+
+
+def backend_of(directory: str) -> Optional[str]:
+    """Backend a tenant's existing data is in, or None for a tenant without data."""
+    if FlatIndex.exists(directory):
+        return 'flat'
+    if os.path.exists(os.path.join(directory, CHROMA_FILE)):
+        return 'chroma'
+    return None
+
+
+def embedding_dimensions(directory: str, default: Optional[int]) -> Optional[int]:
+    """
+    Dimensions a tenant's vectors are embedded with: the recorded ones, the
+    model's native size (None) for data that predates the record, or default
+    for a tenant without data.
+    """
+    try:
+        with open(os.path.join(directory, EMBEDDING_FILE), encoding='utf-8') as f:
+            return json.load(f).get('dimensions')
+    except FileNotFoundError:
+        return None if backend_of(directory) else default
+
+
+def generation(directory: str) -> Optional[Tuple[int, int]]:
+    """Version of a tenant's store on disk; None before its first commit."""
+    # The file is replaced on every change, so its inode changes
+    try:
+        stat = os.stat(os.path.join(directory, GENERATION_FILE))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def bump_generation(directory: str) -> None:
+    """Mark a tenant's store as changed, so processes holding it open reopen it."""
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(prefix=GENERATION_FILE, suffix='.tmp', dir=directory)
+    os.close(fd)
+    os.replace(temporary_path, os.path.join(directory, GENERATION_FILE))
+
+
+def record_embedding(directory: str, model: str, dimensions: Optional[int], overwrite: bool = False) -> None:
+    """Record the embedding a tenant's vectors use; kept once written unless overwrite is set."""
+    path = os.path.join(directory, EMBEDDING_FILE)
+    if os.path.exists(path) and not overwrite:
+        return
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump({'model': model, 'dimensions': dimensions}, f)
+    os.replace(temporary_path, path)
+
+
+def index_profile(directory: str) -> Dict[str, Any]:
+    """HNSW parameters of a Chroma tenant's collection."""
+    try:
+        with open(os.path.join(directory, INDEX_PROFILE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict(CHROMA_DEFAULT_PROFILE)
+
+
+def write_index_profile(directory: str, profile: Dict[str, Any]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, INDEX_PROFILE_FILE)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f)
+    os.replace(temporary_path, path)
+
+
+def profile_for(chunks: int) -> Dict[str, Any]:
+    """Profile for a collection created with this many chunks."""
+    name = HNSW_PROFILE
+    if name == 'auto':
+        if chunks >= HNSW_LARGE_CHUNKS:
+            name = 'large'
+        elif chunks > FLAT_INDEX_MAX_CHUNKS:
+            name = 'medium'
+        else:
+            name = 'small'
+    return {'profile': name, **HNSW_PROFILES[name]}
+
+
+def collection_metadata(profile: Dict[str, Any]) -> Dict[str, Any]:
+    # hnsw:search_ef stays at Chroma's default of 10; ProfiledChroma raises it per query
+    return {'hnsw:M': profile['M'], 'hnsw:construction_ef': profile['construction_ef']}
+
+
+def open_chroma(directory: str, embedding_function: Embeddings, chunks: int = 0) -> ProfiledChroma:
+    """
+    Open a tenant's Chroma store. A new collection is created with the
+    profile for the number of chunks about to be added.
+    """
+    if os.path.exists(os.path.join(directory, CHROMA_FILE)):
+        profile, metadata = index_profile(directory), None
+    else:
+        profile = profile_for(chunks)
+        metadata = collection_metadata(profile)
+        write_index_profile(directory, profile)
+    return ProfiledChroma(persist_directory=directory, embedding_function=embedding_function,
+                          collection_metadata=metadata, search_ef=profile['search_ef'])
+
+
+def set_search_ef(directory: str, search_ef: int) -> Dict[str, Any]:
+    """Change the search_ef a Chroma tenant is queried with."""
+    profile = dict(index_profile(directory), search_ef=search_ef)
+    write_index_profile(directory, profile)
+    bump_generation(directory)
+    return profile
+
+
+def open_store(directory: str, embedding_function: Embeddings) -> VectorStore:
+    """Open a tenant's vector store with the backend its data is in."""
+    backend = backend_of(directory) or ('chroma' if VECTOR_STORE_BACKEND == 'chroma' else 'flat')
+    if backend == 'flat':
+        return FlatVectorStore(directory, embedding_function)
+    return open_chroma(directory, embedding_function)
+
+
+def delete_documents(store: VectorStore, document_ids: Iterable[str]) -> None:
+    """Remove every chunk of the given documents."""
+    if isinstance(store, FlatVectorStore):
+        store.delete_documents(document_ids)
+    else:
+        store._collection.delete(where={'document_id': {'$in': sorted(document_ids)}})
+
+
+def persist(store: VectorStore) -> None:
+    # Flat index commits are durable once append/delete return
+    if isinstance(store, Chroma):
+        store.persist()
+
+
+def count(store: VectorStore) -> int:
+    if isinstance(store, FlatVectorStore):
+        return len(store.index)
+    return store._collection.count()
+
+
+def warm(store: VectorStore) -> None:
+    """
+    Load a store's index into memory without calling the embeddings
+    provider: fault in the flat matrix, or run one HNSW query with a stored
+    embedding.
+    """
+    if isinstance(store, FlatVectorStore):
+        store.index.warm()
+        return
+    collection = store._collection
+    sample = collection.get(limit=1, include=['embeddings'])
+    if sample['embeddings'] is not None and len(sample['embeddings']):
+        collection.query(query_embeddings=[list(sample['embeddings'][0])], n_results=1, include=['distances'])
+
+
+def should_promote(store: VectorStore) -> bool:
+    return VECTOR_STORE_BACKEND == 'auto' and isinstance(store, FlatVectorStore) \
+        and len(store.index) > FLAT_INDEX_MAX_CHUNKS
+
+
+def promote(store: FlatVectorStore, embedding_function: Embeddings) -> Chroma:
+    """
+    Move a tenant from the flat index to Chroma, reusing the stored vectors
+    so nothing is embedded again. Must run on the tenant's writer.
+    """
+    directory = store.persist_directory
+    chroma = open_chroma(directory, embedding_function, len(store.index))
+    batch = ([], [], [], [])
+    moved = 0
+    for row in store.index.rows():
+        for column, value in zip(batch, row):
+            column.append(value)
+        if len(batch[0]) >= PROMOTE_BATCH_SIZE:
+            moved += _add_rows(chroma, batch)
+            batch = ([], [], [], [])
+    moved += _add_rows(chroma, batch)
+    chroma.persist()
+    store.index.destroy()
+    logger.info(f"Promoted {moved} chunks in {directory} from the flat index to Chroma")
+    return chroma
+
+
+def _add_rows(chroma: Chroma, batch) -> int:
+    ids, vectors, texts, metadatas = batch
+    if ids:
+        chroma._collection.add(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+    return len(ids)
+
+
+def document_index(directory: str) -> FlatIndex:
+    return FlatIndex(os.path.join(directory, DOCUMENT_INDEX_DIRECTORY), FLAT_INDEX_DTYPE)
+
+
+def _chunk_vectors(store: VectorStore) -> Iterator[Tuple[List[Optional[str]], np.ndarray]]:
+    """Stored chunk vectors with their document ids, in batches."""
+    if isinstance(store, FlatVectorStore):
+        index = store.index
+        if not index.refresh():
+            return
+        for start in range(0, len(index.ids), PROMOTE_BATCH_SIZE):
+            stop = start + PROMOTE_BATCH_SIZE
+            yield [metadata.get('document_id') for metadata in index.metadatas[start:stop]], \
+                index.vectors_float32(start, stop)
+        return
+    collection = store._collection
+    for offset in range(0, collection.count(), PROMOTE_BATCH_SIZE):
+        rows = collection.get(include=['embeddings', 'metadatas'], limit=PROMOTE_BATCH_SIZE, offset=offset)
+        yield [(metadata or {}).get('document_id') for metadata in rows['metadatas']], \
+            np.asarray(rows['embeddings'], dtype=np.float32)
+
+
+def document_centroids(batches: Iterable[Tuple[List[Optional[str]], np.ndarray]]):
+    """
+    Centroid of each document's chunk vectors.
+
+    Returns:
+        tuple: Document ids, their centroids and chunk counts
+    """
+    sums, counts = {}, {}
+    for document_ids, vectors in batches:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        for document_id, vector in zip(document_ids, vectors / norms):
+            if document_id is None:
+                continue
+            if document_id in sums:
+                sums[document_id] += vector
+                counts[document_id] += 1
+            else:
+                sums[document_id] = vector.copy()
+                counts[document_id] = 1
+    document_ids = list(sums)
+    return document_ids, np.array([sums[document_id] for document_id in document_ids]), \
+        [counts[document_id] for document_id in document_ids]
+
+
+def _append_centroids(index: FlatIndex, document_ids: List[str], centroids: np.ndarray, counts: List[int]) -> None:
+    if document_ids:
+        index.append(centroids, [''] * len(document_ids),
+                     [{'document_id': document_id, 'chunks': chunks}
+                      for document_id, chunks in zip(document_ids, counts)], document_ids)
+
+
+def build_document_index(directory: str, store: VectorStore) -> int:
+    """
+    (Re)build a tenant's document index from its stored chunk vectors. The
+    new index is staged next to the old one and swapped in.
+
+    Returns:
+        int: Number of documents indexed
+    """
+    final_directory = os.path.join(directory, DOCUMENT_INDEX_DIRECTORY)
+    staging_directory, retired_directory = final_directory + '.new', final_directory + '.old'
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    document_ids, centroids, counts = document_centroids(_chunk_vectors(store))
+    _append_centroids(FlatIndex(staging_directory, FLAT_INDEX_DTYPE), document_ids, centroids, counts)
+    shutil.rmtree(retired_directory, ignore_errors=True)
+    if os.path.exists(final_directory):
+        os.rename(final_directory, retired_directory)
+    if os.path.exists(staging_directory):
+        os.rename(staging_directory, final_directory)
+    shutil.rmtree(retired_directory, ignore_errors=True)
+    return len(document_ids)
+
+
+def update_document_index(directory: str, store: VectorStore, documents: List[Document],
+                          vectors: List[List[float]], delete_document_ids: Iterable[str]) -> None:
+    """
+    Bring a tenant's document index up to date after a commit, from the
+    vectors just embedded for documents. A missing index is built from the
+    stored chunk vectors instead. Must run on the tenant's writer.
+    """
+    index = document_index(directory)
+    if not FlatIndex.exists(index.directory) or len(vectors) != len(documents):
+        build_document_index(directory, store)
+        return
+    added_ids = [document.metadata.get('document_id') for document in documents]
+    index.delete_where(set(delete_document_ids) | set(added_ids))
+    if documents:
+        _append_centroids(index, *document_centroids([(added_ids, np.asarray(vectors, dtype=np.float32))]))
@@ -0,0 +1,202 @@
+import os
+import time
+import atexit
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, List
+
+import startup
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLog:
+    """
+    Last time each tenant was served by this replica, persisted so that
+    warm-up after a restart knows which tenants are hot. Accesses are kept in
+    memory and flushed to sqlite periodically. The database is shared by all
+    replicas, so rows are keyed by replica and each one warms the tenants
+    nginx routes to it rather than the global top tenants.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tenant_access_by_replica (
+            replica TEXT NOT NULL,
+            tenant_id TEXT NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (replica, tenant_id)
+        );
+    """
+
+    def __init__(self, db_path: str, flush_interval: float, replica: str):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.replica = replica
+        self.lock = threading.Lock()
+        self.pending = {}  # tenant -> last access timestamp
+        self.thread = None
+        self.initialized = False
+
+    @classmethod
+    def from_env(cls) -> 'AccessLog':
+        return cls(
+            db_path=os.getenv('TENANT_ACCESS_DB_PATH', './data/tenant_access.db'),
+            flush_interval=float(os.getenv('TENANT_ACCESS_FLUSH_SECONDS', '30')),
+            # Must stay the same across restarts; compose sets each replica's hostname
+            replica=os.getenv('REPLICA_ID') or socket.gethostname(),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        if not self.initialized:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(self.SCHEMA)
+            self.initialized = True
+        return connection
+
+    def touch(self, tenant_id: str) -> None:
+        with self.lock:
+            self.pending[tenant_id] = time.time()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='access-log-flush', daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Tenant access log flush failed: {str(e)}")
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    """INSERT INTO tenant_access_by_replica (replica, tenant_id, last_access) VALUES (?, ?, ?)
+                       ON CONFLICT (replica, tenant_id) DO UPDATE SET
+                           last_access = MAX(last_access, excluded.last_access)""",
+                    [(self.replica, tenant_id, last_access) for tenant_id, last_access in pending.items()]
+                )
+        finally:
+            connection.close()
+
+    def most_recent(self, limit: int) -> List[str]:
+        """The limit tenants most recently served by this replica, newest first."""
+        self.flush()
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                """SELECT tenant_id FROM tenant_access_by_replica WHERE replica = ?
+                   ORDER BY last_access DESC LIMIT ?""", (self.replica, limit)
+            ).fetchall()
+        finally:
+            connection.close()
+        return [row[0] for row in rows]
+
+
+class WarmUp:
+    """
+    Loads the model stack and the hottest tenants before the worker reports
+    ready. If warm-up runs past its timeout the worker reports ready anyway
+    and keeps warming in the background, so a slow disk never keeps a
+    replica out of rotation for good.
+    """
+
+    def __init__(self, access_log: AccessLog, tenant_count: int, timeout: float, enabled: bool):
+        self.access_log = access_log
+        self.tenant_count = tenant_count
+        self.timeout = timeout
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.state = 'pending'
+        self.started = None
+        self.finished = None
+        self.model_stack_loaded = False
+        self.tenants = []
+        self.warmed = 0
+        self.failed = 0
+        self.current = None
+
+    @classmethod
+    def from_env(cls, access_log: AccessLog) -> 'WarmUp':
+        return cls(
+            access_log=access_log,
+            tenant_count=int(os.getenv('WARMUP_TENANTS', '20')),
+            timeout=float(os.getenv('WARMUP_TIMEOUT_SECONDS', '60')),
+            enabled=os.getenv('WARMUP_ENABLED', 'true').lower() == 'true',
+        )
+
+    def start(self, load_model_stack: Callable[[], None], warm_tenant: Callable[[str], bool]) -> None:
+        """Run warm-up on a background thread."""
+        self.started = time.monotonic()
+        if not self.enabled:
+            self._set_state('ready')
+            return
+        self._set_state('warming')
+        threading.Thread(target=self._run, args=(load_model_stack, warm_tenant),
+                         name='warm-up', daemon=True).start()
+
+    def _set_state(self, state: str) -> None:
+        with self.lock:
+            self.state = state
+            if state == 'ready':
+                self.finished = time.monotonic()
+        if state == 'ready':
+            startup.mark('ready')
+
+    def _run(self, load_model_stack: Callable[[], None], warm_tenant: Callable[[str], bool]) -> None:
+        try:
+            load_model_stack()
+            self.model_stack_loaded = True
+            self.tenants = self.access_log.most_recent(self.tenant_count) if self.tenant_count > 0 else []
+        except Exception as e:
+            logger.error(f"Warm-up failed: {str(e)}")
+            self._set_state('ready')
+            return
+
+        for tenant_id in self.tenants:
+            self.current = tenant_id
+            try:
+                if warm_tenant(tenant_id):
+                    self.warmed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Could not warm tenant {tenant_id}: {str(e)}")
+        self.current = None
+        logger.info(f"Warm-up finished: {self.warmed} tenants in {time.monotonic() - self.started:.1f}s")
+        self._set_state('ready')
+
+    def is_ready(self) -> bool:
+        if self.state == 'ready':
+            return True
+        if self.started is not None and time.monotonic() - self.started >= self.timeout:
+            logger.warning("Warm-up timed out, reporting ready while it continues")
+            self._set_state('ready')
+            return True
+        return False
+
+    def status(self) -> Dict[str, Any]:
+        ready = self.is_ready()
+        elapsed_until = self.finished if self.finished is not None else time.monotonic()
+        return {
+            'ready': ready,
+            'state': self.state,
+            'model_stack_loaded': self.model_stack_loaded,
+            'tenants_total': len(self.tenants),
+            'tenants_warmed': self.warmed,
+            'tenants_failed': self.failed,
+            'current_tenant': self.current,
+            'elapsed_seconds': round(elapsed_until - self.started, 2) if self.started is not None else 0.0,
+        }
+
+
+access_log = AccessLog.from_env()
+atexit.register(access_log.flush)
@@ -1,13 +1,18 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, send_file, flash
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, send_file, flash, g, Response
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import sqlite3
 import uuid
 import os
 import logging
+import time
+import re
+import secrets
 from functools import wraps
 from datetime import datetime
 
+from metrics import HTTP_REQUEST_SECONDS, ERRORS, CONTENT_TYPE as METRICS_CONTENT_TYPE, render as render_metrics
+
 app = Flask(__name__)
 app.secret_key = 'osho'
 
@@ -15,6 +20,11 @@ app.secret_key = 'osho'
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Base URL of the LLM service as seen by the browser. Through nginx by
+# default, so browser calls reach the tenant-affine upstream; set it to
+# http://localhost:8000 when running the services without nginx.
+LLM_PUBLIC_URL = os.getenv('LLM_PUBLIC_URL', '/api/llm').rstrip('/')
+
 data_dir = 'data'
 if not os.path.exists(data_dir):
     os.makedirs(data_dir)
@@ -504,11 +514,52 @@ def clear_session_safely():
     session.clear()
     logger.info("Session cleared due to error or logout")
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+@app.context_processor
+def inject_trace_id():
+    """
+    W3C trace id for the rendered page. Browser calls to the LLM service send
+    it as an X-Trace-Id header, so the spans of every request made from one
+    page view share a trace. The web app records no span, so only the trace
+    id is forwarded and each call is a root span in that trace. The trace id
+    of an incoming traceparent is continued.
+    """
+    if 'trace_id' not in g:
+        match = TRACEPARENT_PATTERN.match(request.headers.get('traceparent', ''))
+        g.trace_id = match.group(1) if match else secrets.token_hex(16)
+    return {'trace_id': g.trace_id}
+
+
+@app.context_processor
+def inject_llm_api():
+    """Base URL the page uses for LLM service calls"""
+    return {'llm_api': LLM_PUBLIC_URL}
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(method=request.method, endpoint=endpoint,
+                                    status=f"{response.status_code // 100}xx").observe(time.perf_counter() - started)
+        if response.status_code >= 500:
+            ERRORS.labels(endpoint=endpoint).inc()
+    return response
+
+
 @app.before_request
 def check_session_integrity():
     """Check session integrity before each request"""
     # Skip session check for static files and auth routes
-    if request.endpoint in ['static', 'login_form', 'login', 'register_form', 'register', 'seed', 'create_tables_route']:
+    if request.endpoint in ['static', 'login_form', 'login', 'register_form', 'register', 'seed', 'create_tables_route', 'health_check', 'metrics']:
         return
     
     # If user claims to be logged in but session is incomplete, clear it
@@ -951,6 +1002,12 @@ def health_check():
             'timestamp': str(datetime.utcnow())
         }), 503
 
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of the web app's metrics, summed over all workers"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
     
 if __name__ == '__main__':
     # Initialize database tables
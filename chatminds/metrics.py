@@ -0,0 +1,29 @@
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+
+# Metrics of the web app, kept with prometheus_client. Gunicorn runs several
+# worker processes, so when PROMETHEUS_MULTIPROC_DIR is set (start.sh sets it)
+# every worker writes its samples there and a scrape of any worker returns
+# the sum over all of them.
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, as in the LLM service
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Request latency of the web app, labelled by endpoint name rather than path
+HTTP_REQUEST_SECONDS = Histogram(
+    'chatminds_web_http_request_seconds', 'HTTP request latency by endpoint', ['method', 'endpoint', 'status'],
+    buckets=DEFAULT_BUCKETS)
+ERRORS = Counter(
+    'chatminds_web_errors_total', 'Requests that failed with a server error', ['endpoint'])
+
+
+def render() -> bytes:
+    """Prometheus text exposition, aggregated across workers in multiprocess mode"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
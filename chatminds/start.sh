@@ -45,6 +45,12 @@ else
     # Calculate workers based on CPU cores (2 * cores + 1)
     WORKERS=${GUNICORN_WORKERS:-$((2 * $(nproc) + 1))}
     echo "Starting with $WORKERS workers"
+
+    # Workers share their metrics through this directory so /metrics returns
+    # totals for the whole server; it is emptied so counters restart at zero
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
     
     exec gunicorn \
         --bind 0.0.0.0:5000 \
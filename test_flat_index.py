@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the flat vector index used for small tenants
+"""
+
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+# Add the chatminds-llm directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'chatminds-llm'))
+
+from flat_index import FlatIndex
+
+
+def build_index(directory, rows=200, dimensions=32):
+    vectors = np.random.default_rng(0).normal(size=(rows, dimensions)).astype(np.float32)
+    FlatIndex(directory).append(vectors, [f'chunk {row}' for row in range(rows)],
+                                [{'document_id': f'doc-{row % 10}', 'chunk_id': row} for row in range(rows)])
+    return vectors
+
+
+def test_exact_search_matches_brute_force():
+    """Search should find the same neighbours as a float32 brute force"""
+    print("Testing exact search...")
+
+    directory = tempfile.mkdtemp()
+    vectors = build_index(directory)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[7] + 0.1
+    expected = [int(row) for row in np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]]
+
+    hits = FlatIndex(directory).search(query, 5)
+    found = [int(text.split()[1]) for _, text, _, _ in hits]
+    # float16 storage may swap near ties, so compare the neighbour set
+    if found[0] != expected[0] or set(found) != set(expected):
+        print(f"✗ Expected rows {expected}, got {found}")
+        return False
+
+    print("✓ Neighbours match brute force")
+    return True
+
+
+def test_document_filter():
+    """A document_id filter should only return chunks of those documents"""
+    print("\nTesting document filter...")
+
+    directory = tempfile.mkdtemp()
+    vectors = build_index(directory)
+    hits = FlatIndex(directory).search(vectors[0], 10, document_ids=['doc-3', 'doc-4'])
+    documents = {metadata['document_id'] for _, _, metadata, _ in hits}
+    if len(hits) != 10 or not documents <= {'doc-3', 'doc-4'}:
+        print(f"✗ Unexpected hits: {len(hits)} from {documents}")
+        return False
+
+    print("✓ Filter applied")
+    return True
+
+
+def test_reader_sees_appends_and_deletes():
+    """An open reader should pick up the writer's commits"""
+    print("\nTesting reader refresh...")
+
+    directory = tempfile.mkdtemp()
+    vectors = build_index(directory)
+    reader = FlatIndex(directory)
+    if len(reader) != 200:
+        print(f"✗ Expected 200 rows, got {len(reader)}")
+        return False
+
+    writer = FlatIndex(directory)
+    writer.append(vectors[:5], ['extra'] * 5, [{'document_id': 'doc-new'}] * 5)
+    removed = writer.delete_where(['doc-0'])
+    if removed != 20 or len(reader) != 185:
+        print(f"✗ Removed {removed} rows, reader sees {len(reader)}")
+        return False
+    if any(metadata['document_id'] == 'doc-0' for _, _, metadata, _ in reader.search(vectors[0], 20)):
+        print("✗ Deleted document still returned")
+        return False
+
+    print("✓ Reader sees appends and deletes")
+    return True
+
+
+def test_quantized_index_rescores():
+    """An int8 index should rescore its top candidates and re-encode to fewer dimensions"""
+    print("\nTesting quantized storage...")
+
+    directory = tempfile.mkdtemp()
+    vectors = np.random.default_rng(1).normal(size=(500, 64)).astype(np.float32)
+    index = FlatIndex(directory, 'int8')
+    index.append(vectors, [f'chunk {row}' for row in range(500)], [{'document_id': 'doc'} for _ in range(500)])
+    stats = index.stats()
+    if stats['dtype'] != 'int8' or stats['scan_bytes'] != 500 * (64 + 4):
+        print(f"✗ Unexpected storage: {stats}")
+        return False
+
+    _, _, _, distance = index.search(vectors[3], 1)[0]
+    if abs(distance) > 1e-5:
+        print(f"✗ Rescored distance to itself should be 0, got {distance}")
+        return False
+
+    index.rebuild(index.vectors_float32()[:, :32], 'float16')
+    hits = index.search(vectors[3][:32], 1)
+    if index.stats()['dimensions'] != 32 or hits[0][1] != 'chunk 3':
+        print(f"✗ Rebuild failed: {index.stats()}, {hits[0][1]}")
+        return False
+
+    print("✓ Quantized search rescored and rebuilt")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds Flat Index Test Suite ===\n")
+
+    tests = [
+        test_exact_search_matches_brute_force,
+        test_document_filter,
+        test_reader_sees_appends_and_deletes,
+        test_quantized_index_rescores
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test script to verify main-content extraction of URL documents
+"""
+
+import sys
+import os
+
+# Add the chatminds-llm directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'chatminds-llm'))
+
+from html_extractor import extract_main_content, extract_text
+
+PAGE = """<html><head><title>Docs</title><style>body { color: red; }</style></head><body>
+<header><a href="/">Home</a> <a href="/docs">Docs</a> <a href="/blog">Blog</a></header>
+<nav class="sidebar"><ul><li><a href="/a">Getting started</a></li><li><a href="/b">API</a></li></ul></nav>
+<div class="content">
+  <h1>Install &amp; setup</h1>
+  <p>This guide explains how to install the service on a fresh machine with Docker.</p>
+  <h2>Requirements</h2>
+  <ul><li>Docker 24 or later is required to build the images.</li></ul>
+  <p>See <a href="/reference">the reference</a> for every option you can set in the environment.</p>
+  <div id="cookie-banner">We use cookies to improve your experience, please accept them to continue.</div>
+</div>
+<footer>Copyright 2024 Example Inc. All rights reserved. Privacy policy and terms of use.</footer>
+<script>var markup = "<p>not text</p>";</script>
+</body></html>"""
+
+
+def test_boilerplate_removed():
+    """Navigation, footer, cookie banner and scripts should not be extracted"""
+    print("Testing boilerplate removal...")
+
+    text = extract_main_content(PAGE)
+    leaked = [marker for marker in ('Home', 'Getting started', 'cookies', 'Copyright', 'not text', 'color')
+              if marker in text]
+    if leaked:
+        print(f"✗ Boilerplate leaked into the content: {leaked}")
+        return False
+
+    print("✓ Boilerplate removed")
+    return True
+
+
+def test_headings_kept_as_structure():
+    """Headings and list items should come out as markdown"""
+    print("\nTesting heading structure...")
+
+    text = extract_main_content(PAGE)
+    expected = ['# Install & setup', '## Requirements', '- Docker 24 or later is required to build the images.',
+                'See the reference for every option you can set in the environment.']
+    missing = [line for line in expected if line not in text.split('\n\n')]
+    if missing:
+        print(f"✗ Missing blocks: {missing}")
+        return False
+
+    print("✓ Headings and lists kept")
+    return True
+
+
+def test_text_backend_keeps_everything_visible():
+    """The plain text backend should keep every visible block but no scripts"""
+    print("\nTesting plain text backend...")
+
+    text = extract_text(PAGE)
+    if 'Copyright' not in text or 'Home' not in text or 'not text' in text:
+        print(f"✗ Unexpected text: {text!r}")
+        return False
+
+    print("✓ Visible text extracted")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds HTML Extraction Test Suite ===\n")
+
+    tests = [
+        test_boilerplate_removed,
+        test_headings_kept_as_structure,
+        test_text_backend_keeps_everything_visible
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
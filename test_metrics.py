@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the LLM service metrics: exposition, label validation
+and the admission gauges
+"""
+
+import sys
+import os
+import asyncio
+
+# Add the chatminds-llm directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'chatminds-llm'))
+
+from prometheus_client import REGISTRY
+
+from metrics import render, CACHE_REQUESTS, CONTEXT_COMPRESSION_SECONDS
+from admission import AdmissionController
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_histogram_is_rendered():
+    """Observations should show up as cumulative buckets in the exposition"""
+    print("Testing histogram rendering...")
+
+    for value in (0.003, 0.3, 90.0):
+        CONTEXT_COMPRESSION_SECONDS.labels(tier='test').observe(value)
+
+    lines = render().decode().splitlines()
+    expected = [
+        'chatminds_context_compression_seconds_bucket{le="0.005",tier="test"} 1.0',
+        'chatminds_context_compression_seconds_bucket{le="0.5",tier="test"} 2.0',
+        'chatminds_context_compression_seconds_bucket{le="+Inf",tier="test"} 3.0',
+        'chatminds_context_compression_seconds_count{tier="test"} 3.0',
+    ]
+    missing = [line for line in expected if line not in lines]
+    if missing:
+        print(f"✗ Missing lines: {missing}")
+        return False
+
+    print("✓ Histogram buckets are cumulative")
+    return True
+
+
+def test_labels_are_validated():
+    """Metrics should reject label sets that differ from their declaration"""
+    print("\nTesting label validation...")
+
+    try:
+        CACHE_REQUESTS.labels(cache='answer', result='hit', tenant_id='abc')
+    except ValueError:
+        print("✓ Unexpected label rejected")
+        return True
+
+    print("✗ Counter accepted an undeclared label")
+    return False
+
+
+def test_admission_gauges():
+    """Queue depth and active slots should follow the admission controller"""
+    print("\nTesting admission gauges...")
+
+    async def scenario():
+        active = sample('chatminds_admission_active')
+        queued = sample('chatminds_admission_queue_depth', priority='chat')
+        controller = AdmissionController(max_concurrent=1, max_per_tenant=1, max_queue=4,
+                                         max_queue_per_tenant=4, queue_timeout=1.0)
+        holder = await controller.acquire('tenant-a')
+        waiting = asyncio.ensure_future(controller.acquire('tenant-b'))
+        await asyncio.sleep(0)
+        if (sample('chatminds_admission_active') - active != 1
+                or sample('chatminds_admission_queue_depth', priority='chat') - queued != 1):
+            print("✗ Gauges missed the granted or the queued request")
+            return False
+
+        holder.release()
+        second = await asyncio.wait_for(waiting, 0.5)
+        if (sample('chatminds_admission_active') - active != 1
+                or sample('chatminds_admission_queue_depth', priority='chat') != queued):
+            print("✗ Gauges did not follow the hand-off to the queued request")
+            return False
+
+        second.release()
+        second.release()
+        if sample('chatminds_admission_active') != active:
+            print("✗ Active gauge was not restored after release")
+            return False
+        print("✓ Gauges follow queueing, hand-off and release")
+        return True
+
+    return asyncio.run(scenario())
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds Metrics Test Suite ===\n")
+
+    tests = [
+        test_histogram_is_rendered,
+        test_labels_are_validated,
+        test_admission_gauges
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Test script to verify single-flight coalescing of identical in-flight requests
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Add the chatminds-llm directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'chatminds-llm'))
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    """Concurrent calls with the same key should run the computation once"""
+    print("Testing coalescing of identical calls...")
+
+    single_flight = SingleFlight()
+    runs = []
+    results = []
+
+    def compute():
+        runs.append(1)
+        time.sleep(0.1)
+        return {'result': 'answer'}
+
+    def call():
+        results.append(single_flight.do(('tenant', 'question', None), compute))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = single_flight.get_stats()
+    if len(runs) != 1 or len(results) != 5:
+        print(f"✗ Expected 1 computation and 5 results, got {len(runs)} and {len(results)}")
+        return False
+    if stats['calls_coalesced'] != 4 or stats['in_flight'] != 0:
+        print(f"✗ Unexpected counters: {stats}")
+        return False
+
+    print(f"✓ One computation served 5 callers: {stats}")
+    return True
+
+
+def test_stream_fan_out_replays_to_late_subscribers():
+    """Subscribers that attach mid-stream should still get every chunk"""
+    print("\nTesting stream fan-out...")
+
+    single_flight = SingleFlight()
+
+    def produce(cancelled):
+        for i in range(5):
+            time.sleep(0.02)
+            yield i
+
+    received = []
+
+    def subscribe():
+        received.append(list(single_flight.stream('key', produce)))
+
+    threads = []
+    for _ in range(3):
+        thread = threading.Thread(target=subscribe)
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.03)
+    for thread in threads:
+        thread.join()
+
+    if received != [[0, 1, 2, 3, 4]] * 3:
+        print(f"✗ Subscribers received different streams: {received}")
+        return False
+
+    stats = single_flight.get_stats()
+    if stats['streams'] != 1 or stats['streams_coalesced'] != 2:
+        print(f"✗ Unexpected counters: {stats}")
+        return False
+
+    print(f"✓ One producer fanned out to 3 subscribers: {stats}")
+    return True
+
+
+def test_errors_reach_every_caller():
+    """A failing computation should raise for the leader and all followers"""
+    print("\nTesting error propagation...")
+
+    single_flight = SingleFlight()
+    errors = []
+
+    def compute():
+        time.sleep(0.05)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            single_flight.do('key', compute)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors != ['boom'] * 3:
+        print(f"✗ Expected every caller to see the error, got {errors}")
+        return False
+
+    print("✓ Error propagated to every caller")
+    return True
+
+
+def test_stream_cancelled_when_every_subscriber_leaves():
+    """The producer should be told to stop only once the last subscriber is gone"""
+    print("\nTesting stream cancellation...")
+
+    single_flight = SingleFlight()
+    produced = []
+
+    def produce(cancelled):
+        for i in range(100):
+            if cancelled.is_set():
+                return
+            produced.append(i)
+            time.sleep(0.01)
+            yield i
+
+    first = single_flight.stream('key', produce)
+    second = single_flight.stream('key', produce)
+    next(first), next(second)
+    first.close()
+    time.sleep(0.1)
+    if len(produced) < 5:
+        print(f"✗ Producer stopped while a subscriber was still reading: {len(produced)} chunks")
+        return False
+
+    second.close()
+    time.sleep(0.05)
+    stopped_at = len(produced)
+    time.sleep(0.05)
+    if len(produced) != stopped_at or stopped_at >= 100:
+        print(f"✗ Producer kept running after every subscriber left: {len(produced)} chunks")
+        return False
+
+    # A new subscriber starts a fresh flight instead of joining the cancelled one
+    if list(single_flight.stream('key', produce))[-1] != 99:
+        print("✗ New subscriber joined the cancelled stream")
+        return False
+
+    print(f"✓ Producer stopped after {stopped_at} chunks once every subscriber left")
+    return True
+
+
+def test_closing_a_subscription_cancels_at_once():
+    """close() should release a subscriber that never read, or one blocked waiting, without a next chunk"""
+    print("\nTesting subscription release...")
+
+    single_flight = SingleFlight()
+    flags = []
+
+    def produce(cancelled):
+        flags.append(cancelled)
+        yield 'first'
+        # A slow step such as retrieval: nothing is published until it ends
+        cancelled.wait(5)
+
+    unread = single_flight.stream('unread', produce)
+    unread.close()
+    if not flags[0].wait(1):
+        print("✗ A subscription that was never read did not cancel the flight")
+        return False
+
+    blocked = single_flight.stream('blocked', produce)
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(blocked))
+    reader.start()
+    time.sleep(0.05)
+    started = time.perf_counter()
+    blocked.close()
+    reader.join(1)
+    if reader.is_alive() or not flags[1].is_set() or received != ['first']:
+        print(f"✗ Blocked reader not released: alive={reader.is_alive()}, received={received}")
+        return False
+
+    print(f"✓ Released and cancelled in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds Request Coalescing Test Suite ===\n")
+
+    tests = [
+        test_concurrent_calls_share_one_computation,
+        test_stream_fan_out_replays_to_late_subscribers,
+        test_errors_reach_every_caller,
+        test_stream_cancelled_when_every_subscriber_leaves,
+        test_closing_a_subscription_cancels_at_once
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script to verify SSE framing and token coalescing of the answer stream
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+
+# Add the chatminds-llm directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'chatminds-llm'))
+
+from sse import stream_token_events
+
+
+def fake_chunks(count, delay):
+    for i in range(count):
+        time.sleep(delay)
+        yield {'token': f"t{i} ", 'is_last': False, 'complete_response': None}
+    yield {'token': 'end', 'is_last': True, 'complete_response': {'result': 'done'}}
+
+
+def collect(chunks, **kwargs):
+    async def run():
+        frames = []
+        async for frame in stream_token_events(chunks, lambda c: {'answer': c['complete_response']}, **kwargs):
+            frames.append(frame)
+        return frames
+    return asyncio.run(run())
+
+
+def parse(frame):
+    fields = {}
+    for line in frame.decode().strip().split('\n'):
+        name, _, value = line.partition(': ')
+        fields[name] = value
+    return fields
+
+
+def test_frames_are_event_stream_with_ids():
+    """Every token frame should carry an increasing id and a JSON data line"""
+    print("Testing event-stream framing...")
+
+    frames = collect(fake_chunks(5, 0), flush_interval=0.01, heartbeat_interval=5)
+    token_frames = [parse(f) for f in frames if f.startswith(b'id: ')]
+
+    ids = [int(f['id']) for f in token_frames]
+    if ids != list(range(1, len(ids) + 1)):
+        print(f"✗ Event ids are not sequential: {ids}")
+        return False
+
+    final = json.loads(token_frames[-1]['data'])
+    if not final['complete'] or final['answer'] != {'result': 'done'}:
+        print(f"✗ Final frame missing complete answer: {final}")
+        return False
+
+    content = ''.join(json.loads(f['data'])['content'] for f in token_frames)
+    if content != 't0 t1 t2 t3 t4 end':
+        print(f"✗ Tokens lost or reordered: {content!r}")
+        return False
+
+    print(f"✓ {len(token_frames)} frames with sequential ids and full content")
+    return True
+
+
+def test_tokens_are_coalesced():
+    """Fast token streams should be sent as far fewer frames than tokens"""
+    print("\nTesting token coalescing...")
+
+    frames = collect(fake_chunks(50, 0.001), flush_interval=0.02, heartbeat_interval=5)
+    token_frames = [f for f in frames if f.startswith(b'id: ')]
+
+    if len(token_frames) >= 50:
+        print(f"✗ Expected coalescing, got {len(token_frames)} frames for 50 tokens")
+        return False
+
+    print(f"✓ 50 tokens sent in {len(token_frames)} frames")
+    return True
+
+
+def test_heartbeat_while_waiting():
+    """A slow model should produce keep-alive comments instead of silence"""
+    print("\nTesting heartbeats...")
+
+    frames = collect(fake_chunks(1, 0.2), flush_interval=0.01, heartbeat_interval=0.05)
+    heartbeats = [f for f in frames if f.startswith(b':')]
+
+    if not heartbeats:
+        print("✗ No heartbeat sent while waiting for the first token")
+        return False
+
+    print(f"✓ {len(heartbeats)} heartbeats sent while waiting")
+    return True
+
+
+def test_sources_event_comes_first():
+    """Sources should be sent as their own event before any token"""
+    print("\nTesting sources event...")
+
+    def chunks():
+        yield {'token': '', 'is_last': False, 'complete_response': None,
+               'sources': [{'document_id': 'doc-1', 'name': 'a.pdf', 'snippet': 'Refunds take five days.'}]}
+        yield from fake_chunks(3, 0)
+
+    frames = [parse(f) for f in collect(chunks(), flush_interval=0.01, heartbeat_interval=5) if f.startswith(b'id: ')]
+    first = json.loads(frames[0]['data'])
+    if frames[0].get('event') != 'sources' or first['sources'][0]['document_id'] != 'doc-1':
+        print(f"✗ First frame is not the sources event: {frames[0]}")
+        return False
+    if any(frame.get('event') != 'token' for frame in frames[1:]):
+        print("✗ Token frames should follow as token events")
+        return False
+
+    print("✓ Sources sent before the tokens")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds SSE Streaming Test Suite ===\n")
+
+    tests = [
+        test_frames_are_event_stream_with_ids,
+        test_tokens_are_coalesced,
+        test_heartbeat_while_waiting,
+        test_sources_event_comes_first
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the LLM service modules import without the model stack
+"""
+
+import sys
+import os
+import subprocess
+
+LLM_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatminds-llm')
+
+# Imported by main at startup, in import order
+STARTUP_MODULES = ['metrics', 'tracing', 'usage', 'document_processor', 'single_flight', 'sse',
+                   'document_service', 'main']
+# Loaded on first use by document_service.load_model_stack()
+MODEL_STACK = ['langchain', 'langchain_community', 'langchain_openai', 'chromadb', 'openai', 'bs4']
+
+CHECK = """
+import sys
+import {module}
+print(','.join(name for name in {model_stack!r} if name in sys.modules))
+"""
+
+
+def import_module(module):
+    """Import module in a fresh interpreter; returns (returncode, stdout, stderr)"""
+    result = subprocess.run([sys.executable, '-c', CHECK.format(module=module, model_stack=MODEL_STACK)],
+                            cwd=LLM_DIRECTORY, capture_output=True, text=True)
+    return result.returncode, result.stdout.strip(), result.stderr.strip()
+
+
+def missing_dependency(stderr):
+    """Name of a third-party package missing from this environment, if that is why the import failed"""
+    last = stderr.splitlines()[-1] if stderr else ''
+    if not last.startswith('ModuleNotFoundError'):
+        return None
+    name = last.split("'")[1].split('.')[0]
+    return None if os.path.exists(os.path.join(LLM_DIRECTORY, name + '.py')) else name
+
+
+def test_startup_modules_import_without_model_stack():
+    """Every startup module should import cleanly and leave the model stack unloaded"""
+    print("Testing startup imports...")
+
+    ok = True
+    for module in STARTUP_MODULES:
+        returncode, loaded, stderr = import_module(module)
+        if returncode != 0:
+            dependency = missing_dependency(stderr)
+            if dependency:
+                print(f"- {module}: skipped, {dependency} is not installed")
+                continue
+            print(f"✗ {module} failed to import: {stderr.splitlines()[-1] if stderr else returncode}")
+            ok = False
+        elif loaded:
+            print(f"✗ {module} loaded the model stack at import: {loaded}")
+            ok = False
+        else:
+            print(f"✓ {module}")
+    return ok
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds Startup Import Test Suite ===\n")
+
+    tests = [
+        test_startup_modules_import_without_model_stack
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
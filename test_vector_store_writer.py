@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the per-tenant vector store writer: batch coalescing,
+commit order under the file lock, and error propagation to waiting callers
+"""
+
+import sys
+import os
+import types
+import tempfile
+import threading
+
+# Add the chatminds-llm directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'chatminds-llm'))
+os.environ.setdefault('USAGE_DB_PATH', os.path.join(tempfile.mkdtemp(), 'usage.db'))
+
+from vector_store_writer import VectorStoreWriter, TenantWriter, WriteRequest
+
+
+class FakeDocument:
+    def __init__(self, page_content, document_id):
+        self.page_content = page_content
+        self.metadata = {'document_id': document_id}
+
+
+class FakeEmbeddings:
+    model = 'text-embedding-3-small'
+    dimensions = 3
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+
+class FakeStore:
+    """Records what the writer does to the store, and whether it held the file lock"""
+
+    def __init__(self, backend, embedding_function):
+        self.backend = backend
+        self.embedding_function = embedding_function
+
+    def add_documents(self, documents):
+        self.backend.call('add', [document.page_content for document in documents])
+        if self.backend.fail_add:
+            raise RuntimeError('disk full')
+        self.embedding_function.embed_documents([document.page_content for document in documents])
+
+
+class FakeBackend:
+    """
+    Stands in for the vector_stores module, which the writer imports when a
+    batch is committed, so commits can be observed without Chroma.
+    """
+
+    def __init__(self, promote=False, fail_add=False):
+        self.calls = []
+        self.writer = None
+        self.promote_store = promote
+        self.fail_add = fail_add
+        self.opened = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def call(self, name, *args):
+        locked = self.writer is not None and self.writer.file_lock.is_locked
+        self.calls.append((name, args, locked))
+
+    def module(self):
+        backend = self
+        module = types.ModuleType('vector_stores')
+
+        def open_store(directory, embedding_function):
+            backend.opened.set()
+            backend.release.wait(5)
+            backend.call('open_store')
+            return FakeStore(backend, embedding_function)
+
+        module.open_store = open_store
+        module.delete_documents = lambda store, document_ids: backend.call('delete', sorted(document_ids))
+        module.persist = lambda store: backend.call('persist')
+        module.record_embedding = lambda directory, model, dimensions: backend.call('record_embedding', model)
+        module.update_document_index = (
+            lambda directory, store, documents, vectors, delete_document_ids:
+            backend.call('document_index', len(documents), len(vectors), sorted(delete_document_ids)))
+        module.should_promote = lambda store: backend.promote_store
+        module.promote = lambda store, embedding_function: backend.call('promote')
+        module.bump_generation = lambda directory: backend.call('bump_generation')
+        return module
+
+    def names(self):
+        return [name for name, _, _ in self.calls]
+
+
+def install(backend, tenant_id):
+    """Route commits to backend and remember the writer of tenant_id; returns (directory, restore)"""
+    sys.modules['vector_stores'] = backend.module()
+    directory = tempfile.mkdtemp()
+    original = TenantWriter.__init__
+
+    def init(writer, *args, **kwargs):
+        original(writer, *args, **kwargs)
+        if writer.tenant_id == tenant_id:
+            backend.writer = writer
+
+    TenantWriter.__init__ = init
+    return directory, lambda: setattr(TenantWriter, '__init__', original)
+
+
+def test_concurrent_batches_coalesce_into_one_commit():
+    """Batches queued while the writer is busy should be committed together"""
+    print("Testing batch coalescing...")
+
+    backend = FakeBackend()
+    directory, restore = install(backend, 'tenant-coalesce')
+    try:
+        # Hold the first commit until every batch is queued behind it
+        backend.release.clear()
+        first = VectorStoreWriter.submit('tenant-coalesce', directory, [FakeDocument('a', 'doc-a')],
+                                         FakeEmbeddings())
+        backend.opened.wait(5)
+        requests = [VectorStoreWriter.submit('tenant-coalesce', directory,
+                                             [FakeDocument(f'{name}-{i}', f'doc-{name}') for i in range(2)],
+                                             FakeEmbeddings())
+                    for name in ('b', 'c', 'd')]
+        backend.release.set()
+        for request in [first] + requests:
+            request.wait(5)
+
+        adds = [args[0] for name, args, _ in backend.calls if name == 'add']
+        if backend.names().count('persist') != 2 or len(adds) != 2:
+            print(f"✗ Expected the first batch and one coalesced commit, got {backend.names()}")
+            return False
+        if adds[1] != ['b-0', 'b-1', 'c-0', 'c-1', 'd-0', 'd-1']:
+            print(f"✗ Coalesced commit lost or reordered documents: {adds[1]}")
+            return False
+        print(f"✓ 4 batches committed in {len(adds)} writes")
+        return True
+    finally:
+        restore()
+
+
+def test_replaced_documents_are_dropped_from_batch():
+    """A document replaced by a later request of the same batch should not be added"""
+    print("Testing replacement within a batch...")
+
+    old = WriteRequest([FakeDocument('old', 'doc-1'), FakeDocument('other', 'doc-2')])
+    new = WriteRequest([FakeDocument('new', 'doc-1')], delete_document_ids=['doc-1'])
+    surviving = [document.page_content for document in TenantWriter._surviving_documents([old, new])]
+    if surviving != ['other', 'new']:
+        print(f"✗ Expected ['other', 'new'], got {surviving}")
+        return False
+    print("✓ Only the latest version of a replaced document is added")
+    return True
+
+
+def test_commit_sequence_under_file_lock():
+    """A commit should delete, add, persist, index, promote and mark the change, all under the file lock"""
+    print("Testing commit sequence...")
+
+    backend = FakeBackend(promote=True)
+    directory, restore = install(backend, 'tenant-sequence')
+    try:
+        VectorStoreWriter.add_documents('tenant-sequence', directory, [FakeDocument('new', 'doc-1')],
+                                        FakeEmbeddings(), timeout=5, delete_document_ids=['doc-1'])
+
+        expected = ['open_store', 'delete', 'add', 'persist', 'record_embedding', 'document_index', 'promote',
+                    'bump_generation']
+        if backend.names() != expected:
+            print(f"✗ Expected {expected}, got {backend.names()}")
+            return False
+        unlocked = [name for name, _, locked in backend.calls if not locked]
+        if unlocked:
+            print(f"✗ Ran without the file lock: {unlocked}")
+            return False
+        if backend.writer.file_lock.is_locked:
+            print("✗ File lock still held after the commit")
+            return False
+        index_call = backend.calls[expected.index('document_index')][1]
+        if index_call != (1, 1, ['doc-1']):
+            print(f"✗ Document index got (documents, vectors, deletes) = {index_call}")
+            return False
+        print(f"✓ Committed in order under the lock: {' → '.join(backend.names())}")
+        return True
+    finally:
+        restore()
+
+
+def test_errors_reach_every_waiting_caller():
+    """A failed commit should raise in every caller of the batch and keep the writer alive"""
+    print("Testing error propagation...")
+
+    backend = FakeBackend(fail_add=True)
+    directory, restore = install(backend, 'tenant-error')
+    try:
+        backend.release.clear()
+        requests = [VectorStoreWriter.submit('tenant-error', directory, [FakeDocument(name, f'doc-{name}')],
+                                             FakeEmbeddings())
+                    for name in ('a', 'b', 'c')]
+        backend.release.set()
+
+        errors = []
+        for request in requests:
+            try:
+                request.wait(5)
+            except RuntimeError as e:
+                errors.append(str(e))
+        if errors != ['disk full'] * 3:
+            print(f"✗ Expected every caller to see the failure, got {errors}")
+            return False
+        if 'persist' in backend.names():
+            print("✗ Store was persisted after a failed add")
+            return False
+        if backend.writer.file_lock.is_locked:
+            print("✗ File lock still held after a failed commit")
+            return False
+
+        backend.fail_add = False
+        VectorStoreWriter.add_documents('tenant-error', directory, [FakeDocument('d', 'doc-d')],
+                                        FakeEmbeddings(), timeout=5)
+        if backend.names()[-1] != 'bump_generation':
+            print(f"✗ Writer did not recover after the failure: {backend.names()}")
+            return False
+        print("✓ Every waiting caller got the error and the next write succeeded")
+        return True
+    finally:
+        restore()
+
+
+def test_empty_write_completes_immediately():
+    """Nothing to add or delete should not start a writer"""
+    print("Testing empty write...")
+
+    request = VectorStoreWriter.submit('tenant-empty', tempfile.mkdtemp(), [], FakeEmbeddings())
+    request.wait(0)
+    if 'tenant-empty' in VectorStoreWriter.writers:
+        print("✗ A writer was started for an empty write")
+        return False
+    print("✓ Empty write completes without a writer")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=== ChatMinds Vector Store Writer Test Suite ===\n")
+
+    tests = [
+        test_concurrent_batches_coalesce_into_one_commit,
+        test_replaced_documents_are_dropped_from_batch,
+        test_commit_sequence_under_file_lock,
+        test_errors_reach_every_waiting_caller,
+        test_empty_write_completes_immediately
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print("-" * 50)
+
+    print(f"\n=== Test Results: {passed}/{total} tests passed ===")
+    return passed == total
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)